@@ -5,29 +5,103 @@ Minimal FastAPI server exposing referral APIs for website integration.
 Endpoints:
 - GET /api/health
 - GET /api/referral/progress?user_id=123  (or ?referral_code=ref_xxx)
+  Responses carry an ETag; send it back in If-None-Match to get a 304.
+- POST /api/referral/progress:batch  {"user_ids": [...], "referral_codes": [...]}
+  Up to 500 users/codes answered with one storage query.
+- GET /api/referral/progress/stream?user_id=123  (or ?referral_code=ref_xxx)
+  Server-sent events: the current progress, then every change.
+
+Progress responses are cached for PROGRESS_CACHE_TTL seconds (default 5;
+0 disables), so dashboards polling the same users share one lookup.
+Streams check all subscribed users for changes every
+PROGRESS_STREAM_POLL_INTERVAL seconds (default 5) in one batch.
 
 Run locally:
   uvicorn api_server:app --host 0.0.0.0 --port 8080 --reload
 """
 
+import asyncio
+import hashlib
+import json
 import os
 import logging
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
-from telegramreferralpro.database import Database
+from telegramreferralpro.async_database import AsyncDatabase
+from telegramreferralpro.cache import BoundedCache, CacheSettings
+from telegramreferralpro.progress_events import ProgressEventBus
+from telegramreferralpro.storage import create_storage
+from telegramreferralpro.referral_codes import ReferralCodec
 from telegramreferralpro.referral_system import ReferralSystem
 
 
 logger = logging.getLogger(__name__)
 
+# Most user IDs plus referral codes accepted by one batch request
+MAX_BATCH_SIZE = 500
+
+# Seconds of silence after which a stream sends a comment to keep proxies from closing it
+STREAM_HEARTBEAT_SECONDS = 15
+
+# Same secret as the bot, so signed codes resolve without a database lookup
+referral_code_secret = os.getenv("REFERRAL_CODE_SECRET")
+codec = ReferralCodec(referral_code_secret.encode()) if referral_code_secret else None
+
 # Instantiate shared services once
-database = Database()
-referral_system = ReferralSystem(database)
+database = create_storage(
+    os.getenv("STORAGE_BACKEND", "supabase").lower(),
+    database_path=os.getenv("DATABASE_PATH", "bot_database.db"),
+    referral_codec=codec,
+    # The bot records referrals in another process; counts cached here would hide them
+    referral_count_ttl=0,
+)
+# Blocking storage calls run on worker threads so requests overlap
+async_database = AsyncDatabase(database, max_workers=int(os.getenv("DB_MAX_WORKERS", "8")))
+# Referral events happen in the bot process, so this one must not reuse progress snapshots
+referral_system = ReferralSystem(database, progress_ttl=0, codec=codec)
+
+# user_id -> (payload, body, etag); the TTL bounds how stale a polled response can be
+progress_cache_ttl = float(os.getenv("PROGRESS_CACHE_TTL", "5"))
+progress_responses = BoundedCache(
+    "progress_responses",
+    CacheSettings(max_entries=database.cache_settings.max_entries, ttl=progress_cache_ttl)
+) if progress_cache_ttl > 0 else None
+# Concurrent misses for the same user wait on one lookup
+_progress_lookups: Dict[int, asyncio.Future] = {}
+
+
+async def _load_progress_many(user_ids: List[int]) -> dict:
+    """Fresh snapshots for the stream bus; also refreshes the response cache"""
+    snapshots, _ = await async_database.run(referral_system.get_progress_many, user_ids)
+    for user_id, snapshot in snapshots.items():
+        _cache_progress(user_id, snapshot.as_dict())
+    return snapshots
 
-app = FastAPI(title="Referral API", version="1.0.0")
+
+# Referral changes from this process are pushed at once; the bot's are found by polling
+progress_events = ProgressEventBus(
+    _load_progress_many,
+    poll_interval=float(os.getenv("PROGRESS_STREAM_POLL_INTERVAL", "5")),
+)
+referral_system.events = progress_events
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await async_database.start()
+    progress_events.start()
+    yield
+    await progress_events.close()
+    await async_database.close()
+
+
+app = FastAPI(title="Referral API", version="1.1.0", lifespan=lifespan)
 
 # CORS setup: allow configured frontend origin or default to common dev origins
 frontend_origin = os.getenv("FRONTEND_ORIGIN")
@@ -44,50 +118,101 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 
+class ProgressBatchRequest(BaseModel):
+    user_ids: List[int] = Field(default_factory=list)
+    referral_codes: List[str] = Field(default_factory=list)
+
+
+def _cache_progress(user_id: int, progress: dict) -> Tuple[dict, bytes, str]:
+    """Serialize a progress response once and remember it with its ETag"""
+    payload = {"ok": True, "user_id": user_id, "progress": progress}
+    body = json.dumps(payload).encode()
+    entry = (payload, body, f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"')
+    if progress_responses is not None:
+        progress_responses.set(user_id, entry)
+    return entry
+
+
+async def _progress_response(user_id: int) -> Tuple[dict, bytes, str]:
+    if progress_responses is not None:
+        entry = progress_responses.get(user_id)
+        if entry is not None:
+            return entry
+    while user_id in _progress_lookups:
+        lookup = _progress_lookups[user_id]
+        try:
+            return await asyncio.shield(lookup)
+        except asyncio.CancelledError:
+            if not lookup.cancelled():
+                raise
+            # The request doing the lookup was cancelled (its client went away); take over
+
+    lookup = asyncio.get_running_loop().create_future()
+    _progress_lookups[user_id] = lookup
+    try:
+        progress = await async_database.run(referral_system.get_referral_progress, user_id)
+        entry = _cache_progress(user_id, progress)
+        lookup.set_result(entry)
+        return entry
+    except Exception as e:
+        lookup.set_exception(e)
+        # Waiters re-raise it; mark it retrieved so an unawaited failure is not logged
+        lookup.exception()
+        raise
+    finally:
+        del _progress_lookups[user_id]
+        if not lookup.done():
+            # Cancelled mid-lookup: wake the waiters so one of them retries
+            lookup.cancel()
+
+
+async def _resolve_user_id(user_id: Optional[int], referral_code: Optional[str]) -> int:
+    """The user a progress request is for; raises 400/404 like the endpoints document"""
+    if not user_id and not referral_code:
+        raise HTTPException(status_code=400, detail="Provide either user_id or referral_code")
+    if user_id:
+        return user_id
+    # Signed codes are verified and decoded in-process; older codes are looked up
+    resolved_user_id = await async_database.run(referral_system.resolve_referral_code, referral_code)
+    if resolved_user_id is None:
+        raise HTTPException(status_code=404, detail="User not found for referral code")
+    return resolved_user_id
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
 @app.get("/api/health")
-def health() -> dict:
+async def health() -> dict:
     return {"status": "ok"}
 
 
 @app.get("/api/referral/progress")
-def get_referral_progress(
+async def get_referral_progress(
+    request: Request,
     user_id: Optional[int] = Query(default=None, ge=1),
     referral_code: Optional[str] = Query(default=None),
-) -> dict:
+) -> Response:
     """Return referral progress for a given user.
 
     One of user_id or referral_code must be provided.
     """
-    if not user_id and not referral_code:
-        raise HTTPException(status_code=400, detail="Provide either user_id or referral_code")
-
     try:
-        resolved_user_id: Optional[int] = user_id
-
-        if resolved_user_id is None and referral_code:
-            user = database.get_user_by_referral_code(referral_code)
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found for referral code")
-            # database layer may backfill user_id if encoded in code; otherwise omit
-            resolved_user_id = user.get("user_id") if isinstance(user, dict) else None
-
-        if resolved_user_id is None:
-            # Fall back to zero progress if user_id cannot be resolved
-            progress = {
-                "active_referrals": 0,
-                "total_referrals": 0,
-                "target": referral_system.get_active_referral_target(),
-                "remaining": referral_system.get_active_referral_target(),
-                "target_reached": False,
-                "progress_percentage": 0,
-            }
-            return {"ok": True, "user_id": None, "progress": progress}
-
-        progress = referral_system.get_referral_progress(resolved_user_id)
-        return {"ok": True, "user_id": resolved_user_id, "progress": progress}
+        resolved_user_id = await _resolve_user_id(user_id, referral_code)
+        _, body, etag = await _progress_response(resolved_user_id)
+        headers = {"ETag": etag, "Cache-Control": f"private, max-age={int(progress_cache_ttl)}"}
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
 
     except HTTPException:
         raise
@@ -96,11 +221,91 @@ def get_referral_progress(
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@app.get("/api/referral/progress/stream")
+async def stream_referral_progress(
+    user_id: Optional[int] = Query(default=None, ge=1),
+    referral_code: Optional[str] = Query(default=None),
+) -> StreamingResponse:
+    """Stream a user's referral progress as server-sent events.
+
+    Sends the current progress as a ``progress`` event, then one more each
+    time it changes. The data of each event is the body of GET /api/referral/progress.
+    """
+    try:
+        resolved_user_id = await _resolve_user_id(user_id, referral_code)
+        subscription = await progress_events.subscribe(resolved_user_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error starting referral progress stream: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+    async def events():
+        try:
+            while True:
+                progress = await subscription.next(timeout=STREAM_HEARTBEAT_SECONDS)
+                if progress is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                payload = {"ok": True, "user_id": resolved_user_id, "progress": progress.as_dict()}
+                yield f"event: progress\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            progress_events.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/referral/progress:batch")
+async def get_referral_progress_batch(request: ProgressBatchRequest) -> dict:
+    """Return referral progress for many users and referral codes at once.
+
+    Cached users are answered from memory; the rest share one storage query.
+    Unknown referral codes map to null.
+    """
+    user_ids = list(dict.fromkeys(request.user_ids))
+    referral_codes = list(dict.fromkeys(request.referral_codes))
+    if not user_ids and not referral_codes:
+        raise HTTPException(status_code=400, detail="Provide user_ids or referral_codes")
+    if len(user_ids) + len(referral_codes) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} user_ids and referral_codes per request")
+    if any(user_id < 1 for user_id in user_ids):
+        raise HTTPException(status_code=422, detail="user_ids must be positive")
+
+    try:
+        progress: Dict[int, dict] = {}
+        missing = []
+        for user_id in user_ids:
+            entry = progress_responses.get(user_id) if progress_responses is not None else None
+            if entry is not None:
+                progress[user_id] = entry[0]["progress"]
+            else:
+                missing.append(user_id)
+
+        owners: Dict[str, Optional[int]] = {}
+        if missing or referral_codes:
+            snapshots, owners = await async_database.run(referral_system.get_progress_many, missing, referral_codes)
+            for user_id, snapshot in snapshots.items():
+                progress[user_id] = _cache_progress(user_id, snapshot.as_dict())[0]["progress"]
+
+        ordered = list(dict.fromkeys((*user_ids, *(owner for owner in owners.values() if owner is not None))))
+        return {
+            "ok": True,
+            "results": [{"user_id": user_id, "progress": progress[user_id]} for user_id in ordered],
+            "referral_codes": owners,
+        }
+
+    except Exception as e:
+        logger.error(f"Error fetching batch referral progress: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
 # Optional convenience: allow running via `python api_server.py`
 if __name__ == "__main__":
     import uvicorn
 
     port = int(os.getenv("REFERRAL_API_PORT", os.getenv("PORT", "8080")))
     uvicorn.run("api_server:app", host="0.0.0.0", port=port, reload=True)
-
-
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of the referral flow the bot handlers run, per storage backend
+
+Replays the storage calls /start makes for referred newcomers (language
+detection, user lookup and creation, membership update, referral processing,
+referrer progress), then has a share of them leave the channel. Everything runs
+through AsyncDatabase and ReferralSystem exactly like BotHandlers, with no
+Telegram or Supabase connection:
+
+  memory    - MemoryDatabase, the in-memory reference backend
+  sqlite    - SQLiteDatabase on a temporary WAL file
+  supabase  - the Supabase Database over FakePostgrestClient (--latency models the round trip)
+
+Usage:
+  python benchmark_referral_flow.py [--backends memory,sqlite,supabase] [--users 5000]
+                                    [--referrers 500] [--concurrency 64] [--latency 20]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(__file__))
+
+from benchmark_user_lookup import summarize
+from telegramreferralpro.async_database import AsyncDatabase
+from telegramreferralpro.database import Database
+from telegramreferralpro.fake_postgrest import FakePostgrestClient
+from telegramreferralpro.languages import LanguageManager
+from telegramreferralpro.memory_database import MemoryDatabase
+from telegramreferralpro.referral_system import ReferralSystem
+from telegramreferralpro.sqlite_database import SQLiteDatabase
+
+BASE_REFERRER_ID = 100_000_000
+BASE_NEW_USER_ID = 200_000_000
+LANGUAGES = ["en", "es", "fr", "de", "ru", "pt"]
+
+def build_storage(backend: str, latency_ms: float, workdir: str):
+    if backend == "memory":
+        return MemoryDatabase(settings={"referral_target": "5"}), None
+    if backend == "sqlite":
+        return SQLiteDatabase(os.path.join(workdir, "benchmark.db")), None
+    if backend == "supabase":
+        client = FakePostgrestClient(latency=latency_ms / 1000)
+        client.seed("settings", [{"key": "referral_target", "value": "5"}])
+        return Database(client=client), client
+    raise ValueError(f"Unknown backend {backend!r}")
+
+async def run_backend(backend: str, args, workdir: str) -> None:
+    storage, client = build_storage(backend, args.latency, workdir)
+    db = AsyncDatabase(storage, max_workers=args.workers)
+    await db.start()
+    referral_system = ReferralSystem(storage)
+    language_manager = LanguageManager(storage)
+
+    codes = []
+    for i in range(args.referrers):
+        user_id = BASE_REFERRER_ID + i
+        code = referral_system.generate_referral_code(user_id)
+        storage.add_user(user_id, username=f"referrer{i}", referral_code=code)
+        codes.append(code)
+    requests_before = client.requests if client else 0
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    start_samples, leave_samples = [], []
+
+    async def start_flow(i: int) -> None:
+        user_id = BASE_NEW_USER_ID + i
+        telegram_user = SimpleNamespace(id=user_id, username=f"user{i}", first_name="User", last_name="",
+                                        language_code=random.choice(LANGUAGES))
+        code = random.choice(codes)
+        async with semaphore:
+            started = time.perf_counter()
+            await db.run(language_manager.detect_and_set_language, user_id, telegram_user, f"/start {code}")
+            existing_user = await db.get_user(user_id)
+            if not existing_user:
+                await db.add_user(user_id=user_id, username=telegram_user.username, first_name="User",
+                                  last_name="", referral_code=referral_system.generate_referral_code(user_id))
+                existing_user = await db.get_user(user_id)
+            await db.update_channel_membership(user_id, True)
+            if existing_user and not existing_user["referred_by"]:
+                await db.run(referral_system.process_referral, code, user_id)
+            referrer = await db.get_user_by_referral_code(code)
+            if referrer:
+                await db.run(referral_system.get_referral_progress, referrer["user_id"])
+            start_samples.append(time.perf_counter() - started)
+
+    async def leave_flow(i: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            referrers = await db.run(referral_system.handle_user_left_channel, BASE_NEW_USER_ID + i)
+            for referrer_id in referrers:
+                await db.run(referral_system.get_referral_progress, referrer_id)
+            leave_samples.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(start_flow(i) for i in range(args.users)))
+    start_elapsed = time.perf_counter() - started
+
+    leavers = random.sample(range(args.users), int(args.users * args.leave_ratio))
+    started = time.perf_counter()
+    await asyncio.gather(*(leave_flow(i) for i in leavers))
+    leave_elapsed = time.perf_counter() - started
+
+    await db.close()
+
+    print(f"\n📦 {backend}")
+    print(f"   /start with referral: {args.users / start_elapsed:10.1f} flows/s")
+    summarize("start flow", start_samples)
+    if leave_samples:
+        print(f"   channel leave:        {len(leave_samples) / leave_elapsed:10.1f} flows/s")
+        summarize("leave flow", leave_samples)
+    if client:
+        print(f"   {client.requests - requests_before:,} PostgREST requests "
+              f"({(client.requests - requests_before) / (args.users + len(leavers)):.1f} per flow)")
+
+async def run(args) -> None:
+    with tempfile.TemporaryDirectory() as workdir:
+        for backend in args.backends.split(","):
+            await run_backend(backend.strip(), args, workdir)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the handler referral flow offline")
+    parser.add_argument("--backends", default="memory,sqlite,supabase", help="comma-separated backends to run")
+    parser.add_argument("--users", type=int, default=5000, help="referred newcomers sending /start")
+    parser.add_argument("--referrers", type=int, default=500, help="existing users whose codes are used")
+    parser.add_argument("--leave-ratio", type=float, default=0.2, help="share of newcomers that leave again")
+    parser.add_argument("--concurrency", type=int, default=64, help="updates processed at once")
+    parser.add_argument("--workers", type=int, default=8, help="AsyncDatabase worker threads")
+    parser.add_argument("--latency", type=float, default=20.0, help="simulated Supabase round trip in ms")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    args = parser.parse_args()
+    random.seed(args.seed)
+    # The Supabase backend logs a warning per rejected duplicate insert
+    logging.basicConfig(level=logging.ERROR)
+
+    print("Referral Flow Benchmark")
+    print("=======================")
+    print(f"{args.users:,} referred users, {args.referrers:,} referrers, concurrency {args.concurrency}, "
+          f"{args.workers} DB workers, {args.latency:g} ms simulated Supabase latency")
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark user point lookups: indexed user_id vs the legacy referral_code LIKE pattern
+
+By default this builds a local SQLite copy of the users table with 1,000,000 rows
+and times both query shapes. Pass --supabase to time the same two PostgREST calls
+that Database.get_user makes against the configured Supabase project instead.
+
+Usage:
+  python benchmark_user_lookup.py [--rows 1000000] [--lookups 200] [--supabase]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+# Add the telegramreferralpro directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'telegramreferralpro'))
+
+BASE_USER_ID = 100_000_000
+
+def summarize(label: str, samples: list) -> None:
+    """Print latency percentiles in milliseconds"""
+    samples = sorted(samples)
+    p50 = statistics.median(samples) * 1000
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000
+    print(f"   {label:<28} p50={p50:9.3f} ms   p99={p99:9.3f} ms   n={len(samples)}")
+
+def time_queries(run_query, user_ids: list) -> list:
+    samples = []
+    for user_id in user_ids:
+        start = time.perf_counter()
+        run_query(user_id)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def build_sqlite_users(rows: int) -> sqlite3.Connection:
+    """Create an in-memory users table shaped like the Supabase one"""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY,
+            user_id BIGINT UNIQUE NOT NULL,
+            username TEXT,
+            referral_code TEXT UNIQUE NOT NULL
+        )
+    """)
+    batch = []
+    for i in range(rows):
+        user_id = BASE_USER_ID + i
+        batch.append((user_id, f"user{i}", f"user_{user_id}_{i:012x}"))
+        if len(batch) == 50_000:
+            conn.executemany("INSERT INTO users (user_id, username, referral_code) VALUES (?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO users (user_id, username, referral_code) VALUES (?, ?, ?)", batch)
+    conn.commit()
+    return conn
+
+def run_sqlite(rows: int, lookups: int) -> None:
+    print(f"🏗️  Building local users table with {rows:,} rows...")
+    start = time.perf_counter()
+    conn = build_sqlite_users(rows)
+    print(f"   ✅ Built in {time.perf_counter() - start:.1f}s")
+
+    user_ids = [BASE_USER_ID + random.randrange(rows) for _ in range(lookups)]
+
+    def by_user_id(user_id):
+        return conn.execute("SELECT * FROM users WHERE user_id = ? LIMIT 1", (user_id,)).fetchone()
+
+    def by_like(user_id):
+        return conn.execute("SELECT * FROM users WHERE referral_code LIKE ?", (f"user_{user_id}_%",)).fetchall()
+
+    print("\n📋 Query plans:")
+    for label, sql, param in [
+        ("user_id =", "SELECT * FROM users WHERE user_id = ? LIMIT 1", user_ids[0]),
+        ("referral_code LIKE", "SELECT * FROM users WHERE referral_code LIKE ?", f"user_{user_ids[0]}_%"),
+    ]:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", (param,)).fetchall()
+        print(f"   {label:<20} {' / '.join(row[-1] for row in plan)}")
+
+    print(f"\n⏱️  {lookups} random point lookups:")
+    summarize("eq('user_id', id)", time_queries(by_user_id, user_ids))
+    summarize("like('referral_code', ...)", time_queries(by_like, user_ids))
+
+def run_supabase(lookups: int) -> None:
+    from telegramreferralpro.supabase_client import supabase
+
+    response = supabase.table("users").select("user_id").not_.is_("user_id", "null").limit(lookups).execute()
+    user_ids = [row["user_id"] for row in response.data]
+    if not user_ids:
+        print("❌ No users with user_id found in Supabase")
+        return
+
+    count = supabase.table("users").select("id", count="exact").limit(1).execute().count
+    print(f"📊 Supabase users table has {count:,} rows; timing {len(user_ids)} lookups")
+
+    def by_user_id(user_id):
+        return supabase.table("users").select("*").eq("user_id", user_id).limit(1).execute()
+
+    def by_like(user_id):
+        return supabase.table("users").select("*").like("referral_code", f"user_{user_id}_%").execute()
+
+    print("\n⏱️  Round-trip latency:")
+    summarize("eq('user_id', id)", time_queries(by_user_id, user_ids))
+    summarize("like('referral_code', ...)", time_queries(by_like, user_ids))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark user point lookups")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="rows in the local users table")
+    parser.add_argument("--lookups", type=int, default=200, help="number of random lookups to time")
+    parser.add_argument("--supabase", action="store_true", help="time the configured Supabase project instead")
+    args = parser.parse_args()
+
+    print("User Lookup Benchmark")
+    print("=====================")
+    if args.supabase:
+        run_supabase(args.lookups)
+    else:
+        run_sqlite(args.rows, args.lookups)
+
+if __name__ == "__main__":
+    main()
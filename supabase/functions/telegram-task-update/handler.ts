@@ -0,0 +1,118 @@
+// Request handling for telegram-task-update, kept free of Deno/Supabase imports
+// so it can be tested with a stand-in upsert.
+
+// Largest batch accepted in one request; the bot's outbox never sends more
+export const MAX_BATCH_SIZE = 500
+
+export interface TaskUpdate {
+  telegramId: number
+  taskKey: string
+  status: string
+  meta: Record<string, unknown>
+}
+
+export interface TaskUpdateRow {
+  telegram_id: number
+  task_key: string
+  status: string
+  meta: Record<string, unknown>
+  updated_at: string
+}
+
+export interface HandlerOptions {
+  secret: string | undefined
+  // Writes all rows in one statement; throws on failure
+  upsert: (rows: TaskUpdateRow[]) => Promise<void>
+}
+
+const jsonResponse = (body: unknown, status = 200) =>
+  new Response(JSON.stringify(body), {
+    headers: { "Content-Type": "application/json" },
+    status,
+  })
+
+// Returns an error message, or null if the item is a valid task update
+export function validateTaskUpdate(item: unknown): string | null {
+  if (typeof item !== "object" || item === null || Array.isArray(item)) {
+    return "update must be an object"
+  }
+  const { telegramId, taskKey, status, meta } = item as Record<string, unknown>
+  if (!Number.isSafeInteger(telegramId)) return "telegramId must be an integer"
+  if (typeof taskKey !== "string" || taskKey === "") return "taskKey must be a non-empty string"
+  if (typeof status !== "string" || status === "") return "status must be a non-empty string"
+  if (meta !== undefined && meta !== null && (typeof meta !== "object" || Array.isArray(meta))) {
+    return "meta must be an object"
+  }
+  return null
+}
+
+// One row per (telegramId, taskKey); a later update in the batch wins, since
+// Postgres cannot upsert the same row twice in one statement
+export function toRows(updates: TaskUpdate[], now: string): TaskUpdateRow[] {
+  const rows = new Map<string, TaskUpdateRow>()
+  for (const update of updates) {
+    const key = `${update.telegramId}:${update.taskKey}`
+    rows.delete(key)
+    rows.set(key, {
+      telegram_id: update.telegramId,
+      task_key: update.taskKey,
+      status: update.status,
+      meta: update.meta ?? {},
+      updated_at: now,
+    })
+  }
+  return [...rows.values()]
+}
+
+// Accepts one update object or an array of them. The secret is checked once
+// per request and every valid update is written with a single upsert.
+// Invalid items are skipped and reported; the request fails with 400 only if
+// nothing in it was valid.
+export async function handleTaskUpdates(req: Request, options: HandlerOptions): Promise<Response> {
+  if (req.method !== "POST") {
+    return new Response("Method Not Allowed", { status: 405 })
+  }
+
+  if (!options.secret || req.headers.get("x-bot-secret") !== options.secret) {
+    console.warn("Unauthorized request: Invalid secret received.")
+    return new Response("Unauthorized", { status: 401 })
+  }
+
+  let body: unknown
+  try {
+    body = await req.json()
+  } catch {
+    return jsonResponse({ error: "Body must be JSON" }, 400)
+  }
+
+  const items = Array.isArray(body) ? body : [body]
+  if (items.length > MAX_BATCH_SIZE) {
+    return jsonResponse({ error: `At most ${MAX_BATCH_SIZE} updates per request` }, 413)
+  }
+
+  const updates: TaskUpdate[] = []
+  const rejected: { index: number; error: string }[] = []
+  items.forEach((item, index) => {
+    const error = validateTaskUpdate(item)
+    if (error) {
+      rejected.push({ index, error })
+    } else {
+      updates.push(item as TaskUpdate)
+    }
+  })
+
+  if (updates.length === 0) {
+    return jsonResponse({ error: "No valid task updates", rejected }, 400)
+  }
+
+  const rows = toRows(updates, new Date().toISOString())
+  try {
+    await options.upsert(rows)
+  } catch (error) {
+    console.error("Error storing task updates:", error)
+    return jsonResponse({ error: "Internal Server Error", details: (error as Error).message }, 500)
+  }
+
+  console.log(`Stored ${rows.length} task update(s) from ${items.length} received`)
+  return jsonResponse({ received: items.length, upserted: rows.length, rejected })
+}
@@ -0,0 +1,105 @@
+// deno test supabase/functions/telegram-task-update/
+import { assertEquals } from "https://deno.land/std@0.168.0/testing/asserts.ts"
+
+import { handleTaskUpdates, MAX_BATCH_SIZE, TaskUpdateRow } from "./handler.ts"
+
+const SECRET = "test-secret"
+
+// Stand-in for the Supabase upsert that records each statement
+function recorder() {
+  const statements: TaskUpdateRow[][] = []
+  return {
+    statements,
+    upsert: (rows: TaskUpdateRow[]) => {
+      statements.push(rows)
+      return Promise.resolve()
+    },
+  }
+}
+
+const post = (body: unknown, secret = SECRET) =>
+  new Request("http://localhost/telegram-task-update", {
+    method: "POST",
+    headers: { "Content-Type": "application/json", "x-bot-secret": secret },
+    body: typeof body === "string" ? body : JSON.stringify(body),
+  })
+
+const update = (telegramId: number, taskKey = "tg_referral_5", status = "completed") =>
+  ({ telegramId, taskKey, status, meta: { referrals: 5 } })
+
+Deno.test("single update object is still accepted", async () => {
+  const db = recorder()
+  const response = await handleTaskUpdates(post(update(1)), { secret: SECRET, upsert: db.upsert })
+  assertEquals(response.status, 200)
+  assertEquals((await response.json()).upserted, 1)
+  assertEquals(db.statements.length, 1)
+  assertEquals(db.statements[0][0].telegram_id, 1)
+})
+
+Deno.test("batch is written with one upsert", async () => {
+  const db = recorder()
+  const batch = Array.from({ length: 300 }, (_, i) => update(i + 1))
+  const response = await handleTaskUpdates(post(batch), { secret: SECRET, upsert: db.upsert })
+  assertEquals(response.status, 200)
+  assertEquals(db.statements.length, 1)
+  assertEquals(db.statements[0].length, 300)
+})
+
+Deno.test("later update for the same task wins", async () => {
+  const db = recorder()
+  const batch = [update(1, "tg_referral_5", "pending"), update(2), update(1, "tg_referral_5", "completed")]
+  await handleTaskUpdates(post(batch), { secret: SECRET, upsert: db.upsert })
+  const rows = db.statements[0]
+  assertEquals(rows.length, 2)
+  assertEquals(rows.find((row) => row.telegram_id === 1)?.status, "completed")
+})
+
+Deno.test("wrong secret is rejected before anything is written", async () => {
+  const db = recorder()
+  const response = await handleTaskUpdates(post([update(1)], "nope"), { secret: SECRET, upsert: db.upsert })
+  assertEquals(response.status, 401)
+  assertEquals(db.statements.length, 0)
+})
+
+Deno.test("unset secret rejects every request", async () => {
+  const db = recorder()
+  const response = await handleTaskUpdates(post(update(1), ""), { secret: undefined, upsert: db.upsert })
+  assertEquals(response.status, 401)
+})
+
+Deno.test("invalid items are skipped and reported", async () => {
+  const db = recorder()
+  const batch = [update(1), { telegramId: "x", taskKey: "t", status: "completed" }, update(2)]
+  const response = await handleTaskUpdates(post(batch), { secret: SECRET, upsert: db.upsert })
+  const body = await response.json()
+  assertEquals(response.status, 200)
+  assertEquals(body.upserted, 2)
+  assertEquals(body.rejected, [{ index: 1, error: "telegramId must be an integer" }])
+})
+
+Deno.test("nothing valid is a 400", async () => {
+  const db = recorder()
+  const response = await handleTaskUpdates(post([{ taskKey: "t" }]), { secret: SECRET, upsert: db.upsert })
+  assertEquals(response.status, 400)
+  assertEquals(db.statements.length, 0)
+  assertEquals((await handleTaskUpdates(post("{not json"), { secret: SECRET, upsert: db.upsert })).status, 400)
+})
+
+Deno.test("oversized batch is a 413", async () => {
+  const db = recorder()
+  const batch = Array.from({ length: MAX_BATCH_SIZE + 1 }, (_, i) => update(i + 1))
+  const response = await handleTaskUpdates(post(batch), { secret: SECRET, upsert: db.upsert })
+  assertEquals(response.status, 413)
+})
+
+Deno.test("storage failure is a 500 so the bot retries", async () => {
+  const upsert = () => Promise.reject(new Error("connection refused"))
+  const response = await handleTaskUpdates(post([update(1)]), { secret: SECRET, upsert })
+  assertEquals(response.status, 500)
+})
+
+Deno.test("only POST is allowed", async () => {
+  const db = recorder()
+  const response = await handleTaskUpdates(new Request("http://localhost/"), { secret: SECRET, upsert: db.upsert })
+  assertEquals(response.status, 405)
+})
@@ -1,13 +1,23 @@
 import { serve } from "https://deno.land/std@0.168.0/http/server.ts"
+import { createClient } from "https://esm.sh/@supabase/supabase-js@2"
 
-serve(async (req) => {
-  const { name } = await req.json()
-  const data = {
-    message: `Hello ${name}!`,
-  }
-
-  return new Response(
-    JSON.stringify(data),
-    { headers: { "Content-Type": "application/json" } },
-  )
-})
+import { handleTaskUpdates, TaskUpdateRow } from "./handler.ts"
+
+// Secret shared with the bot (SUPABASE_WEBHOOK_SECRET there)
+const BOT_SECRET = Deno.env.get("TELEGRAM_WEBHOOK_SECRET")
+
+const supabase = createClient(
+  Deno.env.get("SUPABASE_URL")!,
+  Deno.env.get("SUPABASE_SERVICE_ROLE_KEY")!,
+  { auth: { persistSession: false } },
+)
+
+// One INSERT ... ON CONFLICT statement for the whole batch
+async function upsertTaskUpdates(rows: TaskUpdateRow[]) {
+  const { error } = await supabase
+    .from("telegram_task_updates")
+    .upsert(rows, { onConflict: "telegram_id,task_key" })
+  if (error) throw error
+}
+
+serve((req) => handleTaskUpdates(req, { secret: BOT_SECRET, upsert: upsertTaskUpdates }))
@@ -0,0 +1,28 @@
+-- Make users.user_id (the Telegram user ID) the lookup key for the bot
+-- The initial schema declares it, but older deployments may be missing the column
+ALTER TABLE users ADD COLUMN IF NOT EXISTS user_id BIGINT;
+
+-- Backfill rows created before the bot sent user_id, using the legacy user_{id}_{hash} codes
+UPDATE users
+SET user_id = substring(referral_code FROM '^user_([0-9]+)_')::BIGINT
+WHERE user_id IS NULL
+  AND referral_code ~ '^user_[0-9]+_';
+
+-- Ensure point lookups by user_id are served by a unique index
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = 'public.users'::regclass
+          AND i.indisunique
+          AND i.indnatts = 1
+          AND a.attname = 'user_id'
+    ) THEN
+        CREATE UNIQUE INDEX idx_users_user_id ON users(user_id);
+    END IF;
+END $$;
+
+-- Add a comment to explain the column purpose
+COMMENT ON COLUMN users.user_id IS 'Telegram user ID; used by the bot for point lookups';
@@ -0,0 +1,43 @@
+-- Columns for user state the bot previously kept only in memory
+ALTER TABLE users ADD COLUMN IF NOT EXISTS first_name TEXT;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS last_name TEXT;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS referred_by_user_id BIGINT;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS is_channel_member BOOLEAN DEFAULT FALSE;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS reward_claimed BOOLEAN DEFAULT FALSE;
+
+COMMENT ON COLUMN users.referred_by_user_id IS 'Telegram user ID of the referrer';
+
+-- Invite links created for each user's referrals
+CREATE TABLE IF NOT EXISTS invite_links (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    referral_code TEXT,
+    invite_link TEXT UNIQUE NOT NULL,
+    invite_link_name TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    is_active BOOLEAN DEFAULT TRUE
+);
+
+CREATE INDEX IF NOT EXISTS idx_invite_links_user_id ON invite_links(user_id);
+
+-- Channel join/leave log
+CREATE TABLE IF NOT EXISTS channel_events (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    event_type TEXT NOT NULL,
+    timestamp TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_channel_events_user_id ON channel_events(user_id);
+
+-- Language preferences
+CREATE TABLE IF NOT EXISTS user_languages (
+    user_id BIGINT PRIMARY KEY,
+    language_code TEXT DEFAULT 'en',
+    detected_language TEXT,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+COMMENT ON TABLE invite_links IS 'Telegram invite links created for each user''s referrals';
+COMMENT ON TABLE channel_events IS 'Channel join and leave events observed by the bot';
+COMMENT ON TABLE user_languages IS 'Preferred bot language per Telegram user';
@@ -0,0 +1,28 @@
+-- Bump the settings_version row whenever settings or referral targets change,
+-- so running bots drop their cached active referral target within seconds
+-- whichever tool made the change
+CREATE OR REPLACE FUNCTION bump_settings_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- The bump writes to settings itself; do not fire again for it
+    IF pg_trigger_depth() > 1 THEN
+        RETURN NULL;
+    END IF;
+    INSERT INTO settings (key, value)
+    VALUES ('settings_version', (extract(epoch FROM clock_timestamp()) * 1000000)::bigint::text)
+    ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS bump_settings_version_on_settings ON settings;
+CREATE TRIGGER bump_settings_version_on_settings
+    AFTER INSERT OR UPDATE OR DELETE ON settings
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION bump_settings_version();
+
+DROP TRIGGER IF EXISTS bump_settings_version_on_referral_targets ON referral_targets;
+CREATE TRIGGER bump_settings_version_on_referral_targets
+    AFTER INSERT OR UPDATE OR DELETE ON referral_targets
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION bump_settings_version();
@@ -0,0 +1,20 @@
+-- Return active and total referral counts for a referrer in one round trip,
+-- keyed by Telegram user ID so the bot does not need the internal users.id
+CREATE OR REPLACE FUNCTION public.get_referral_counts(p_referrer_user_id BIGINT)
+RETURNS TABLE (active_referrals BIGINT, total_referrals BIGINT)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        COUNT(*) FILTER (WHERE referrals.is_active) AS active_referrals,
+        COUNT(*) AS total_referrals
+    FROM referrals
+    JOIN users ON users.id = referrals.referrer_id
+    WHERE users.user_id = p_referrer_user_id;
+$$;
+
+-- Counting by referrer should not scan the whole referrals table
+CREATE INDEX IF NOT EXISTS idx_referrals_referrer_active ON referrals(referrer_id, is_active);
+
+-- Add a comment to explain the function purpose
+COMMENT ON FUNCTION public.get_referral_counts(BIGINT) IS 'Active and total referral counts for a Telegram user';
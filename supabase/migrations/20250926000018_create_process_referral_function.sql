@@ -0,0 +1,65 @@
+-- Record a referral in one round trip: validate the code, create the referred
+-- user if needed and link both records in a single transaction
+CREATE OR REPLACE FUNCTION public.process_referral(
+    p_referrer_code TEXT,
+    p_user_id BIGINT,
+    p_username TEXT DEFAULT NULL,
+    p_first_name TEXT DEFAULT NULL,
+    p_last_name TEXT DEFAULT NULL,
+    p_referral_code TEXT DEFAULT NULL
+)
+RETURNS TABLE (status TEXT, referrer JSONB, referred JSONB)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_referrer users%ROWTYPE;
+    v_user users%ROWTYPE;
+BEGIN
+    SELECT * INTO v_referrer FROM users WHERE users.referral_code = p_referrer_code;
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'invalid_code'::TEXT, NULL::JSONB, NULL::JSONB;
+        RETURN;
+    END IF;
+
+    IF v_referrer.user_id = p_user_id THEN
+        RETURN QUERY SELECT 'self_referral'::TEXT, to_jsonb(v_referrer), to_jsonb(v_referrer);
+        RETURN;
+    END IF;
+
+    -- An existing user keeps their code and profile
+    INSERT INTO users (user_id, username, first_name, last_name, referral_code)
+    VALUES (p_user_id, p_username, p_first_name, p_last_name, p_referral_code)
+    ON CONFLICT (user_id) DO NOTHING;
+
+    -- Concurrent calls for the same user queue up here, so only one can credit a referrer
+    SELECT * INTO v_user FROM users WHERE users.user_id = p_user_id FOR UPDATE;
+
+    IF v_user.referred_by_user_id IS NOT NULL
+        OR EXISTS (SELECT 1 FROM referrals WHERE referrals.referred_id = v_user.id) THEN
+        RETURN QUERY SELECT 'already_referred'::TEXT, to_jsonb(v_referrer), to_jsonb(v_user);
+        RETURN;
+    END IF;
+
+    UPDATE users SET referred_by_user_id = v_referrer.user_id WHERE users.id = v_user.id;
+    INSERT INTO referrals (referrer_id, referred_id, is_active) VALUES (v_referrer.id, v_user.id, TRUE);
+    v_user.referred_by_user_id := v_referrer.user_id;
+
+    RETURN QUERY SELECT 'recorded'::TEXT, to_jsonb(v_referrer), to_jsonb(v_user);
+END;
+$$;
+
+-- A user can be referred only once; skipped if earlier races already left duplicates
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM referrals
+        WHERE referred_id IS NOT NULL
+        GROUP BY referred_id
+        HAVING COUNT(*) > 1
+    ) THEN
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_referrals_referred_id ON referrals(referred_id);
+    END IF;
+END $$;
+
+-- Add a comment to explain the function purpose
+COMMENT ON FUNCTION public.process_referral(TEXT, BIGINT, TEXT, TEXT, TEXT, TEXT) IS 'Atomically credit a referrer for a user; returns the outcome and both users rows';
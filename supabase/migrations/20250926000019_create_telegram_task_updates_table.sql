@@ -0,0 +1,17 @@
+-- Latest status of each task the bot reports through the telegram-task-update
+-- edge function; one row per user and task so batches can be upserted
+CREATE TABLE IF NOT EXISTS telegram_task_updates (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    telegram_id BIGINT NOT NULL,
+    task_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    meta JSONB NOT NULL DEFAULT '{}'::jsonb,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE (telegram_id, task_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_telegram_task_updates_task_key ON telegram_task_updates(task_key, status);
+
+-- Add a comment to explain the table purpose
+COMMENT ON TABLE telegram_task_updates IS 'Task statuses reported by the Telegram bot, upserted in batches by the telegram-task-update edge function';
@@ -0,0 +1,24 @@
+-- Referral counts for many referrers in one round trip, selected by Telegram
+-- user ID or by referral code, so batch progress requests need a single query
+CREATE OR REPLACE FUNCTION public.get_referral_counts_many(
+    p_user_ids BIGINT[] DEFAULT '{}',
+    p_referral_codes TEXT[] DEFAULT '{}'
+)
+RETURNS TABLE (user_id BIGINT, referral_code TEXT, active_referrals BIGINT, total_referrals BIGINT)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        users.user_id,
+        users.referral_code,
+        COUNT(referrals.id) FILTER (WHERE referrals.is_active) AS active_referrals,
+        COUNT(referrals.id) AS total_referrals
+    FROM users
+    LEFT JOIN referrals ON referrals.referrer_id = users.id
+    WHERE users.user_id = ANY(p_user_ids)
+       OR users.referral_code = ANY(p_referral_codes)
+    GROUP BY users.id, users.user_id, users.referral_code;
+$$;
+
+-- Add a comment to explain the function purpose
+COMMENT ON FUNCTION public.get_referral_counts_many(BIGINT[], TEXT[]) IS 'Active and total referral counts for many Telegram users, matched by user ID or referral code';
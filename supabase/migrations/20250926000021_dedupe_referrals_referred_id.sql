@@ -0,0 +1,18 @@
+-- A user can be referred only once. Migration 018 skipped the unique index when
+-- earlier races had left duplicate referrals, so keep the first referral of each
+-- referred user and create the index the write-behind upserts rely on
+
+-- Block new referrals until the index exists, so no duplicate slips in between
+LOCK TABLE referrals IN SHARE ROW EXCLUSIVE MODE;
+
+DELETE FROM referrals
+WHERE id IN (
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (PARTITION BY referred_id ORDER BY created_at, id) AS position
+        FROM referrals
+        WHERE referred_id IS NOT NULL
+    ) ranked
+    WHERE ranked.position > 1
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_referrals_referred_id ON referrals(referred_id);
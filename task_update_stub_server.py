@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the telegram-task-update Supabase edge function
+
+Speaks the same contract as supabase/functions/telegram-task-update: POST one
+task update object or a JSON array of them with the x-bot-secret header; each
+request is "upserted" into an in-memory table keyed by (telegramId, taskKey).
+GET returns the stored rows and how many requests were received, so the bot
+can be run against it without Deno or a Supabase project:
+
+  python task_update_stub_server.py --port 54321 --secret dev-secret
+  SUPABASE_WEBHOOK_URL=http://localhost:54321 SUPABASE_WEBHOOK_SECRET=dev-secret \
+      SUPABASE_WEBHOOK_BATCH_SIZE=200 python -m telegramreferralpro.main
+
+With --replay N the script instead pushes N claims through TaskUpdateOutbox
+against the stand-in and reports how many requests delivered them.
+
+Usage:
+  python task_update_stub_server.py [--port 54321] [--secret SECRET]
+                                    [--replay 1000] [--batch-size 200]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(__file__))
+
+# Same limit as MAX_BATCH_SIZE in the edge function
+MAX_BATCH_SIZE = 500
+
+def validate_task_update(item) -> str:
+    """Error message for an invalid update, or an empty string"""
+    if not isinstance(item, dict):
+        return "update must be an object"
+    if not isinstance(item.get("telegramId"), int) or isinstance(item.get("telegramId"), bool):
+        return "telegramId must be an integer"
+    if not isinstance(item.get("taskKey"), str) or not item["taskKey"]:
+        return "taskKey must be a non-empty string"
+    if not isinstance(item.get("status"), str) or not item["status"]:
+        return "status must be a non-empty string"
+    if item.get("meta") is not None and not isinstance(item["meta"], dict):
+        return "meta must be an object"
+    return ""
+
+class TaskUpdateStore:
+    """In-memory telegram_task_updates table"""
+
+    def __init__(self):
+        self.rows = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def upsert(self, updates: list) -> None:
+        with self.lock:
+            for update in updates:
+                self.rows[(update["telegramId"], update["taskKey"])] = {
+                    "telegram_id": update["telegramId"],
+                    "task_key": update["taskKey"],
+                    "status": update["status"],
+                    "meta": update.get("meta") or {},
+                    "updated_at": time.time(),
+                }
+
+def make_handler(store: TaskUpdateStore, secret: str):
+    class TaskUpdateHandler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            with store.lock:
+                self._reply(200, {"requests": store.requests, "rows": list(store.rows.values())})
+
+        def do_POST(self):
+            with store.lock:
+                store.requests += 1
+            if not secret or self.headers.get("x-bot-secret") != secret:
+                self._reply(401, {"error": "Unauthorized"})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+            except ValueError:
+                self._reply(400, {"error": "Body must be JSON"})
+                return
+
+            items = body if isinstance(body, list) else [body]
+            if len(items) > MAX_BATCH_SIZE:
+                self._reply(413, {"error": f"At most {MAX_BATCH_SIZE} updates per request"})
+                return
+            updates, rejected = [], []
+            for index, item in enumerate(items):
+                error = validate_task_update(item)
+                if error:
+                    rejected.append({"index": index, "error": error})
+                else:
+                    updates.append(item)
+            if not updates:
+                self._reply(400, {"error": "No valid task updates", "rejected": rejected})
+                return
+            store.upsert(updates)
+            self._reply(200, {"received": len(items), "upserted": len(updates), "rejected": rejected})
+
+        def log_message(self, format, *args):
+            pass
+
+    return TaskUpdateHandler
+
+async def replay(url: str, secret: str, claims: int, batch_size: int) -> None:
+    """Push claims through TaskUpdateOutbox the way the bot does"""
+    from telegramreferralpro.supabase_utils import create_http_session
+    from telegramreferralpro.task_outbox import TaskUpdateOutbox
+
+    config = SimpleNamespace(supabase_webhook_url=url, supabase_webhook_secret=secret)
+    with tempfile.TemporaryDirectory() as directory:
+        outbox = TaskUpdateOutbox(config, path=os.path.join(directory, "outbox.db"), batch_size=batch_size)
+        async with create_http_session() as session:
+            started = time.perf_counter()
+            await outbox.start(session)
+            # A burst of claims, as when rewards are synced after an outage
+            await asyncio.gather(*(
+                outbox.enqueue(user_id, "tg_referral_5", "completed", {"referrals": 5})
+                for user_id in range(1, claims + 1)
+            ))
+            while outbox.stats()["pending"]:
+                await asyncio.sleep(0.05)
+            elapsed = time.perf_counter() - started
+            await outbox.close()
+    print(f"{claims} claims delivered in {elapsed:.2f}s (batch size {outbox.batch_size})")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--secret", default=os.getenv("SUPABASE_WEBHOOK_SECRET", "dev-secret"))
+    parser.add_argument("--replay", type=int, default=0, help="claims to push through TaskUpdateOutbox, then exit")
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    store = TaskUpdateStore()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(store, args.secret))
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    if not args.replay:
+        print(f"Task update stand-in listening on {url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print(f"\nStopped after {store.requests} requests, {len(store.rows)} rows")
+        return
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    asyncio.run(replay(url, args.secret, args.replay, args.batch_size))
+    print(f"Stand-in received {store.requests} requests and holds {len(store.rows)} rows")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
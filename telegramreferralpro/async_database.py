@@ -0,0 +1,133 @@
+"""Non-blocking facade over the synchronous storage backends for use from bot handlers"""
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from .storage import Storage
+
+logger = logging.getLogger(__name__)
+
+class AsyncDatabase:
+    """Run blocking Storage calls on a bounded thread pool.
+
+    The supabase client performs synchronous HTTP requests, so calling it
+    directly from a coroutine stalls the event loop for every other update.
+    Each method here mirrors the Storage method of the same name and awaits
+    it on a dedicated executor, so slow round trips overlap instead of
+    serializing on the loop thread.
+    """
+
+    def __init__(self, database: Storage, max_workers: int = 8):
+        self.database = database
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run any blocking callable on the database executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def start(self) -> None:
+        """Start background work that needs the running event loop"""
+        if self.database.write_queue is not None:
+            await self.database.write_queue.start(self._executor)
+
+    async def close(self) -> None:
+        """Flush queued writes, wait for in-flight calls and release the executor threads"""
+        if self.database.write_queue is not None:
+            await self.database.write_queue.close()
+        await asyncio.get_running_loop().run_in_executor(None, functools.partial(self._executor.shutdown, wait=True))
+        self.database.close()
+        logger.info("Database executor shut down")
+
+    async def add_user(self, user_id: int, username: str = None, first_name: str = None,
+                       last_name: str = None, referral_code: str = None, referred_by: int = None) -> bool:
+        return await self.run(self.database.add_user, user_id, username=username, first_name=first_name,
+                              last_name=last_name, referral_code=referral_code, referred_by=referred_by)
+
+    async def get_user(self, user_id: int) -> Optional[dict]:
+        return await self.run(self.database.get_user, user_id)
+
+    async def get_user_by_referral_code(self, referral_code: str) -> Optional[dict]:
+        return await self.run(self.database.get_user_by_referral_code, referral_code)
+
+    async def update_channel_membership(self, user_id: int, is_member: bool) -> bool:
+        return await self.run(self.database.update_channel_membership, user_id, is_member)
+
+    async def add_referral(self, referrer_user_id: int, referred_user_id: int) -> bool:
+        return await self.run(self.database.add_referral, referrer_user_id, referred_user_id)
+
+    async def record_referral(self, referrer_code: str, user_id: int, username: str = None,
+                              first_name: str = None, last_name: str = None,
+                              referral_code: str = None) -> Tuple[str, Optional[dict]]:
+        return await self.run(self.database.record_referral, referrer_code, user_id, username=username,
+                              first_name=first_name, last_name=last_name, referral_code=referral_code)
+
+    async def get_referral_stats(self, user_id: int) -> Tuple[int, int]:
+        return await self.run(self.database.get_referral_stats, user_id)
+
+    async def get_referral_stats_many(self, user_ids: Sequence[int], referral_codes: Sequence[str] = ()
+                                      ) -> Tuple[Dict[int, Tuple[int, int]], Dict[str, int]]:
+        return await self.run(self.database.get_referral_stats_many, user_ids, referral_codes)
+
+    async def deactivate_referral(self, referrer_user_id: int, referred_user_id: int) -> bool:
+        return await self.run(self.database.deactivate_referral, referrer_user_id, referred_user_id)
+
+    async def mark_reward_claimed(self, user_id: int) -> bool:
+        return await self.run(self.database.mark_reward_claimed, user_id)
+
+    async def get_all_users_count(self) -> int:
+        return await self.run(self.database.get_all_users_count)
+
+    async def get_channel_members_count(self) -> int:
+        return await self.run(self.database.get_channel_members_count)
+
+    async def get_active_referral_target(self) -> Optional[int]:
+        return await self.run(self.database.get_active_referral_target)
+
+    async def get_setting(self, key: str) -> Optional[str]:
+        return await self.run(self.database.get_setting, key)
+
+    async def get_referral_target_by_id(self, target_id: int) -> Optional[dict]:
+        return await self.run(self.database.get_referral_target_by_id, target_id)
+
+    async def get_all_referral_targets(self) -> list:
+        return await self.run(self.database.get_all_referral_targets)
+
+    async def update_user_referral_target(self, user_id: int, target_id: int) -> bool:
+        return await self.run(self.database.update_user_referral_target, user_id, target_id)
+
+    async def mark_target_reached(self, user_id: int) -> bool:
+        return await self.run(self.database.mark_target_reached, user_id)
+
+    async def get_invite_link(self, user_id: int) -> Optional[str]:
+        return await self.run(self.database.get_invite_link, user_id)
+
+    async def get_invite_link_owner(self, invite_link: str) -> Optional[int]:
+        return await self.run(self.database.get_invite_link_owner, invite_link)
+
+    async def preload_invite_links(self) -> int:
+        return await self.run(self.database.preload_invite_links)
+
+    async def preload_referral_codes(self) -> int:
+        return await self.run(self.database.preload_referral_codes)
+
+    async def refresh_referral_codes(self) -> int:
+        return await self.run(self.database.refresh_referral_codes)
+
+    async def store_invite_link(self, user_id: int, referral_code: str, invite_link: str, link_name: str) -> bool:
+        return await self.run(self.database.store_invite_link, user_id, referral_code, invite_link, link_name)
+
+    async def log_channel_event(self, user_id: int, event_type: str) -> bool:
+        return await self.run(self.database.log_channel_event, user_id, event_type)
+
+    async def get_user_language(self, user_id: int) -> Optional[str]:
+        return await self.run(self.database.get_user_language, user_id)
+
+    async def set_user_language(self, user_id: int, language_code: str) -> bool:
+        return await self.run(self.database.set_user_language, user_id, language_code)
+
+    def cache_stats(self) -> dict:
+        return self.database.cache_stats()
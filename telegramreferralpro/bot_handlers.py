@@ -1,25 +1,41 @@
 import logging
+from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
 from telegram.ext import ContextTypes, CommandHandler, MessageHandler, filters, ChatMemberHandler, CallbackQueryHandler
 from telegram.constants import ParseMode
-from .database import Database
+from .async_database import AsyncDatabase
 from .referral_system import ReferralSystem
 from .messages import Messages
 from .supabase_utils import send_task_update_to_supabase
+from .task_outbox import TaskUpdateOutbox
 from .utils import TelegramUtils, setup_logging, escape_markdown
+from .invite_link_pool import InviteLinkPool
+from .membership import MembershipCache
+from .referrer_notifier import ReferrerNotifier
+from .send_scheduler import PRIORITY_NOTIFICATION
 from .config import BotConfig
 from .languages import LanguageManager, MultilingualMessages, SupportedLanguage
 
 logger = logging.getLogger(__name__)
 
 class BotHandlers:
-    def __init__(self, config: BotConfig, database: Database, referral_system: ReferralSystem, telegram_utils: TelegramUtils):
+    def __init__(self, config: BotConfig, database: AsyncDatabase, referral_system: ReferralSystem, telegram_utils: TelegramUtils,
+                 invite_link_pool: Optional[InviteLinkPool] = None,
+                 task_outbox: Optional[TaskUpdateOutbox] = None):
         self.config = config
         self.db = database
         self.referral_system = referral_system
         self.telegram_utils = telegram_utils
+        self.invite_link_pool = invite_link_pool
+        self.task_outbox = task_outbox
+        self.membership = MembershipCache(
+            telegram_utils, check_ttl=config.membership_check_ttl, settings=database.database.cache_settings
+        )
+        self.referrer_notifier = ReferrerNotifier(
+            database, referral_system, telegram_utils, window=config.referrer_digest_window
+        )
         self.messages = Messages()
-        self.language_manager = LanguageManager(database)
+        self.language_manager = LanguageManager(database.database)
         self.multilingual_messages = MultilingualMessages()
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -34,7 +50,7 @@ class BotHandlers:
         
         # Detect and set user language
         message_text = update.message.text if update.message.text else ""
-        user_lang = self.language_manager.detect_and_set_language(user_id, user, message_text)
+        user_lang = await self.db.run(self.language_manager.detect_and_set_language, user_id, user, message_text)
         
         # Check if this is a referral start
         referral_code = None
@@ -42,26 +58,30 @@ class BotHandlers:
             referral_code = context.args[0]
         
         # Get or create user
-        existing_user = self.db.get_user(user_id)
+        existing_user = await self.db.get_user(user_id)
         if not existing_user:
             # Create new user with referral code
             user_referral_code = self.referral_system.generate_referral_code(user_id)
-            self.db.add_user(
+            await self.db.add_user(
                 user_id=user_id,
                 username=user.username or "",
                 first_name=user.first_name or "",
                 last_name=user.last_name or "",
                 referral_code=user_referral_code
             )
-            existing_user = self.db.get_user(user_id)
+            existing_user = await self.db.get_user(user_id)
         
         # Check channel membership
-        is_member = await self.telegram_utils.check_channel_membership(user_id)
-        self.db.update_channel_membership(user_id, is_member)
+        is_member = await self.membership.is_member(user_id)
+        if not existing_user or existing_user['is_channel_member'] != is_member:
+            await self.db.update_channel_membership(user_id, is_member)
         
         # Process referral if provided
         if referral_code and existing_user and not existing_user['referred_by']:
-            success, message = self.referral_system.process_referral(referral_code, user_id)
+            success, message = await self.db.run(
+                self.referral_system.process_referral, referral_code, user_id,
+                user.username or "", user.first_name or "", user.last_name or ""
+            )
             if success:
                 await update.message.reply_text(f"✅ {message}")
             else:
@@ -84,7 +104,7 @@ class BotHandlers:
         channel_name = chat_info['title'] if chat_info else "our channel"
 
         # Get current referral target
-        referral_target = self.referral_system.get_active_referral_target()
+        referral_target = await self.db.run(self.referral_system.get_active_referral_target)
 
         message = self.multilingual_messages.get_message(
             user_lang, "welcome_existing_member",
@@ -107,17 +127,17 @@ class BotHandlers:
             return
             
         user_id = update.effective_user.id
-        user_lang = self.language_manager.get_user_language(user_id)
+        user_lang = await self.db.run(self.language_manager.get_user_language, user_id)
         
         # Check if user exists
-        user = self.db.get_user(user_id)
+        user = await self.db.get_user(user_id)
         if not user:
             message = self.multilingual_messages.get_message(user_lang, "error_register_first", fallback="❌ Please use /start first to register.")
             await update.message.reply_text(message)
             return
         
         # Check channel membership
-        is_member = await self.telegram_utils.check_channel_membership(user_id)
+        is_member = await self.membership.is_member(user_id)
         if not is_member:
             channel_link = self.telegram_utils.get_channel_link()
             message = self.multilingual_messages.get_message(
@@ -131,32 +151,32 @@ class BotHandlers:
             return
         
         # Get referral progress
-        progress = self.referral_system.get_referral_progress(user_id)
+        progress = await self.db.run(self.referral_system.get_progress, user_id)
         
         # Generate progress bar
         progress_bar_full = self.multilingual_messages.get_message(user_lang, "progress_bar_full")
         progress_bar_empty = self.multilingual_messages.get_message(user_lang, "progress_bar_empty")
-        filled = int((progress['progress_percentage'] / 100) * 10)
+        filled = int((progress.progress_percentage / 100) * 10)
         empty = 10 - filled
         progress_bar = progress_bar_full * filled + progress_bar_empty * empty
         
         # Get status text
-        if progress['target_reached']:
+        if progress.target_reached:
             status_text = self.multilingual_messages.get_message(user_lang, "status_target_reached")
-        elif progress['active_referrals'] == 0:
+        elif progress.active_referrals == 0:
             status_text = self.multilingual_messages.get_message(user_lang, "status_no_referrals")
         else:
             status_text = self.multilingual_messages.get_message(
-                user_lang, "status_progress", remaining=progress['remaining']
+                user_lang, "status_progress", remaining=progress.remaining
             )
         
         message = self.multilingual_messages.get_message(
             user_lang, "status_message",
-            active_referrals=progress['active_referrals'],
-            target=progress['target'],
-            total_referrals=progress['total_referrals'],
-            remaining=progress['remaining'],
-            progress=int(progress['progress_percentage']),
+            active_referrals=progress.active_referrals,
+            target=progress.target,
+            total_referrals=progress.total_referrals,
+            remaining=progress.remaining,
+            progress=int(progress.progress_percentage),
             progress_bar=progress_bar,
             status_text=status_text
         )
@@ -182,7 +202,7 @@ class BotHandlers:
             return
             
         user_id = query.from_user.id
-        user_lang = self.language_manager.get_user_language(user_id)
+        user_lang = await self.db.run(self.language_manager.get_user_language, user_id)
         
         logger.info(f"Button callback received: {query.data} from user {user_id}")
         await query.answer()
@@ -223,14 +243,14 @@ class BotHandlers:
         """Show status message inline"""
         try:
             # Check if user exists
-            user = self.db.get_user(user_id)
+            user = await self.db.get_user(user_id)
             if not user:
                 message = self.multilingual_messages.get_message(user_lang, "error_register_first", fallback="❌ Please use /start first to register.")
                 await query.edit_message_text(message)
                 return
             
             # Check channel membership
-            is_member = await self.telegram_utils.check_channel_membership(user_id)
+            is_member = await self.membership.is_member(user_id)
             if not is_member:
                 channel_link = self.telegram_utils.get_channel_link()
                 message = self.multilingual_messages.get_message(
@@ -244,32 +264,32 @@ class BotHandlers:
                 return
             
             # Get referral progress
-            progress = self.referral_system.get_referral_progress(user_id)
+            progress = await self.db.run(self.referral_system.get_progress, user_id)
             
             # Generate progress bar
             progress_bar_full = self.multilingual_messages.get_message(user_lang, "progress_bar_full")
             progress_bar_empty = self.multilingual_messages.get_message(user_lang, "progress_bar_empty")
-            filled = int((progress['progress_percentage'] / 100) * 10)
+            filled = int((progress.progress_percentage / 100) * 10)
             empty = 10 - filled
             progress_bar = progress_bar_full * filled + progress_bar_empty * empty
             
             # Get status text
-            if progress['target_reached']:
+            if progress.target_reached:
                 status_text = self.multilingual_messages.get_message(user_lang, "status_target_reached")
-            elif progress['active_referrals'] == 0:
+            elif progress.active_referrals == 0:
                 status_text = self.multilingual_messages.get_message(user_lang, "status_no_referrals")
             else:
                 status_text = self.multilingual_messages.get_message(
-                    user_lang, "status_progress", remaining=progress['remaining']
+                    user_lang, "status_progress", remaining=progress.remaining
                 )
             
             message = self.multilingual_messages.get_message(
                 user_lang, "status_message",
-                active_referrals=progress['active_referrals'],
-                target=progress['target'],
-                total_referrals=progress['total_referrals'],
-                remaining=progress['remaining'],
-                progress=int(progress['progress_percentage']),
+                active_referrals=progress.active_referrals,
+                target=progress.target,
+                total_referrals=progress.total_referrals,
+                remaining=progress.remaining,
+                progress=int(progress.progress_percentage),
                 progress_bar=progress_bar,
                 status_text=status_text
             )
@@ -300,7 +320,7 @@ class BotHandlers:
         """Handle reward claiming inline"""
         try:
             # Check if user exists
-            user = self.db.get_user(user_id)
+            user = await self.db.get_user(user_id)
             if not user:
                 message = self.multilingual_messages.get_message(user_lang, "error_register_first", fallback="❌ Please use /start first to register.")
                 await query.edit_message_text(message)
@@ -309,7 +329,7 @@ class BotHandlers:
             # Check if reward already claimed
             if user['reward_claimed']:
                 # Get user's stored invite link
-                stored_invite_link = self.db.get_invite_link(user_id)
+                stored_invite_link = await self.db.get_invite_link(user_id)
                 invite_link = stored_invite_link or self.telegram_utils.get_channel_link()
                 message = self.multilingual_messages.get_message(
                     user_lang, "error_reward_already_claimed", referral_link=invite_link
@@ -322,13 +342,13 @@ class BotHandlers:
                 await query.edit_message_text(message, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
                 return
             
-            # Check if target reached
-            if not self.referral_system.check_referral_target_reached(user_id):
-                progress = self.referral_system.get_referral_progress(user_id)
+            # Check if target reached (the same snapshot is used for the task update below)
+            progress = await self.db.run(self.referral_system.get_progress, user_id)
+            if not progress.target_reached:
                 message = self.multilingual_messages.get_message(
                     user_lang, "error_reward_not_available",
-                    active_referrals=progress['active_referrals'],
-                    target=progress['target']
+                    active_referrals=progress.active_referrals,
+                    target=progress.target
                 )
                 
                 # Create back button
@@ -339,13 +359,13 @@ class BotHandlers:
                 return
             
             # Claim reward
-            self.db.mark_reward_claimed(user_id)
+            await self.db.mark_reward_claimed(user_id)
             
             # Mark target reached timestamp
-            self.db.mark_target_reached(user_id)
+            await self.db.mark_target_reached(user_id)
             
             # Get user's stored invite link
-            stored_invite_link = self.db.get_invite_link(user_id)
+            stored_invite_link = await self.db.get_invite_link(user_id)
             invite_link = stored_invite_link or self.telegram_utils.get_channel_link()
             
             message = self.multilingual_messages.get_message(
@@ -361,15 +381,9 @@ class BotHandlers:
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
-            # Send update to Supabase
-            task_key = f"tg_referral_{progress['target']}"
-            await send_task_update_to_supabase(
-                config=self.config,
-                telegram_id=user_id,
-                task_key=task_key,
-                status="completed",
-                meta={"referrals_reached": progress['target']}
-            )
+            # Queue update to Supabase
+            await self._send_task_update(user_id, f"tg_referral_{progress.target}", "completed",
+                                         {"referrals_reached": progress.target})
 
             await query.edit_message_text(message, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
             logger.info(f"User {user_id} claimed their reward via inline button")
@@ -380,27 +394,16 @@ class BotHandlers:
     async def _show_referral_link_inline(self, query, user_id: int, user_lang: str) -> None:
         """Show user's referral link inline"""
         try:
-            user = self.db.get_user(user_id)
+            user = await self.db.get_user(user_id)
             if not user:
                 message = self.multilingual_messages.get_message(user_lang, "error_register_first", fallback="❌ Please use /start first to register.")
                 await query.edit_message_text(message)
                 return
             
-            # Get user's stored invite link
-            stored_invite_link = self.db.get_invite_link(user_id)
-            if stored_invite_link:
-                invite_link = stored_invite_link
-            else:
-                # Create new unique invite link if not exists
-                referral_code = user['referral_code']
-                invite_link_name = f"Referral-{referral_code}"
-                invite_link = await self.telegram_utils.create_unique_invite_link(name=invite_link_name)
-                
-                # Store the invite link in database
-                self.db.store_invite_link(user_id, referral_code, invite_link, invite_link_name)
+            invite_link = await self._get_or_create_invite_link(user)
             
             # Get current referral target
-            referral_target = self.referral_system.get_active_referral_target()
+            referral_target = await self.db.run(self.referral_system.get_active_referral_target)
 
             message = f"""🔗 **Your Unique Referral Link**
 
@@ -431,14 +434,14 @@ class BotHandlers:
         """Handle /claim command"""
         user_id = update.effective_user.id
         # Check if user exists
-        user = self.db.get_user(user_id)
+        user = await self.db.get_user(user_id)
         if not user:
             await update.message.reply_text("❌ Please use /start first to register.")
             return
         # Check if reward already claimed
         if user['reward_claimed']:
             # Get user's stored invite link
-            stored_invite_link = self.db.get_invite_link(user_id)
+            stored_invite_link = await self.db.get_invite_link(user_id)
             invite_link = stored_invite_link or self.telegram_utils.get_channel_link()
             message = self.messages.ERROR_REWARD_ALREADY_CLAIMED.format(
                 referral_link=invite_link
@@ -449,12 +452,12 @@ class BotHandlers:
                 logger.warning(f"Markdown parsing failed for reward already claimed message: {e}. Sending without formatting.")
                 await update.message.reply_text(message)
             return
-        # Check if target reached
-        if not self.referral_system.check_referral_target_reached(user_id):
-            progress = self.referral_system.get_referral_progress(user_id)
+        # Check if target reached (the same snapshot is used for the task update below)
+        progress = await self.db.run(self.referral_system.get_progress, user_id)
+        if not progress.target_reached:
             message = self.messages.ERROR_REWARD_NOT_AVAILABLE.format(
-                active_referrals=progress['active_referrals'],
-                target=progress['target']
+                active_referrals=progress.active_referrals,
+                target=progress.target
             )
             try:
                 await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
@@ -463,26 +466,20 @@ class BotHandlers:
                 await update.message.reply_text(message)
             return
         # Claim reward
-        self.db.mark_reward_claimed(user_id)
+        await self.db.mark_reward_claimed(user_id)
         # Mark target reached timestamp
-        self.db.mark_target_reached(user_id)
+        await self.db.mark_target_reached(user_id)
         # Get user's stored invite link
-        stored_invite_link = self.db.get_invite_link(user_id)
+        stored_invite_link = await self.db.get_invite_link(user_id)
         invite_link = stored_invite_link or self.telegram_utils.get_channel_link()
         message = self.messages.REWARD_CLAIMED.format(
             reward_message=self.config.reward_message,
             referral_link=invite_link
         )
 
-        # Send update to Supabase
-        task_key = f"tg_referral_{progress['target']}"
-        await send_task_update_to_supabase(
-            config=self.config,
-            telegram_id=user_id,
-            task_key=task_key,
-            status="completed",
-            meta={"referrals_reached": progress['target']}
-        )
+        # Queue update to Supabase
+        await self._send_task_update(user_id, f"tg_referral_{progress.target}", "completed",
+                                     {"referrals_reached": progress.target})
 
         try:
             await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
@@ -497,7 +494,7 @@ class BotHandlers:
             return
             
         user_id = update.effective_user.id
-        user_lang = self.language_manager.get_user_language(user_id)
+        user_lang = await self.db.run(self.language_manager.get_user_language, user_id)
         
         # Create language selection keyboard
         available_languages = self.multilingual_messages.get_available_languages()
@@ -537,7 +534,7 @@ class BotHandlers:
         lang_code = query.data.replace("lang_", "")
         
         # Set the new language
-        self.language_manager.set_user_language(user_id, lang_code)
+        await self.db.run(self.language_manager.set_user_language, user_id, lang_code)
         
         # Send confirmation in the new language
         message = self.multilingual_messages.get_message(lang_code, "language_changed")
@@ -553,7 +550,7 @@ class BotHandlers:
             return
             
         user_id = update.effective_user.id
-        user_lang = self.language_manager.get_user_language(user_id)
+        user_lang = await self.db.run(self.language_manager.get_user_language, user_id)
         
         message = self.multilingual_messages.get_message(user_lang, "help_message")
         try:
@@ -571,8 +568,8 @@ class BotHandlers:
             return
         
         # Get statistics
-        total_users = self.db.get_all_users_count()
-        channel_members = self.db.get_channel_members_count()
+        total_users = await self.db.get_all_users_count()
+        channel_members = await self.db.get_channel_members_count()
         # Use database methods to get referral stats instead of direct SQL
         # For now, we'll use a placeholder since we don't have a direct method for this
         total_referrals = 0  # This would need a specific database method
@@ -604,9 +601,11 @@ class BotHandlers:
 
         # Handle channel join/leave
         if chat_id == self.config.channel_id:
+            self.membership.record(user_id, new_status in ['member', 'administrator', 'creator'])
+
             # User joined the channel
             if old_status in ['left', 'kicked'] and new_status in ['member', 'administrator', 'creator']:
-                await self._handle_channel_join(user_id)
+                await self._handle_channel_join(user_id, result.invite_link, result.new_chat_member.user)
 
             # User left the channel
             elif old_status in ['member', 'administrator', 'creator'] and new_status in ['left', 'kicked']:
@@ -627,18 +626,26 @@ class BotHandlers:
             elif old_status in ['member', 'administrator', 'creator'] and new_status in ['left', 'kicked']:
                 logger.info(f"User {user_id} left the group")
 
-    async def _handle_channel_join(self, user_id: int) -> None:
+    async def _handle_channel_join(self, user_id: int, invite_link=None, telegram_user=None) -> None:
         """Handle user joining the channel"""
         logger.info(f"User {user_id} joined the channel")
 
-        # Update database and check for referral
-        referrer_id = self.referral_system.handle_user_joined_channel(user_id)
+        # Update database and check for referral, crediting the owner of the invite link used
+        referrer_id = await self.db.run(
+            self.referral_system.handle_user_joined_channel,
+            user_id,
+            invite_link=invite_link.invite_link if invite_link else None,
+            invite_link_name=invite_link.name if invite_link else None,
+            username=getattr(telegram_user, 'username', None),
+            first_name=getattr(telegram_user, 'first_name', None),
+            last_name=getattr(telegram_user, 'last_name', None)
+        )
 
         # Send welcome or group join message if user exists in our system
-        user = self.db.get_user(user_id)
+        user = await self.db.get_user(user_id)
         if user:
             try:
-                user_lang = self.language_manager.get_user_language(user_id)
+                user_lang = await self.db.run(self.language_manager.get_user_language, user_id)
 
                 # If group is configured, ask user to join the group first
                 if self.config.group_id and self.config.group_username:
@@ -667,19 +674,11 @@ Once you join the group, I'll send you your referral link and you can start earn
         logger.info(f"User {user_id} left the channel")
 
         # Update database and notify affected referrers
-        affected_referrers = self.referral_system.handle_user_left_channel(user_id)
+        affected_referrers = await self.db.run(self.referral_system.handle_user_left_channel, user_id)
 
-        # Notify referrers about the change
+        # Notify referrers about the change (coalesced into a digest)
         for ref_id in affected_referrers:
-            try:
-                progress = self.referral_system.get_referral_progress(ref_id)
-                notify_message = (
-                    "📉 One of your referrals left the channel.\n\n"
-                    f"Your current progress: {progress['active_referrals']}/{progress['target']}"
-                )
-                await self.telegram_utils.send_message_safe(ref_id, notify_message)
-            except Exception as e:
-                logger.error(f"Error notifying referrer {ref_id}: {e}")
+            self.referrer_notifier.left(ref_id)
 
     async def _handle_group_join(self, user_id: int, username: str = None, full_name: str = None) -> None:
         """Handle user joining the group
@@ -692,26 +691,26 @@ Once you join the group, I'll send you your referral link and you can start earn
         logger.info(f"User {user_id} joined the group (username={username})")
 
         # Try to find user in DB
-        user = self.db.get_user(user_id)
+        user = await self.db.get_user(user_id)
 
         # If user not found, create minimal record so they have a referral code
         if not user:
             try:
                 referral_code = self.referral_system.generate_referral_code(user_id)
-                self.db.add_user(
+                await self.db.add_user(
                     user_id=user_id,
                     username=username or '',
                     first_name=full_name or '',
                     referral_code=referral_code
                 )
-                user = self.db.get_user(user_id)
+                user = await self.db.get_user(user_id)
             except Exception as e:
                 logger.warning(f"Could not create DB user for {user_id}: {e}")
 
         # Attempt to send DM with referral link
         if user:
             try:
-                user_lang = self.language_manager.get_user_language(user_id)
+                user_lang = await self.db.run(self.language_manager.get_user_language, user_id)
                 sent = await self._send_channel_join_welcome(user, user_lang, user.get('referred_by'))
 
                 if not sent:
@@ -747,7 +746,9 @@ Once you join the group, I'll send you your referral link and you can start earn
                                 "Tap 'Get my referral link' below to start the bot and claim your unique link.\n"
                                 "#YourReferralsYourNetwork"
                             )
-                            await self.telegram_utils.bot.send_message(self.config.group_id, group_msg, reply_markup=reply_markup)
+                            await self.telegram_utils.send_message_safe(
+                                self.config.group_id, group_msg, priority=PRIORITY_NOTIFICATION, reply_markup=reply_markup
+                            )
                         else:
                             # Fallback textual message when button/username is not available
                             botref = f" @{bot_username}" if bot_username else ''
@@ -757,12 +758,39 @@ Once you join the group, I'll send you your referral link and you can start earn
                                 f"To receive your referral link, please message the bot{botref} and type /start.\n"
                                 "#YourReferralsYourNetwork"
                             )
-                            await self.telegram_utils.bot.send_message(self.config.group_id, group_msg)
+                            await self.telegram_utils.send_message_safe(
+                                self.config.group_id, group_msg, priority=PRIORITY_NOTIFICATION
+                            )
                     except Exception as e:
                         logger.error(f"Failed to send fallback group message for user {user_id}: {e}")
             except Exception as e:
                 logger.error(f"Error processing group join for user {user_id}: {e}")
 
+    async def _send_task_update(self, user_id: int, task_key: str, status: str, meta: dict) -> None:
+        """Hand a task update to the outbox, which delivers it in the background"""
+        if self.task_outbox is not None:
+            await self.task_outbox.enqueue(user_id, task_key, status, meta)
+        else:
+            await send_task_update_to_supabase(self.config, user_id, task_key, status, meta)
+
+    async def _get_or_create_invite_link(self, user: dict) -> str:
+        """Return the user's stored invite link, handing out a new one if they have none"""
+        user_id = user['user_id']
+        stored_invite_link = await self.db.get_invite_link(user_id)
+        if stored_invite_link:
+            return stored_invite_link
+        
+        referral_code = user['referral_code']
+        invite_link_name = f"Referral-{referral_code}"
+        if self.invite_link_pool is not None:
+            invite_link = await self.invite_link_pool.acquire(invite_link_name)
+        else:
+            invite_link = await self.telegram_utils.create_unique_invite_link(name=invite_link_name)
+        
+        # Store the invite link in database
+        await self.db.store_invite_link(user_id, referral_code, invite_link, invite_link_name)
+        return invite_link
+
     async def _send_channel_join_welcome(self, user, user_lang: str, referrer_id: int = None) -> bool:
         """Send welcome message with referral link after user joins. Returns True if DM was sent."""
         if not user:
@@ -771,23 +799,13 @@ Once you join the group, I'll send you your referral link and you can start earn
         try:
             user_id = user['user_id']
             # Get or create unique invite link for this user
-            stored_invite_link = self.db.get_invite_link(user_id)
-            if stored_invite_link:
-                referral_link = stored_invite_link
-            else:
-                # Create new unique invite link
-                referral_code = user['referral_code']
-                invite_link_name = f"Referral-{referral_code}"
-                referral_link = await self.telegram_utils.create_unique_invite_link(name=invite_link_name)
-
-                # Store the invite link in database
-                self.db.store_invite_link(user_id, referral_code, referral_link, invite_link_name)
+            referral_link = await self._get_or_create_invite_link(user)
 
             chat_info = await self.telegram_utils.get_chat_info()
             channel_name = chat_info['title'] if chat_info else "our channel"
 
             # Get current referral target
-            referral_target = self.referral_system.get_active_referral_target()
+            referral_target = await self.db.run(self.referral_system.get_active_referral_target)
             message = self.multilingual_messages.get_message(
                 user_lang,
                 "channel_joined_success",
@@ -804,19 +822,9 @@ Once you join the group, I'll send you your referral link and you can start earn
                 except Exception:
                     sent = False
 
-            # Notify referrer if applicable
+            # Notify referrer if applicable (coalesced into a digest)
             if referrer_id:
-                referrer = self.db.get_user(referrer_id)
-                if referrer:
-                    progress = self.referral_system.get_referral_progress(referrer_id)
-                    if progress['target_reached'] and not referrer['reward_claimed']:
-                        notify_message = self.messages.REWARD_AVAILABLE
-                    else:
-                        notify_message = (
-                            "🎉 Great news! Someone joined using your referral link!\n\n"
-                            f"Your progress: {progress['active_referrals']}/{progress['target']}"
-                        )
-                    await self.telegram_utils.send_message_safe(referrer_id, notify_message)
+                self.referrer_notifier.joined(referrer_id)
 
             return bool(sent)
         except Exception as e:
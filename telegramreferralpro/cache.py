@@ -0,0 +1,167 @@
+"""Bounded in-memory caches with LRU eviction, TTL and a memory budget"""
+
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+@dataclass
+class CacheSettings:
+    """Limits applied to each cache instance"""
+    max_entries: int = 50000
+    ttl: Optional[float] = 3600.0
+    max_bytes: Optional[int] = None
+
+def estimate_size(value: Any) -> int:
+    """Rough deep size of a cached value in bytes"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(estimate_size(item) for item in value)
+    elif hasattr(value, "__slots__"):
+        size += sum(estimate_size(getattr(value, slot, None)) for slot in value.__slots__)
+    return size
+
+class BoundedCache:
+    """Thread-safe LRU cache bounded by entry count, age and estimated size.
+
+    ``loader(key)`` is called on a miss (read-through) and ``writer(key, value)``
+    on every ``set`` (write-through), so an evicted entry can always be
+    reloaded from the backing store. Writer failures are logged and the value
+    is still cached, matching how the database layer tolerates RLS errors.
+    """
+
+    def __init__(self, name: str, settings: Optional[CacheSettings] = None,
+                 loader: Optional[Callable[[Hashable], Any]] = None,
+                 writer: Optional[Callable[[Hashable, Any], Any]] = None,
+                 sizeof: Callable[[Any], int] = estimate_size):
+        settings = settings or CacheSettings()
+        self.name = name
+        self.max_entries = settings.max_entries
+        self.ttl = settings.ttl
+        self.max_bytes = settings.max_bytes
+        self._loader = loader
+        self._writer = writer
+        self._sizeof = sizeof
+        self._lock = threading.RLock()
+        # key -> (value, expires_at, size)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a cached value, loading it from the backing store on a miss"""
+        value = self.peek(key, _MISSING)
+        if value is not _MISSING:
+            with self._lock:
+                self.hits += 1
+            return value
+        with self._lock:
+            self.misses += 1
+        if self._loader is None:
+            return default
+        try:
+            value = self._loader(key)
+        except Exception as e:
+            logger.warning(f"Cache {self.name}: could not load {key!r}: {e}")
+            return default
+        if value is None:
+            return default
+        self._store(key, value)
+        return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Return a cached value without loading or counting a hit/miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Write a value through to the backing store and cache it"""
+        if self._writer is not None:
+            try:
+                self._writer(key, value)
+            except Exception as e:
+                logger.warning(f"Cache {self.name}: could not write {key!r} to backing store: {e}")
+        self._store(key, value)
+
+    def touch(self, key: Hashable) -> None:
+        """Re-account the size of a value that was mutated in place"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._store(key, entry[0], expires_at=entry[1])
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._remove(key)
+            return entry[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.peek(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _store(self, key: Hashable, value: Any, expires_at: Optional[float] = None) -> None:
+        if expires_at is None and self.ttl:
+            expires_at = time.monotonic() + self.ttl
+        size = self._sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            self._evict()
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _evict(self) -> None:
+        # Never evict the entry that was just written
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
@@ -20,12 +20,34 @@ class BotConfig:
     referral_target: int = 5
     reward_message: str = "🎉 Congratulations! You've reached your referral target and earned your reward!"
     database_path: str = "bot_database.db"
+    storage_backend: str = "supabase"
     webhook_url: Optional[str] = None
     supabase_webhook_url: Optional[str] = None
     supabase_webhook_secret: Optional[str] = None
     port: int = 8000
     group_id: Optional[str] = None
     group_username: Optional[str] = None
+    db_max_workers: int = 8
+    cache_max_entries: int = 50000
+    cache_ttl_seconds: Optional[float] = 3600.0
+    cache_max_bytes: Optional[int] = None
+    write_behind_enabled: bool = True
+    write_batch_size: int = 200
+    write_flush_interval: float = 1.0
+    write_behind_spill_path: str = "write_behind_spill.jsonl"
+    settings_cache_ttl: float = 60.0
+    invite_link_pool_size: int = 20
+    invite_link_pool_low_water: int = 5
+    invite_link_pool_interval: float = 1.0
+    membership_check_ttl: float = 300.0
+    chat_info_ttl: float = 600.0
+    send_rate_limit: int = 30
+    referrer_digest_window: float = 30.0
+    referral_code_secret: Optional[str] = None
+    referral_code_filter_capacity: int = 1000000
+    referral_code_filter_refresh_interval: float = 30.0
+    task_outbox_path: str = "task_outbox.db"
+    supabase_webhook_batch_size: int = 200
 
 def load_config() -> BotConfig:
     """Load configuration from environment variables"""
@@ -49,6 +71,19 @@ def load_config() -> BotConfig:
     
     # Allow database path to be configured via environment variable for production
     database_path = os.getenv("DATABASE_PATH", "bot_database.db")
+    # Other files that must survive restarts default to the same (persistent) directory
+    data_directory = os.path.dirname(database_path)
+    
+    # "supabase" (default), "sqlite" for a single-node deployment using database_path,
+    # or "memory" for local runs that keep nothing
+    storage_backend = os.getenv("STORAGE_BACKEND", "supabase").lower()
+    if storage_backend not in ("supabase", "sqlite", "memory"):
+        raise ValueError("STORAGE_BACKEND must be 'supabase', 'sqlite' or 'memory'")
+    
+    # In-memory cache limits (a TTL or budget of 0 disables that limit)
+    cache_ttl_seconds = float(os.getenv("CACHE_TTL_SECONDS", "3600")) or None
+    cache_max_mb = float(os.getenv("CACHE_MAX_MB", "0"))
+    cache_max_bytes = int(cache_max_mb * 1024 * 1024) if cache_max_mb > 0 else None
     
     return BotConfig(
         bot_token=bot_token,
@@ -58,10 +93,33 @@ def load_config() -> BotConfig:
         referral_target=referral_target,
         reward_message=reward_message,
         database_path=database_path,
+        storage_backend=storage_backend,
         supabase_webhook_url=os.getenv("SUPABASE_WEBHOOK_URL"),
         supabase_webhook_secret=os.getenv("SUPABASE_WEBHOOK_SECRET"),
         webhook_url=os.getenv("WEBHOOK_URL"),
         port=int(os.getenv("PORT", "8000")),
         group_id=os.getenv("GROUP_ID"),
-        group_username=os.getenv("GROUP_USERNAME")
+        group_username=os.getenv("GROUP_USERNAME"),
+        db_max_workers=int(os.getenv("DB_MAX_WORKERS", "8")),
+        cache_max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "50000")),
+        cache_ttl_seconds=cache_ttl_seconds,
+        cache_max_bytes=cache_max_bytes,
+        write_behind_enabled=os.getenv("WRITE_BEHIND_ENABLED", "true").lower() in ("1", "true", "yes"),
+        write_batch_size=int(os.getenv("WRITE_BATCH_SIZE", "200")),
+        write_flush_interval=float(os.getenv("WRITE_FLUSH_INTERVAL", "1.0")),
+        write_behind_spill_path=os.getenv("WRITE_BEHIND_SPILL_PATH",
+                                          os.path.join(data_directory, "write_behind_spill.jsonl")),
+        settings_cache_ttl=float(os.getenv("SETTINGS_CACHE_TTL", "60")),
+        invite_link_pool_size=int(os.getenv("INVITE_LINK_POOL_SIZE", "20")),
+        invite_link_pool_low_water=int(os.getenv("INVITE_LINK_POOL_LOW_WATER", "5")),
+        invite_link_pool_interval=float(os.getenv("INVITE_LINK_POOL_INTERVAL", "1.0")),
+        membership_check_ttl=float(os.getenv("MEMBERSHIP_CHECK_TTL", "300")),
+        chat_info_ttl=float(os.getenv("CHAT_INFO_TTL", "600")),
+        send_rate_limit=int(os.getenv("SEND_RATE_LIMIT", "30")),
+        referrer_digest_window=float(os.getenv("REFERRER_DIGEST_WINDOW", "30")),
+        referral_code_secret=os.getenv("REFERRAL_CODE_SECRET") or None,
+        referral_code_filter_capacity=int(os.getenv("REFERRAL_CODE_FILTER_CAPACITY", "1000000")),
+        referral_code_filter_refresh_interval=float(os.getenv("REFERRAL_CODE_FILTER_REFRESH_INTERVAL", "30")),
+        task_outbox_path=os.getenv("TASK_OUTBOX_PATH", os.path.join(data_directory, "task_outbox.db")),
+        supabase_webhook_batch_size=int(os.getenv("SUPABASE_WEBHOOK_BATCH_SIZE", "200"))
     )
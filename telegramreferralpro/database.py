@@ -1,35 +1,151 @@
-from typing import Optional, Tuple
+from typing import Dict, Optional, Sequence, Tuple
+from datetime import datetime, timezone
 import logging
-import hashlib
-import secrets
+import threading
+import time
+from .bloom import BloomFilter
+from .cache import BoundedCache, CacheSettings
+from .referral_codes import ReferralCodec, generate_legacy_referral_code, is_signed_code
+from .referral_store import ReferralStore
+from .storage import REFERRAL_ALREADY_REFERRED, REFERRAL_INVALID_CODE, REFERRAL_RECORDED, REFERRAL_SELF
+from .write_behind import WriteBehindQueue
 
 logger = logging.getLogger(__name__)
 
+# How long an unknown referral code is remembered before Supabase is asked again
+UNKNOWN_REFERRAL_CODE_TTL = 300
+UNKNOWN_REFERRAL_CODE_LIMIT = 10000
+
+# Rows per request when preloading invite links (PostgREST's default max-rows)
+INVITE_LINK_PAGE_SIZE = 1000
+
+# Settings and referral targets change rarely; a settings_version bump invalidates sooner
+SETTINGS_CACHE_TTL = 60
+
+# Settings row a database trigger bumps whenever settings or referral targets change
+SETTINGS_VERSION_KEY = "settings_version"
+# Most seconds between reads of that row while settings are being watched
+SETTINGS_VERSION_CHECK_INTERVAL = 5
+
+# Issued referral codes the Bloom filter is sized for (0 disables it)
+REFERRAL_CODE_FILTER_CAPACITY = 1000000
+REFERRAL_CODE_FILTER_ERROR_RATE = 0.001
+USER_PAGE_SIZE = 1000
+
+_UNCACHED = object()
+
+def generate_referral_code(user_id: int) -> str:
+    """Fallback code for users added without one (callers normally pass ReferralSystem's)"""
+    # Older rows used user_{user_id}_{hash}, which exposed the Telegram ID
+    return generate_legacy_referral_code(user_id)
+
 class Database:
-    def __init__(self):
-        from .supabase_client import supabase
-        self.client = supabase
-        # In-memory storage for testing when RLS prevents writes
-        self._users_cache = {}
-        self._referrals_cache = {}
-        self._invite_links_cache = {}
-        self._channel_events_cache = {}
+    def __init__(self, cache_settings: Optional[CacheSettings] = None, settings_ttl: float = SETTINGS_CACHE_TTL,
+                 client=None, referral_code_filter_capacity: int = REFERRAL_CODE_FILTER_CAPACITY,
+                 referral_codec: Optional[ReferralCodec] = None, referral_count_ttl: Optional[float] = None):
+        if client is None:
+            from .supabase_client import supabase as client
+        # Any object with the supabase-py table API (see fake_postgrest for an offline one)
+        self.client = client
+        self.cache_settings = cache_settings or CacheSettings()
+        # Bounded in-memory caches; every write also goes to Supabase so
+        # evicted entries can be reloaded
+        self._users_cache = BoundedCache("users", self.cache_settings)
+        self._referral_code_index = BoundedCache("referral_codes", self.cache_settings)  # referral_code -> user_id
+        self._unknown_referral_codes = BoundedCache(
+            "unknown_referral_codes",
+            CacheSettings(max_entries=UNKNOWN_REFERRAL_CODE_LIMIT, ttl=UNKNOWN_REFERRAL_CODE_TTL)
+        )
+        # Referral counts follow the cache TTL unless referral_count_ttl is given; 0 turns
+        # them off for processes that must see referrals other processes record
+        count_settings = self.cache_settings
+        if referral_count_ttl:
+            count_settings = CacheSettings(max_entries=self.cache_settings.max_entries, ttl=referral_count_ttl,
+                                           max_bytes=self.cache_settings.max_bytes)
+        self._referrals = ReferralStore(count_settings, enabled=referral_count_ttl != 0)
+        self._invite_links_cache = BoundedCache("invite_links", self.cache_settings, loader=self._load_invite_link)
+        self._invite_link_owners = BoundedCache("invite_link_owners", self.cache_settings)  # invite_link -> user_id
+        self._channel_events_cache = BoundedCache("channel_events", self.cache_settings)
+        self._settings_cache = BoundedCache("settings", CacheSettings(max_entries=256, ttl=settings_ttl))
+        # Last settings_version seen and when; None until watch_settings_changes runs
+        self._settings_version: Optional[str] = None
+        self._settings_version_checked_at: Optional[float] = None
+        # Every issued referral code, so unknown /start payloads are rejected
+        # without a query; consulted only once preload_referral_codes has run
+        self._referral_code_filter: Optional[BloomFilter] = None
+        if referral_code_filter_capacity > 0:
+            self._referral_code_filter = BloomFilter(referral_code_filter_capacity, REFERRAL_CODE_FILTER_ERROR_RATE)
+        self._referral_code_filter_ready = False
+        # Keyset position for refresh_referral_codes: (re-read from, last id seen)
+        self._referral_code_filter_position: Tuple[Optional[int], Optional[int]] = (None, None)
+        # Signed codes are checked against their HMAC instead of the filter
+        self.referral_codec = referral_codec
+        self.rejected_referral_codes = 0
+        # Optional batching of inserts; see enable_write_behind
+        self.write_queue: Optional[WriteBehindQueue] = None
+        # Users whose queued insert is not stored yet, and changes to apply once it is
+        self._queued_users: set = set()
+        self._user_updates_after_insert: Dict[int, dict] = {}
+        self._queued_users_lock = threading.Lock()
+    
+    def enable_write_behind(self, queue: WriteBehindQueue) -> None:
+        """Buffer user and referral inserts in a write-behind queue instead of inserting inline"""
+        queue.register("users", on_conflict="user_id", on_written=self._user_rows_written)
+        # A user is referred at most once, so a row already written is skipped, not a batch error
+        queue.register("referrals", on_conflict="referred_id", prepare=self._prepare_referral_rows,
+                       on_written=self._referral_rows_written)
+        self.write_queue = queue
+    
+    def _prepare_referral_rows(self, rows: list) -> Tuple[list, list]:
+        """Resolve Telegram user IDs in queued referrals to users.id with one query"""
+        user_ids = {row["referrer_user_id"] for row in rows} | {row["referred_user_id"] for row in rows}
+        response = self.client.table("users").select("id,user_id").in_("user_id", list(user_ids)).execute()
+        internal_ids = {user["user_id"]: user["id"] for user in response.data}
+        ready, deferred = [], []
+        for row in rows:
+            referrer_internal_id = internal_ids.get(row["referrer_user_id"])
+            referred_internal_id = internal_ids.get(row["referred_user_id"])
+            if referrer_internal_id is None or referred_internal_id is None:
+                # The users rows may still be waiting in the queue
+                deferred.append(row)
+                continue
+            ready.append({
+                "referrer_id": referrer_internal_id,
+                "referred_id": referred_internal_id,
+                "is_active": row["is_active"]
+            })
+        return ready, deferred
+    
+    def _user_rows_written(self, rows: list) -> None:
+        """Apply the field changes that were waiting for these users' rows"""
+        with self._queued_users_lock:
+            for row in rows:
+                self._queued_users.discard(row["user_id"])
+                fields = self._user_updates_after_insert.pop(row["user_id"], None)
+                if fields:
+                    # Under the lock, so a later update cannot be overwritten by this one
+                    self._write_user_fields(row["user_id"], fields)
+    
+    def _referral_rows_written(self, rows: list) -> None:
+        """Queued referrals are now counted by Supabase; reload counts that may have missed them"""
+        for referrer_user_id in {row["referrer_user_id"] for row in rows}:
+            self._referrals.invalidate(referrer_user_id)
     
     def _generate_user_referral_code(self, user_id: int) -> str:
         """Generate a referral code for a user based on their user_id"""
-        # Create a unique code based on user ID and random salt
-        salt = secrets.token_hex(4)
-        raw_code = f"{user_id}_{salt}"
-        hash_code = hashlib.sha256(raw_code.encode()).hexdigest()[:12]
-        return f"user_{user_id}_{hash_code}"
+        return generate_referral_code(user_id)
     
     def add_user(self, user_id: int, username: str = None, first_name: str = None, 
                  last_name: str = None, referral_code: str = None, referred_by: int = None) -> bool:
         """Add a new user to the database"""
         try:
-            # Generate referral code if not provided
+            previous = self._users_cache.peek(user_id)
+            # Generate referral code if not provided; a known user keeps theirs
             if not referral_code:
-                referral_code = self._generate_user_referral_code(user_id)
+                referral_code = previous["referral_code"] if previous and previous.get("referral_code") \
+                    else self._generate_user_referral_code(user_id)
+            if referred_by is None and previous:
+                referred_by = previous.get("referred_by")
             
             # Store in memory cache for testing
             user_data = {
@@ -39,24 +155,39 @@ class Database:
                 "first_name": first_name,
                 "last_name": last_name,
                 "referral_code": referral_code,
-                "referred_by": referred_by
+                "referred_by": referred_by,
+                "is_channel_member": False,
+                "reward_claimed": False
             }
-            self._users_cache[user_id] = user_data
+            if previous:
+                # Refresh the profile but keep the database ID and channel/reward state
+                profile = {k: v for k, v in user_data.items()
+                           if k in ("username", "first_name", "last_name") and v is not None}
+                user_data = {**previous, **profile, "referral_code": referral_code, "referred_by": referred_by}
+            if previous and previous.get("referral_code") != referral_code:
+                self._referral_code_index.pop(previous.get("referral_code"))
+            self._cache_user(user_data)
             
             # Try to insert into actual database (may fail due to RLS or schema issues)
             try:
                 db_user_data = {
+                    "user_id": user_id,
+                    "username": username,
+                    "first_name": first_name,
+                    "last_name": last_name,
                     "referral_code": referral_code,
                 }
                 
                 # Add referred_by only if provided
                 if referred_by is not None:
-                    # Get the internal ID of the referrer
-                    referrer = self.get_user(referred_by)
-                    if referrer and "id" in referrer:
-                        db_user_data["referred_by"] = referrer["id"]
+                    db_user_data["referred_by_user_id"] = referred_by
                 
-                self.client.table("users").insert(db_user_data).execute()
+                if self.write_queue is not None:
+                    with self._queued_users_lock:
+                        self._queued_users.add(user_id)
+                    self.write_queue.enqueue("users", db_user_data)
+                else:
+                    self.client.table("users").insert(db_user_data).execute()
             except Exception as e:
                 logger.warning(f"Could not insert user {user_id} into database (RLS or schema issue): {e}")
             
@@ -69,16 +200,22 @@ class Database:
         """Get user by user_id"""
         try:
             # Check memory cache first
-            if user_id in self._users_cache:
-                return self._users_cache[user_id]
+            user = self._users_cache.get(user_id)
+            if user is not None:
+                return user
             
-            # Try to get from actual database
-            response = self.client.table("users").select("*").like("referral_code", f"user_{user_id}_%").execute()
+            # Try to get from actual database using the unique user_id index
+            try:
+                response = self.client.table("users").select("*").eq("user_id", user_id).limit(1).execute()
+            except Exception as e:
+                # Fallback for databases that predate the user_id column
+                logger.warning(f"user_id lookup failed, using referral_code pattern fallback: {e}")
+                response = self.client.table("users").select("*").like("referral_code", f"user_{user_id}_%").execute()
             if response.data:
                 user = response.data[0]
                 # Add user_id to the returned data for compatibility
                 user["user_id"] = user_id
-                return user
+                return self._cache_user(self._user_from_row(user))
             return None
         except Exception as e:
             logger.error(f"Error getting user {user_id}: {e}")
@@ -88,16 +225,22 @@ class Database:
         """Get user by referral code"""
         try:
             # Check memory cache first
-            for user in self._users_cache.values():
-                if user.get("referral_code") == referral_code:
+            user_id = self._referral_code_index.get(referral_code)
+            if user_id is not None:
+                user = self._users_cache.get(user_id)
+                if user is not None and user.get("referral_code") == referral_code:
                     return user
             
+            # Skip the round trip for codes we recently failed to find or never issued
+            if self._unknown_referral_codes.get(referral_code) or not self._referral_code_may_exist(referral_code):
+                return None
+            
             # Try to get from actual database
             response = self.client.table("users").select("*").eq("referral_code", referral_code).execute()
             if response.data:
                 user = response.data[0]
-                # Try to extract user_id from referral_code if it follows our pattern
-                if referral_code.startswith("user_"):
+                # Rows inserted before the user_id column existed only carry it in the code
+                if user.get("user_id") is None and referral_code.startswith("user_"):
                     try:
                         # Format: user_{user_id}_{hash}
                         parts = referral_code.split("_")
@@ -105,21 +248,83 @@ class Database:
                             user["user_id"] = int(parts[1])
                     except:
                         pass
+                if user.get("user_id") is not None:
+                    return self._cache_user(self._user_from_row(user))
                 return user
+            self._unknown_referral_codes.set(referral_code, True)
             return None
         except Exception as e:
             logger.error(f"Error getting user by referral code {referral_code}: {e}")
             return None
     
+    def _user_from_row(self, row: dict) -> dict:
+        """Convert a Supabase users row into the shape kept in the users cache"""
+        return {
+            "id": row.get("id"),
+            "user_id": row.get("user_id"),
+            "username": row.get("username"),
+            "first_name": row.get("first_name"),
+            "last_name": row.get("last_name"),
+            "referral_code": row.get("referral_code"),
+            "referred_by": row.get("referred_by_user_id"),
+            "is_channel_member": bool(row.get("is_channel_member")),
+            "reward_claimed": bool(row.get("reward_claimed")),
+            "referral_target_id": row.get("referral_target_id"),
+            "target_reached_at": row.get("target_reached_at"),
+        }
+    
+    def _cache_user(self, user: dict) -> dict:
+        """Store a user in the cache and index its referral code"""
+        self._users_cache.set(user["user_id"], user)
+        if user.get("referral_code"):
+            self._referral_code_index.set(user["referral_code"], user["user_id"])
+            self._unknown_referral_codes.pop(user["referral_code"])
+            if self._referral_code_filter is not None:
+                self._referral_code_filter.add(user["referral_code"])
+        return user
+    
+    def _referral_code_may_exist(self, referral_code: str) -> bool:
+        """False only for codes that were certainly never issued.
+        
+        Signed codes are valid exactly when their HMAC matches. Every other
+        code must be in the filter, which refresh_referral_codes keeps up to
+        date with codes other processes (the API server, another bot) issue.
+        """
+        if self.referral_codec is not None and is_signed_code(referral_code):
+            exists = self.referral_codec.decode(referral_code) is not None
+        elif self._referral_code_filter is None or not self._referral_code_filter_ready:
+            return True
+        else:
+            exists = referral_code in self._referral_code_filter
+        if not exists:
+            self.rejected_referral_codes += 1
+        return exists
+    
+    def _update_user_fields(self, user_id: int, fields: dict) -> None:
+        """Apply field changes to the cached user and write them through to Supabase"""
+        user = self._users_cache.peek(user_id)
+        if user is not None:
+            user.update(fields)
+            self._users_cache.touch(user_id)
+        if self.write_queue is not None:
+            with self._queued_users_lock:
+                if user_id in self._queued_users:
+                    # An UPDATE would match no row until the queued insert is
+                    # flushed, so apply it once the row is stored
+                    self._user_updates_after_insert.setdefault(user_id, {}).update(fields)
+                    return
+        self._write_user_fields(user_id, fields)
+    
+    def _write_user_fields(self, user_id: int, fields: dict) -> None:
+        try:
+            self.client.table("users").update(fields).eq("user_id", user_id).execute()
+        except Exception as e:
+            logger.warning(f"Could not update user {user_id} in database (RLS or schema issue): {e}")
+    
     def update_channel_membership(self, user_id: int, is_member: bool) -> bool:
         """Update user's channel membership status"""
         try:
-            # Update memory cache
-            if user_id in self._users_cache:
-                self._users_cache[user_id]["is_channel_member"] = is_member
-            
-            # Since is_channel_member column doesn't exist, we'll skip database update
-            logger.warning(f"Skipping channel membership update for user {user_id} - column doesn't exist")
+            self._update_user_fields(user_id, {"is_channel_member": is_member})
             return True
         except Exception as e:
             logger.error(f"Error updating channel membership for user {user_id}: {e}")
@@ -128,13 +333,18 @@ class Database:
     def add_referral(self, referrer_user_id: int, referred_user_id: int) -> bool:
         """Add a referral relationship"""
         try:
-            # Store in memory cache
-            referral_key = f"{referrer_user_id}_{referred_user_id}"
-            self._referrals_cache[referral_key] = {
-                "referrer_id": referrer_user_id,
-                "referred_id": referred_user_id,
-                "is_active": True
-            }
+            if self.write_queue is not None:
+                # Supabase will not count the queued row until it is flushed, so the
+                # referrer's counts must be cached before this referral is added to them
+                if not self._referrals.is_loaded(referrer_user_id):
+                    self.get_referral_stats(referrer_user_id)
+                self._referrals.add(referrer_user_id, referred_user_id)
+                self.write_queue.enqueue("referrals", {
+                    "referrer_user_id": referrer_user_id,
+                    "referred_user_id": referred_user_id,
+                    "is_active": True
+                })
+                return True
             
             # Try to add to actual database
             try:
@@ -156,63 +366,202 @@ class Database:
             except Exception as e:
                 logger.warning(f"Could not insert referral into database (RLS or schema issue): {e}")
             
+            # Counted after the insert, so a concurrent read either sees the row or is discarded
+            self._referrals.add(referrer_user_id, referred_user_id)
             return True
         except Exception as e:
             logger.error(f"Error adding referral: {e}")
             return False
     
+    def record_referral(self, referrer_code: str, user_id: int, username: str = None,
+                        first_name: str = None, last_name: str = None,
+                        referral_code: str = None) -> Tuple[str, Optional[dict]]:
+        """Credit the owner of referrer_code for user_id with one process_referral RPC"""
+        if self._referral_code_index.peek(referrer_code) is None and not self._referral_code_may_exist(referrer_code):
+            return REFERRAL_INVALID_CODE, None
+        cached_user = self._users_cache.peek(user_id)
+        if cached_user and cached_user.get("referral_code"):
+            referral_code = cached_user["referral_code"]
+        elif not referral_code:
+            referral_code = self._generate_user_referral_code(user_id)
+        try:
+            response = self.client.rpc("process_referral", {
+                "p_referrer_code": referrer_code,
+                "p_user_id": user_id,
+                "p_username": username,
+                "p_first_name": first_name,
+                "p_last_name": last_name,
+                "p_referral_code": referral_code,
+            }).execute()
+            result = response.data[0]
+        except Exception as e:
+            # Fallback if the process_referral function isn't deployed yet
+            logger.warning(f"process_referral RPC unavailable, using individual queries: {e}")
+            return self._record_referral_with_queries(referrer_code, user_id, username, first_name, last_name,
+                                                      referral_code)
+
+        status = result["status"]
+        if status == REFERRAL_INVALID_CODE:
+            # The referrer's row may still be waiting in the write-behind queue
+            if self.write_queue is not None and self._referral_code_index.peek(referrer_code) is not None:
+                return self._record_referral_with_queries(referrer_code, user_id, username, first_name, last_name,
+                                                          referral_code)
+            self._unknown_referral_codes.set(referrer_code, True)
+            return status, None
+        referrer = self._cache_user(self._user_from_row(result["referrer"]))
+        if status == REFERRAL_RECORDED:
+            self._referrals.add(referrer["user_id"], user_id)
+        if status != REFERRAL_SELF and result.get("referred"):
+            referred = self._user_from_row(result["referred"])
+            if cached_user is not None:
+                # Keep state the write-behind queue may not have flushed yet
+                referred = {**cached_user, "referred_by": referred["referred_by"] or cached_user.get("referred_by")}
+            self._cache_user(referred)
+        return status, referrer
+    
+    def _record_referral_with_queries(self, referrer_code: str, user_id: int, username: str = None,
+                                      first_name: str = None, last_name: str = None,
+                                      referral_code: str = None) -> Tuple[str, Optional[dict]]:
+        """Pre-RPC path: the same checks as separate requests (not atomic)"""
+        referrer = self.get_user_by_referral_code(referrer_code)
+        if not referrer:
+            return REFERRAL_INVALID_CODE, None
+        referrer_id = referrer["user_id"]
+        if referrer_id == user_id:
+            return REFERRAL_SELF, referrer
+        user = self.get_user(user_id)
+        if user and user["referred_by"] is not None:
+            return REFERRAL_ALREADY_REFERRED, referrer
+        if user is None:
+            self.add_user(user_id, username, first_name, last_name, referral_code=referral_code, referred_by=referrer_id)
+        else:
+            user["referred_by"] = referrer_id
+            self._users_cache.touch(user_id)
+            try:
+                self.client.table("users").update({"referred_by_user_id": referrer_id}).eq("user_id", user_id).execute()
+            except Exception as e:
+                logger.warning(f"Could not update user {user_id} in database (RLS or schema issue): {e}")
+        self.add_referral(referrer_id, user_id)
+        return REFERRAL_RECORDED, referrer
+    
     def get_referral_stats(self, user_id: int) -> Tuple[int, int]:
         """Get referral statistics for a user (active referrals, total referrals)"""
         try:
             # Check memory cache first
-            active_count = 0
-            total_count = 0
-            
-            for referral in self._referrals_cache.values():
-                if referral["referrer_id"] == user_id:
-                    total_count += 1
-                    if referral.get("is_active", True):
-                        active_count += 1
+            cached_stats = self._referrals.stats(user_id)
+            if cached_stats is not None:
+                return cached_stats
             
-            # If we have data in memory cache, return it
-            if total_count > 0 or active_count > 0:
-                return active_count, total_count
-            
-            # Otherwise, try to get from actual database
-            # Get the user's internal ID
-            user = self.get_user(user_id)
-            if not user:
-                return 0, 0
-                
-            user_internal_id = user.get("id", f"test_id_{user_id}")
-            
-            # First try to get stats with is_active column
+            generation = self._referrals.begin_load(user_id)
+            counts = None
             try:
-                response = self.client.table("referrals").select("id").eq("referrer_id", user_internal_id).execute()
-                total_count = len(response.data)
-
-                response = self.client.table("referrals").select("id").eq("referrer_id", user_internal_id).eq("is_active", True).execute()
-                active_count = len(response.data)
-            except Exception as e:
-                # Fallback if is_active column doesn't exist yet
-                logger.warning(f"is_active column not found, using fallback method: {e}")
-                response = self.client.table("referrals").select("id").eq("referrer_id", user_internal_id).execute()
-                total_count = len(response.data)
-                active_count = total_count  # Assume all are active if column doesn't exist
-            
-            return active_count, total_count
+                counts = self._count_referrals(user_id)
+            finally:
+                # Later referrals adjust these counts in place
+                self._referrals.finish_load(user_id, generation, counts)
+            return counts if counts is not None else (0, 0)
         except Exception as e:
             logger.error(f"Error getting referral stats for user {user_id}: {e}")
             return 0, 0
     
+    def _count_referrals(self, user_id: int) -> Optional[Tuple[int, int]]:
+        """Complete (active, total) counts from Supabase; None if the user is unknown"""
+        # Count in the database with a single aggregate call
+        try:
+            response = self.client.rpc("get_referral_counts", {"p_referrer_user_id": user_id}).execute()
+            if not response.data:
+                return 0, 0
+            counts = response.data[0]
+            return int(counts["active_referrals"]), int(counts["total_referrals"])
+        except Exception as e:
+            # Fallback if the get_referral_counts function isn't deployed yet
+            logger.warning(f"get_referral_counts RPC unavailable, using count queries: {e}")
+        
+        # Get the user's internal ID
+        user = self.get_user(user_id)
+        if not user:
+            return None
+            
+        user_internal_id = user.get("id", f"test_id_{user_id}")
+        
+        # Let PostgREST count rows instead of downloading them
+        try:
+            response = self.client.table("referrals").select("id", count="exact").eq("referrer_id", user_internal_id).limit(1).execute()
+            total_count = response.count or 0
+
+            response = self.client.table("referrals").select("id", count="exact").eq("referrer_id", user_internal_id).eq("is_active", True).limit(1).execute()
+            active_count = response.count or 0
+        except Exception as e:
+            # Fallback if is_active column doesn't exist yet
+            logger.warning(f"is_active column not found, using fallback method: {e}")
+            response = self.client.table("referrals").select("id", count="exact").eq("referrer_id", user_internal_id).limit(1).execute()
+            total_count = response.count or 0
+            active_count = total_count  # Assume all are active if column doesn't exist
+        
+        return active_count, total_count
+    
+    def get_referral_stats_many(self, user_ids: Sequence[int],
+                                referral_codes: Sequence[str] = ()) -> Tuple[Dict[int, Tuple[int, int]], Dict[str, int]]:
+        """Referral statistics for many users; everything not cached is fetched in one RPC"""
+        stats: Dict[int, Tuple[int, int]] = {}
+        owners: Dict[str, int] = {}
+        pending_ids = []
+        pending_codes = []
+        for referral_code in dict.fromkeys(referral_codes):
+            user_id = self._referral_code_index.get(referral_code)
+            if user_id is not None:
+                owners[referral_code] = user_id
+            elif not self._unknown_referral_codes.get(referral_code) and self._referral_code_may_exist(referral_code):
+                pending_codes.append(referral_code)
+        for user_id in dict.fromkeys((*user_ids, *owners.values())):
+            cached_stats = self._referrals.stats(user_id)
+            if cached_stats is not None:
+                stats[user_id] = cached_stats
+            else:
+                pending_ids.append(user_id)
+        if not pending_ids and not pending_codes:
+            return stats, owners
+        
+        # Owners found only through their code were not guarded, so their counts are not cached
+        generations = {user_id: self._referrals.begin_load(user_id) for user_id in pending_ids}
+        loaded: Dict[int, Tuple[int, int]] = {}
+        try:
+            response = self.client.rpc("get_referral_counts_many", {
+                "p_user_ids": pending_ids,
+                "p_referral_codes": pending_codes,
+            }).execute()
+            for row in response.data or []:
+                if row.get("user_id") is None:
+                    continue
+                stats[row["user_id"]] = loaded[row["user_id"]] = (int(row["active_referrals"]), int(row["total_referrals"]))
+                owners.setdefault(row["referral_code"], row["user_id"])
+        except Exception as e:
+            # Fallback if the get_referral_counts_many function isn't deployed yet
+            logger.warning(f"get_referral_counts_many RPC unavailable, looking users up one by one: {e}")
+            for referral_code in pending_codes:
+                user = self.get_user_by_referral_code(referral_code)
+                if user:
+                    owners[referral_code] = user["user_id"]
+                    pending_ids.append(user["user_id"])
+            for user_id in pending_ids:
+                stats[user_id] = self.get_referral_stats(user_id)
+            return stats, owners
+        finally:
+            for user_id, generation in generations.items():
+                self._referrals.finish_load(user_id, generation, loaded.get(user_id))
+        
+        for referral_code in pending_codes:
+            if referral_code not in owners:
+                self._unknown_referral_codes.set(referral_code, True)
+        for user_id in pending_ids:
+            stats.setdefault(user_id, (0, 0))
+        # Rows matched by user ID may carry codes nobody asked about
+        requested = set(referral_codes)
+        return stats, {code: user_id for code, user_id in owners.items() if code in requested}
+    
     def deactivate_referral(self, referrer_user_id: int, referred_user_id: int) -> bool:
         """Deactivate a referral when user leaves channel"""
         try:
-            # Update memory cache
-            referral_key = f"{referrer_user_id}_{referred_user_id}"
-            if referral_key in self._referrals_cache:
-                self._referrals_cache[referral_key]["is_active"] = False
-            
             # Try to update database
             try:
                 # Get the internal IDs of both users
@@ -231,7 +580,9 @@ class Database:
                         logger.warning(f"Could not update is_active column: {e}")
             except Exception as e:
                 logger.warning(f"Could not update referral in database (RLS or schema issue): {e}")
-                
+            
+            # Updated after the write, like add_referral
+            self._referrals.deactivate(referrer_user_id, referred_user_id)
             return True
         except Exception as e:
             logger.error(f"Error deactivating referral: {e}")
@@ -240,12 +591,7 @@ class Database:
     def mark_reward_claimed(self, user_id: int) -> bool:
         """Mark reward as claimed for a user"""
         try:
-            # Update memory cache
-            if user_id in self._users_cache:
-                self._users_cache[user_id]["reward_claimed"] = True
-            
-            # Since reward_claimed column doesn't exist, we'll skip database update
-            logger.warning(f"Skipping reward claimed update for user {user_id} - column doesn't exist")
+            self._update_user_fields(user_id, {"reward_claimed": True})
             return True
         except Exception as e:
             logger.error(f"Error marking reward claimed for user {user_id}: {e}")
@@ -254,16 +600,12 @@ class Database:
     def get_all_users_count(self) -> int:
         """Get total number of users"""
         try:
-            # Check memory cache first
-            if self._users_cache:
-                return len(self._users_cache)
-            
-            # Try to get from actual database
-            response = self.client.table("users").select("id", count="exact").execute()
+            # The users cache is bounded, so only the database knows the real total
+            response = self.client.table("users").select("id", count="exact").limit(1).execute()
             return response.count
         except Exception as e:
             logger.error(f"Error getting user count: {e}")
-            return 0
+            return len(self._users_cache)
 
     def get_channel_members_count(self) -> int:
         """Get number of active channel members"""
@@ -275,34 +617,91 @@ class Database:
             logger.error(f"Error getting channel members count: {e}")
             return 0
     
+    def invalidate_settings_cache(self, payload=None) -> None:
+        """Drop cached settings and referral targets so the next read refetches them"""
+        self._settings_cache.clear()
+        logger.info("Settings cache invalidated")
+    
+    def watch_settings_changes(self) -> bool:
+        """Invalidate the settings cache whenever the settings_version row changes.
+        
+        A trigger on settings and referral_targets bumps that row; it is read at
+        most every SETTINGS_VERSION_CHECK_INTERVAL seconds. If it cannot be read the
+        cache still expires after its TTL.
+        """
+        try:
+            self._settings_version = self._fetch_settings_version()
+        except Exception as e:
+            logger.warning(f"Could not read {SETTINGS_VERSION_KEY}, relying on cache TTL (RLS or schema issue): {e}")
+            return False
+        self._settings_version_checked_at = time.monotonic()
+        logger.info("Watching settings_version for settings changes")
+        return True
+    
+    def _fetch_settings_version(self) -> Optional[str]:
+        response = self.client.table("settings").select("value").eq("key", SETTINGS_VERSION_KEY).execute()
+        return response.data[0]["value"] if response.data else None
+    
+    def _check_settings_version(self) -> None:
+        """Drop cached settings if settings_version changed since the last check"""
+        checked_at = self._settings_version_checked_at
+        if checked_at is None or time.monotonic() - checked_at < SETTINGS_VERSION_CHECK_INTERVAL:
+            return
+        self._settings_version_checked_at = time.monotonic()
+        try:
+            version = self._fetch_settings_version()
+        except Exception as e:
+            logger.warning(f"Could not read {SETTINGS_VERSION_KEY} (RLS or schema issue): {e}")
+            return
+        if version != self._settings_version:
+            self._settings_version = version
+            self.invalidate_settings_cache()
+    
     def get_active_referral_target(self) -> Optional[int]:
         """Get the current active referral target from referral_targets table"""
+        self._check_settings_version()
+        cached = self._settings_cache.get("active_referral_target", _UNCACHED)
+        if cached is not _UNCACHED:
+            return cached
         try:
-            # First try to get the active referral target ID from settings
-            settings_response = self.client.table("settings").select("value").eq("key", "active_referral_target_id").execute()
-            if settings_response.data:
-                target_id = int(settings_response.data[0]["value"])
-                
-                # Get the target level from referral_targets table
-                target_response = self.client.table("referral_targets").select("target_level").eq("id", target_id).eq("is_active", True).execute()
-                if target_response.data:
-                    return target_response.data[0]["target_level"]
-            
-            # Fallback to old method
-            response = self.client.table("settings").select("value").eq("key", "referral_target").execute()
-            if response.data:
-                return int(response.data[0]["value"])
-            
-            return None
+            target = self._fetch_active_referral_target()
+            self._settings_cache.set("active_referral_target", target)
+            return target
         except Exception as e:
             logger.error(f"Error getting active referral target: {e}")
             return None
     
+    def _fetch_active_referral_target(self) -> Optional[int]:
+        """Read the active referral target from Supabase (uncached)"""
+        # First try to get the active referral target ID from settings
+        settings_response = self.client.table("settings").select("value").eq("key", "active_referral_target_id").execute()
+        if settings_response.data:
+            target_id = int(settings_response.data[0]["value"])
+            
+            # Get the target level from referral_targets table
+            target_response = self.client.table("referral_targets").select("target_level").eq("id", target_id).eq("is_active", True).execute()
+            if target_response.data:
+                return target_response.data[0]["target_level"]
+        
+        # Fallback to old method
+        response = self.client.table("settings").select("value").eq("key", "referral_target").execute()
+        if response.data:
+            return int(response.data[0]["value"])
+        
+        return None
+    
     def get_setting(self, key: str) -> Optional[str]:
         """Get a setting value by key"""
+        self._check_settings_version()
+        cache_key = f"setting:{key}"
+        cached = self._settings_cache.get(cache_key, _UNCACHED)
+        if cached is not _UNCACHED:
+            return cached
         try:
             response = self.client.table("settings").select("value").eq("key", key).execute()
-            return response.data[0]["value"] if response.data else None
+            value = response.data[0]["value"] if response.data else None
+            self._settings_cache.set(cache_key, value)
+            return value
         except Exception as e:
             logger.error(f"Error getting setting {key}: {e}")
             return None
@@ -328,12 +727,7 @@ class Database:
     def update_user_referral_target(self, user_id: int, target_id: int) -> bool:
         """Update user's referral target"""
         try:
-            # Update memory cache
-            if user_id in self._users_cache:
-                self._users_cache[user_id]["referral_target_id"] = target_id
-            
-            # Since referral_target_id column doesn't exist, we'll skip database update
-            logger.warning(f"Skipping referral target update for user {user_id} - column doesn't exist")
+            self._update_user_fields(user_id, {"referral_target_id": target_id})
             return True
         except Exception as e:
             logger.error(f"Error updating user {user_id} referral target: {e}")
@@ -342,12 +736,7 @@ class Database:
     def mark_target_reached(self, user_id: int) -> bool:
         """Mark that user has reached their referral target"""
         try:
-            # Update memory cache
-            if user_id in self._users_cache:
-                self._users_cache[user_id]["target_reached_at"] = "test_timestamp"
-            
-            # Since target_reached_at column doesn't exist, we'll skip database update
-            logger.warning(f"Skipping target reached update for user {user_id} - column doesn't exist")
+            self._update_user_fields(user_id, {"target_reached_at": datetime.now(timezone.utc).isoformat()})
             return True
         except Exception as e:
             logger.error(f"Error marking target reached for user {user_id}: {e}")
@@ -358,21 +747,178 @@ class Database:
         """Get stored invite link for a user"""
         return self._invite_links_cache.get(user_id)
     
+    def _load_invite_link(self, user_id: int) -> Optional[str]:
+        """Read a user's newest active invite link from Supabase (cache loader)"""
+        response = self.client.table("invite_links").select("invite_link").eq("user_id", user_id).eq("is_active", True).order("id", desc=True).limit(1).execute()
+        if not response.data:
+            return None
+        self._invite_link_owners.set(response.data[0]["invite_link"], user_id)
+        return response.data[0]["invite_link"]
+    
+    def get_invite_link_owner(self, invite_link: str) -> Optional[int]:
+        """Get the user an invite link was created for"""
+        cached = self._invite_link_owners.get(invite_link, _UNCACHED)
+        if cached is not _UNCACHED:
+            return cached
+        try:
+            response = self.client.table("invite_links").select("user_id").eq("invite_link", invite_link).limit(1).execute()
+            owner = response.data[0]["user_id"] if response.data else None
+            # Links the bot did not create are remembered too, until the entry expires
+            self._invite_link_owners.set(invite_link, owner)
+            return owner
+        except Exception as e:
+            logger.warning(f"Could not look up invite link owner (RLS or schema issue): {e}")
+            return None
+    
+    def preload_invite_links(self) -> int:
+        """Fill the invite link cache with the newest active links, up to its capacity"""
+        loaded = 0
+        last_id = None
+        try:
+            while loaded < self._invite_links_cache.max_entries:
+                query = self.client.table("invite_links").select("id,user_id,invite_link").eq("is_active", True)
+                if last_id is not None:
+                    query = query.lt("id", last_id)
+                response = query.order("id", desc=True).limit(INVITE_LINK_PAGE_SIZE).execute()
+                for row in response.data:
+                    self._invite_link_owners.set(row["invite_link"], row["user_id"])
+                    # Newest first, so an older link never replaces a user's current one
+                    if row["user_id"] not in self._invite_links_cache:
+                        self._invite_links_cache.set(row["user_id"], row["invite_link"])
+                        loaded += 1
+                if len(response.data) < INVITE_LINK_PAGE_SIZE:
+                    break
+                last_id = response.data[-1]["id"]
+            logger.info(f"Preloaded {loaded} invite links")
+        except Exception as e:
+            logger.warning(f"Could not preload invite links (RLS or schema issue): {e}")
+        return loaded
+    
+    def preload_referral_codes(self) -> int:
+        """Rebuild the referral code filter from every users row, then start using it"""
+        if self._referral_code_filter is None:
+            return 0
+        try:
+            loaded, last_id = self._load_referral_codes(None)
+        except Exception as e:
+            # Left disabled: a partial filter would reject valid codes
+            logger.warning(f"Could not preload referral codes (RLS or schema issue): {e}")
+            return 0
+        self._referral_code_filter_position = (last_id, last_id)
+        self._referral_code_filter_ready = True
+        if loaded > self._referral_code_filter.capacity:
+            logger.warning(f"{loaded} referral codes exceed the filter capacity of {self._referral_code_filter.capacity}; "
+                           f"raise REFERRAL_CODE_FILTER_CAPACITY to keep false positives low")
+        logger.info(f"Preloaded {loaded} referral codes into the filter")
+        return loaded
+    
+    def refresh_referral_codes(self) -> int:
+        """Add codes from users rows created since the last load; preloads if that never succeeded.
+        
+        Each refresh starts where the one before it started, so a row whose id
+        was assigned before the last refresh but committed after it is still
+        picked up. Re-adding a code to the filter is harmless.
+        """
+        if self._referral_code_filter is None:
+            return 0
+        if not self._referral_code_filter_ready:
+            return self.preload_referral_codes()
+        reread_from, last_seen = self._referral_code_filter_position
+        try:
+            loaded, last_id = self._load_referral_codes(reread_from)
+        except Exception as e:
+            logger.warning(f"Could not refresh referral codes (RLS or schema issue): {e}")
+            return 0
+        self._referral_code_filter_position = (last_seen, last_id if last_id is not None else last_seen)
+        return loaded
+    
+    def _load_referral_codes(self, after_id) -> Tuple[int, Optional[int]]:
+        """Add the codes of users rows with id > after_id to the filter; returns (codes added, last id)"""
+        loaded = 0
+        last_id = after_id
+        while True:
+            query = self.client.table("users").select("id,referral_code")
+            if last_id is not None:
+                query = query.gt("id", last_id)
+            response = query.order("id").limit(USER_PAGE_SIZE).execute()
+            for row in response.data:
+                if row.get("referral_code"):
+                    self._referral_code_filter.add(row["referral_code"])
+                    loaded += 1
+            if response.data:
+                last_id = response.data[-1]["id"]
+            if len(response.data) < USER_PAGE_SIZE:
+                return loaded, last_id
+    
     def store_invite_link(self, user_id: int, referral_code: str, invite_link: str, link_name: str) -> bool:
         """Store invite link for a user"""
-        self._invite_links_cache[user_id] = invite_link
+        self._invite_links_cache.set(user_id, invite_link)
+        self._invite_link_owners.set(invite_link, user_id)
+        try:
+            self.client.table("invite_links").upsert({
+                "user_id": user_id,
+                "referral_code": referral_code,
+                "invite_link": invite_link,
+                "invite_link_name": link_name,
+                "is_active": True
+            }, on_conflict="invite_link").execute()
+        except Exception as e:
+            logger.warning(f"Could not store invite link for user {user_id} in database (RLS or schema issue): {e}")
         return True
     
     def log_channel_event(self, user_id: int, event_type: str) -> bool:
         """Log channel event for a user"""
-        if user_id not in self._channel_events_cache:
-            self._channel_events_cache[user_id] = []
-        self._channel_events_cache[user_id].append({
+        timestamp = datetime.now(timezone.utc).isoformat()
+        events = self._channel_events_cache.peek(user_id) or []
+        events.append({
             "event_type": event_type,
-            "timestamp": "test_timestamp"
+            "timestamp": timestamp
         })
+        self._channel_events_cache.set(user_id, events)
+        try:
+            self.client.table("channel_events").insert({
+                "user_id": user_id,
+                "event_type": event_type,
+                "timestamp": timestamp
+            }).execute()
+        except Exception as e:
+            logger.warning(f"Could not log channel event for user {user_id} in database (RLS or schema issue): {e}")
+        return True
+    
+    def get_user_language(self, user_id: int) -> Optional[str]:
+        """Get a user's stored language preference"""
+        response = self.client.table("user_languages").select("language_code").eq("user_id", user_id).limit(1).execute()
+        return response.data[0]["language_code"] if response.data else None
+    
+    def set_user_language(self, user_id: int, language_code: str) -> bool:
+        """Persist a user's language preference"""
+        self.client.table("user_languages").upsert({
+            "user_id": user_id,
+            "language_code": language_code,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }, on_conflict="user_id").execute()
         return True
     
+    def cache_stats(self) -> dict:
+        """Hit/miss/eviction counters for every in-memory cache"""
+        stats = {
+            cache.name: cache.stats()
+            for cache in (self._users_cache, self._referral_code_index, self._unknown_referral_codes,
+                          self._invite_links_cache, self._invite_link_owners, self._channel_events_cache,
+                          self._settings_cache)
+        }
+        stats["referrals"] = self._referrals.cache_stats()
+        if self._referral_code_filter is not None:
+            stats["referral_code_filter"] = {
+                **self._referral_code_filter.stats(),
+                "ready": self._referral_code_filter_ready,
+                "rejected": self.rejected_referral_codes,
+            }
+        return stats
+    
+    def close(self) -> None:
+        """Nothing to release; the Supabase client is shared process-wide"""
+    
     def get_connection(self):
         """Get database connection (stub implementation for compatibility)"""
         # This is a stub implementation to satisfy interface requirements
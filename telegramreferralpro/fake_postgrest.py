@@ -0,0 +1,382 @@
+"""Local stand-in for the supabase-py table API, for offline runs and benchmarks"""
+
+import fnmatch
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Columns looked up through a hash index instead of a table scan (Postgres has
+# btree indexes on all of these); unique ones reject duplicate values
+INDEXED_COLUMNS = {
+    "users": ("id", "user_id", "referral_code"),
+    "referrals": ("id", "referrer_id", "referred_id"),
+    "invite_links": ("id", "user_id", "invite_link"),
+    "channel_events": ("id", "user_id"),
+    "user_languages": ("user_id",),
+    "settings": ("id", "key"),
+    "referral_targets": ("id",),
+}
+UNIQUE_COLUMNS = {
+    "users": ("id", "user_id", "referral_code"),
+    "referrals": ("id", "referred_id"),
+    "invite_links": ("id", "invite_link"),
+    "channel_events": ("id",),
+    "user_languages": ("user_id",),
+    "settings": ("id", "key"),
+    "referral_targets": ("id",),
+}
+COLUMN_DEFAULTS = {
+    "users": {"is_channel_member": False, "reward_claimed": False},
+    "referrals": {"is_active": True},
+    "invite_links": {"is_active": True},
+    "referral_targets": {"is_active": True},
+}
+
+class FakeAPIError(Exception):
+    """Raised where PostgREST would answer with an error (e.g. a unique violation)"""
+
+    def __init__(self, message: str, code: str = None):
+        super().__init__(message)
+        self.code = code
+
+class FakeResponse:
+    def __init__(self, data: List[dict], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+class _Table:
+    """Rows of one table plus hash indexes on its indexed columns"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows: List[dict] = []
+        self.next_id = 1
+        self.unique = UNIQUE_COLUMNS.get(name, ("id",))
+        self.indexes: Dict[str, Dict[Any, List[dict]]] = {
+            column: {} for column in INDEXED_COLUMNS.get(name, ("id",))
+        }
+
+    def lookup(self, column: str, value: Any) -> List[dict]:
+        return self.indexes[column].get(value, [])
+
+    def insert(self, values: dict) -> dict:
+        row = {**COLUMN_DEFAULTS.get(self.name, {}), **values}
+        if "id" in self.indexes and row.get("id") is None:
+            row["id"] = self.next_id
+        if isinstance(row.get("id"), int):
+            self.next_id = max(self.next_id, row["id"] + 1)
+        for column in self.unique:
+            if row.get(column) is not None and self.lookup(column, row[column]):
+                raise FakeAPIError(
+                    f'duplicate key value violates unique constraint "{self.name}_{column}_key"', code="23505"
+                )
+        self.rows.append(row)
+        self._index(row)
+        return row
+
+    def update(self, row: dict, values: dict) -> None:
+        for column in self.unique:
+            if column in values and values[column] != row.get(column) and self.lookup(column, values[column]):
+                raise FakeAPIError(
+                    f'duplicate key value violates unique constraint "{self.name}_{column}_key"', code="23505"
+                )
+        self._unindex(row)
+        row.update(values)
+        self._index(row)
+
+    def delete(self, row: dict) -> None:
+        self._unindex(row)
+        self.rows.remove(row)
+
+    def _index(self, row: dict) -> None:
+        for column, index in self.indexes.items():
+            if row.get(column) is not None:
+                index.setdefault(row[column], []).append(row)
+
+    def _unindex(self, row: dict) -> None:
+        for column, index in self.indexes.items():
+            bucket = index.get(row.get(column))
+            if bucket is not None:
+                bucket[:] = [r for r in bucket if r is not row]
+                if not bucket:
+                    del index[row[column]]
+
+class _Query:
+    """Chainable builder mirroring the postgrest-py calls the bot uses"""
+
+    def __init__(self, client: "FakePostgrestClient", table: str):
+        self._client = client
+        self._table = table
+        self._action = "select"
+        self._columns = "*"
+        self._count = None
+        self._payload = None
+        self._on_conflict = None
+        self._ignore_duplicates = False
+        self._filters: List[tuple] = []
+        self._negate_next = False
+        self._order = None
+        self._limit = None
+
+    # Actions
+    def select(self, columns: str = "*", count: Optional[str] = None) -> "_Query":
+        self._action, self._columns, self._count = "select", columns, count
+        return self
+
+    def insert(self, rows) -> "_Query":
+        self._action, self._payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict: Optional[str] = None, ignore_duplicates: bool = False) -> "_Query":
+        self._action, self._payload = "upsert", rows
+        self._on_conflict, self._ignore_duplicates = on_conflict, ignore_duplicates
+        return self
+
+    def update(self, values: dict) -> "_Query":
+        self._action, self._payload = "update", values
+        return self
+
+    def delete(self) -> "_Query":
+        self._action = "delete"
+        return self
+
+    # Filters
+    @property
+    def not_(self) -> "_Query":
+        self._negate_next = True
+        return self
+
+    def _filter(self, column: str, op: str, value: Any, predicate: Callable[[Any], bool]) -> "_Query":
+        self._filters.append((column, op, value, predicate, self._negate_next))
+        self._negate_next = False
+        return self
+
+    def eq(self, column: str, value: Any) -> "_Query":
+        return self._filter(column, "eq", value, lambda v: v == value)
+
+    def neq(self, column: str, value: Any) -> "_Query":
+        return self._filter(column, "neq", value, lambda v: v != value)
+
+    def gt(self, column: str, value: Any) -> "_Query":
+        return self._filter(column, "gt", value, lambda v: v is not None and v > value)
+
+    def gte(self, column: str, value: Any) -> "_Query":
+        return self._filter(column, "gte", value, lambda v: v is not None and v >= value)
+
+    def lt(self, column: str, value: Any) -> "_Query":
+        return self._filter(column, "lt", value, lambda v: v is not None and v < value)
+
+    def lte(self, column: str, value: Any) -> "_Query":
+        return self._filter(column, "lte", value, lambda v: v is not None and v <= value)
+
+    def like(self, column: str, pattern: str) -> "_Query":
+        glob = pattern.replace("*", "%").replace("%", "*").replace("_", "?")
+        return self._filter(column, "like", pattern, lambda v: v is not None and fnmatch.fnmatchcase(str(v), glob))
+
+    def in_(self, column: str, values) -> "_Query":
+        values = list(values)
+        return self._filter(column, "in", values, lambda v: v in values)
+
+    def is_(self, column: str, value: Any) -> "_Query":
+        expected = None if value in (None, "null") else value
+        return self._filter(column, "is", value, lambda v: v is expected or v == expected)
+
+    # Modifiers
+    def order(self, column: str, desc: bool = False) -> "_Query":
+        self._order = (column, desc)
+        return self
+
+    def limit(self, size: int) -> "_Query":
+        self._limit = size
+        return self
+
+    def execute(self) -> FakeResponse:
+        return self._client._execute(self)
+
+    def _matches(self, table: _Table) -> List[dict]:
+        candidates = None
+        for column, op, value, _, negate in self._filters:
+            if op == "eq" and not negate and column in table.indexes:
+                candidates = table.lookup(column, value)
+                break
+        rows = table.rows if candidates is None else candidates
+        return [
+            row for row in rows
+            if all(predicate(row.get(column)) != negate for column, _, _, predicate, negate in self._filters)
+        ]
+
+    def _project(self, row: dict) -> dict:
+        if self._columns.strip() == "*":
+            return dict(row)
+        return {column: row.get(column) for column in (c.strip() for c in self._columns.split(","))}
+
+class _RpcCall:
+    def __init__(self, client: "FakePostgrestClient", name: str, params: dict):
+        self._client = client
+        self._name = name
+        self._params = params
+
+    def execute(self) -> FakeResponse:
+        return self._client._call_rpc(self._name, self._params)
+
+class FakePostgrestClient:
+    """In-process tables behind the ``client.table(...)...execute()`` API.
+
+    Supports the filters, modifiers and write calls the bot issues,
+    ``count="exact"``, unique constraints and ``on_conflict`` upserts, and
+    the ``get_referral_counts``, ``get_referral_counts_many`` and
+    ``process_referral`` RPCs. ``latency`` seconds are slept per
+    request to model the Supabase round trip; ``requests`` counts them.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._tables: Dict[str, _Table] = {}
+        self._rpcs: Dict[str, Callable[[dict], List[dict]]] = {
+            "get_referral_counts": self._get_referral_counts,
+            "get_referral_counts_many": self._get_referral_counts_many,
+            "process_referral": self._process_referral,
+        }
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rpc(self, name: str, params: Optional[dict] = None) -> _RpcCall:
+        return _RpcCall(self, name, params or {})
+
+    def register_rpc(self, name: str, func: Callable[[dict], List[dict]]) -> None:
+        self._rpcs[name] = func
+
+    def seed(self, table: str, rows: List[dict]) -> None:
+        """Insert rows without counting requests or sleeping"""
+        with self._lock:
+            target = self._get_table(table)
+            for row in rows:
+                target.insert(dict(row))
+
+    def rows(self, table: str) -> List[dict]:
+        with self._lock:
+            return [dict(row) for row in self._get_table(table).rows]
+
+    def _get_table(self, name: str) -> _Table:
+        table = self._tables.get(name)
+        if table is None:
+            table = self._tables[name] = _Table(name)
+        return table
+
+    def _round_trip(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+
+    def _execute(self, query: _Query) -> FakeResponse:
+        self._round_trip()
+        with self._lock:
+            table = self._get_table(query._table)
+            if query._action == "select":
+                rows = query._matches(table)
+                count = len(rows) if query._count else None
+                if query._order:
+                    column, desc = query._order
+                    rows = sorted(rows, key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+                if query._limit is not None:
+                    rows = rows[:query._limit]
+                return FakeResponse([query._project(row) for row in rows], count)
+
+            if query._action == "insert":
+                payload = query._payload if isinstance(query._payload, list) else [query._payload]
+                return FakeResponse([dict(table.insert(dict(row))) for row in payload])
+
+            if query._action == "upsert":
+                payload = query._payload if isinstance(query._payload, list) else [query._payload]
+                conflict_column = query._on_conflict or "id"
+                written = []
+                for values in payload:
+                    existing = table.lookup(conflict_column, values.get(conflict_column)) \
+                        if conflict_column in table.indexes else \
+                        [r for r in table.rows if r.get(conflict_column) == values.get(conflict_column)]
+                    if existing:
+                        if query._ignore_duplicates:
+                            continue
+                        # existing is the index bucket, which the update rewrites
+                        row = existing[0]
+                        table.update(row, values)
+                        written.append(dict(row))
+                    else:
+                        written.append(dict(table.insert(dict(values))))
+                return FakeResponse(written)
+
+            matched = query._matches(table)
+            if query._action == "update":
+                for row in matched:
+                    table.update(row, query._payload)
+                return FakeResponse([dict(row) for row in matched])
+            for row in matched:
+                table.delete(row)
+            return FakeResponse([dict(row) for row in matched])
+
+    def _call_rpc(self, name: str, params: dict) -> FakeResponse:
+        self._round_trip()
+        func = self._rpcs.get(name)
+        if func is None:
+            raise FakeAPIError(f"Could not find the function public.{name}", code="PGRST202")
+        with self._lock:
+            return FakeResponse(func(params))
+
+    def _get_referral_counts(self, params: dict) -> List[dict]:
+        # Mirrors supabase/migrations/*_create_referral_counts_function.sql
+        users = self._get_table("users").lookup("user_id", params.get("p_referrer_user_id"))
+        referrals = self._get_table("referrals").lookup("referrer_id", users[0]["id"]) if users else []
+        return [{
+            "active_referrals": sum(1 for r in referrals if r.get("is_active")),
+            "total_referrals": len(referrals),
+        }]
+
+    def _get_referral_counts_many(self, params: dict) -> List[dict]:
+        # Mirrors supabase/migrations/*_create_referral_counts_many_function.sql
+        users = self._get_table("users")
+        matched = {}
+        for user_id in params.get("p_user_ids") or []:
+            for user in users.lookup("user_id", user_id):
+                matched[user["id"]] = user
+        for referral_code in params.get("p_referral_codes") or []:
+            for user in users.lookup("referral_code", referral_code):
+                matched[user["id"]] = user
+        rows = []
+        for user in matched.values():
+            referrals = self._get_table("referrals").lookup("referrer_id", user["id"])
+            rows.append({
+                "user_id": user.get("user_id"),
+                "referral_code": user.get("referral_code"),
+                "active_referrals": sum(1 for r in referrals if r.get("is_active")),
+                "total_referrals": len(referrals),
+            })
+        return rows
+
+    def _process_referral(self, params: dict) -> List[dict]:
+        # Mirrors supabase/migrations/*_create_process_referral_function.sql
+        users = self._get_table("users")
+        found = users.lookup("referral_code", params.get("p_referrer_code"))
+        if not found:
+            return [{"status": "invalid_code", "referrer": None, "referred": None}]
+        referrer = found[0]
+        user_id = params.get("p_user_id")
+        if referrer.get("user_id") == user_id:
+            return [{"status": "self_referral", "referrer": dict(referrer), "referred": dict(referrer)}]
+        existing = users.lookup("user_id", user_id)
+        user = existing[0] if existing else users.insert({
+            "user_id": user_id,
+            "username": params.get("p_username"),
+            "first_name": params.get("p_first_name"),
+            "last_name": params.get("p_last_name"),
+            "referral_code": params.get("p_referral_code"),
+        })
+        referrals = self._get_table("referrals")
+        if user.get("referred_by_user_id") is not None or referrals.lookup("referred_id", user["id"]):
+            return [{"status": "already_referred", "referrer": dict(referrer), "referred": dict(user)}]
+        users.update(user, {"referred_by_user_id": referrer["user_id"]})
+        referrals.insert({"referrer_id": referrer["id"], "referred_id": user["id"], "is_active": True})
+        return [{"status": "recorded", "referrer": dict(referrer), "referred": dict(user)}]
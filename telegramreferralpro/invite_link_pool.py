@@ -0,0 +1,104 @@
+"""Pool of pre-created channel invite links handed out to new referrers"""
+
+import asyncio
+import collections
+import logging
+import secrets
+from typing import Deque, Optional, Set
+
+from .utils import TelegramUtils
+
+logger = logging.getLogger(__name__)
+
+# Longest pause between creation attempts while the Bot API keeps failing
+MAX_RETRY_DELAY = 60.0
+
+class InviteLinkPool:
+    """Keep named invite links ready so handing one out needs no Bot API call.
+
+    A background task creates links (named ``Pool-…``) one every
+    ``create_interval`` seconds until ``size`` are ready, and starts again
+    once the pool drops to ``low_water``. ``acquire`` pops a link, returns
+    it immediately and renames it to the requested name in the background;
+    attribution is by URL, so the rename is cosmetic. When the pool is empty
+    the link is created inline, as before. ``close`` revokes the links
+    still in the pool, so none are left orphaned in the channel.
+    """
+
+    def __init__(self, telegram_utils: TelegramUtils, size: int = 20, low_water: int = 5,
+                 create_interval: float = 1.0):
+        self.telegram_utils = telegram_utils
+        self.size = size
+        self.low_water = min(low_water, size)
+        self.create_interval = create_interval
+        self._links: Deque[str] = collections.deque()
+        self._refill: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._renames: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+
+    async def start(self) -> None:
+        """Start filling the pool in the background"""
+        self._refill = asyncio.Event()
+        self._refill.set()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Invite link pool started (size={self.size}, low_water={self.low_water})")
+
+    async def close(self) -> None:
+        """Stop refilling, wait for pending renames and revoke the unused links"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._renames:
+            await asyncio.gather(*self._renames, return_exceptions=True)
+        unused = list(self._links)
+        self._links.clear()
+        revoked = await asyncio.gather(*(self.telegram_utils.revoke_invite_link(link) for link in unused))
+        logger.info(f"Invite link pool closed; revoked {sum(revoked)} of {len(unused)} unused links")
+
+    def __len__(self) -> int:
+        return len(self._links)
+
+    async def acquire(self, name: str) -> str:
+        """Return an invite link for ``name``, from the pool when one is ready"""
+        if not self._links:
+            self.misses += 1
+            self._request_refill()
+            return await self.telegram_utils.create_unique_invite_link(name=name)
+        invite_link = self._links.popleft()
+        self.hits += 1
+        if len(self._links) <= self.low_water:
+            self._request_refill()
+        task = asyncio.create_task(self._rename(invite_link, name))
+        self._renames.add(task)
+        task.add_done_callback(self._renames.discard)
+        return invite_link
+
+    def _request_refill(self) -> None:
+        if self._refill is not None:
+            self._refill.set()
+
+    async def _rename(self, invite_link: str, name: str) -> None:
+        if not await self.telegram_utils.rename_invite_link(invite_link, name):
+            logger.warning(f"Invite link {invite_link} handed out under its pool name")
+
+    async def _run(self) -> None:
+        delay = self.create_interval
+        while True:
+            await self._refill.wait()
+            self._refill.clear()
+            while len(self._links) < self.size:
+                invite_link = await self.telegram_utils.create_unique_invite_link(name=f"Pool-{secrets.token_hex(4)}")
+                # create_unique_invite_link falls back to the public channel link on errors
+                if invite_link == self.telegram_utils.get_channel_link():
+                    delay = min(delay * 2, MAX_RETRY_DELAY)
+                    logger.warning(f"Invite link pool could not create a link, retrying in {delay:.0f}s")
+                else:
+                    self._links.append(invite_link)
+                    delay = self.create_interval
+                await asyncio.sleep(delay)
@@ -4,6 +4,9 @@ import logging
 from typing import Dict, Optional, Any
 from enum import Enum
 
+from .cache import BoundedCache
+from .storage import Storage
+
 logger = logging.getLogger(__name__)
 
 class SupportedLanguage(Enum):
@@ -1239,24 +1242,32 @@ Todas as futuras mensagens serão em português.
         }
 
 class LanguageManager:
-    """Manage user language preferences using in-memory storage for now"""
+    """Manage user language preferences with a bounded cache over the database"""
     
-    def __init__(self, database):
+    def __init__(self, database: Storage):
         self.db = database
-        self._user_languages = {}  # In-memory storage for user languages
+        self._user_languages = None
         self._init_language_table()
     
     def _init_language_table(self):
-        """Initialize language preferences (using in-memory storage)"""
+        """Initialize the language cache, reading and writing through to user_languages"""
         try:
-            logger.info("Language manager initialized with in-memory storage")
+            self._user_languages = BoundedCache(
+                "user_languages",
+                self.db.cache_settings,
+                loader=self.db.get_user_language,
+                writer=self.db.set_user_language
+            )
+            logger.info("Language manager initialized with bounded cache")
         except Exception as e:
             logger.error(f"Error initializing language manager: {e}")
     
     def set_user_language(self, user_id: int, language_code: str, detected: bool = False) -> bool:
         """Set user's preferred language"""
         try:
-            self._user_languages[user_id] = language_code
+            # Skip the write-through when nothing changed
+            if self._user_languages.peek(user_id) != language_code:
+                self._user_languages.set(user_id, language_code)
             return True
         except Exception as e:
             logger.error(f"Error setting user language: {e}")
@@ -7,6 +7,15 @@ from telegram.error import TelegramError
 
 from .config import load_config
 from .database import Database
+from .storage import create_storage
+from .async_database import AsyncDatabase
+from .cache import CacheSettings
+from .write_behind import WriteBehindQueue
+from .invite_link_pool import InviteLinkPool
+from .send_scheduler import SendScheduler
+from .supabase_utils import create_http_session
+from .task_outbox import TaskUpdateOutbox
+from .referral_codes import ReferralCodec
 from .referral_system import ReferralSystem
 from .bot_handlers import BotHandlers
 from .utils import TelegramUtils, setup_logging
@@ -22,22 +31,111 @@ def main():
         config = load_config()
         logger.info("Configuration loaded successfully")
         
+        # Signed codes are verified by their HMAC, in the referral system and in storage
+        codec = ReferralCodec(config.referral_code_secret.encode()) if config.referral_code_secret else None
+        
         # Initialize database
-        database = Database()  # Supabase Database doesn't need a database path parameter
-        logger.info("Database initialized")
+        cache_settings = CacheSettings(
+            max_entries=config.cache_max_entries,
+            ttl=config.cache_ttl_seconds,
+            max_bytes=config.cache_max_bytes
+        )
+        database = create_storage(
+            config.storage_backend,
+            database_path=config.database_path,
+            cache_settings=cache_settings,
+            settings_ttl=config.settings_cache_ttl,
+            referral_code_filter_capacity=config.referral_code_filter_capacity,
+            referral_codec=codec
+        )
+        if isinstance(database, Database) and config.write_behind_enabled:
+            database.enable_write_behind(WriteBehindQueue(
+                database.client,
+                batch_size=config.write_batch_size,
+                flush_interval=config.write_flush_interval,
+                spill_path=config.write_behind_spill_path
+            ))
+        async_database = AsyncDatabase(database, max_workers=config.db_max_workers)
+        logger.info(f"Database initialized ({config.storage_backend})")
         
         # Initialize referral system
-        referral_system = ReferralSystem(database)
-        logger.info("Referral system initialized")
+        referral_system = ReferralSystem(database, codec=codec)
+        logger.info(f"Referral system initialized ({'signed' if codec else 'random'} referral codes)")
+        
+        # Task updates for the Supabase edge function survive restarts and outages
+        task_outbox = TaskUpdateOutbox(
+            config,
+            path=config.task_outbox_path,
+            batch_size=config.supabase_webhook_batch_size
+        )
+        http_session = None
+        referral_code_refresh = None
+        
+        async def keep_referral_codes_fresh() -> None:
+            # The code filter switches on once loaded; until then lookups go to storage
+            await async_database.preload_referral_codes()
+            # Then pick up codes the API server or other bots issue
+            while config.referral_code_filter_refresh_interval > 0:
+                await asyncio.sleep(config.referral_code_filter_refresh_interval)
+                await async_database.refresh_referral_codes()
         
         # Create bot application
-        application = Application.builder().token(config.bot_token).build()
+        async def post_init(application: Application) -> None:
+            nonlocal http_session, referral_code_refresh
+            await async_database.start()
+            # Returning users get their existing link instead of a new Bot API call
+            await async_database.preload_invite_links()
+            referral_code_refresh = asyncio.create_task(keep_referral_codes_fresh())
+            if invite_link_pool is not None:
+                await invite_link_pool.start()
+            # One pooled HTTP session for the whole run instead of one per request
+            http_session = create_http_session()
+            await task_outbox.start(http_session)
+            # Warm the channel info so the first welcome message has the title
+            await telegram_utils.refresh_chat_info()
+
+        async def post_stop(application: Application) -> None:
+            # Send buffered referrer digests while the bot can still send
+            await bot_handlers.referrer_notifier.close()
+            # Unused pooled links are revoked, which needs the Bot API too
+            if invite_link_pool is not None:
+                await invite_link_pool.close()
+
+        async def post_shutdown(application: Application) -> None:
+            if referral_code_refresh is not None:
+                referral_code_refresh.cancel()
+            await task_outbox.close()
+            if http_session is not None:
+                await http_session.close()
+            await async_database.close()
+
+        application = (
+            Application.builder()
+            .token(config.bot_token)
+            .concurrent_updates(True)
+            .rate_limiter(SendScheduler(messages_per_second=config.send_rate_limit))
+            .post_init(post_init)
+            .post_stop(post_stop)
+            .post_shutdown(post_shutdown)
+            .build()
+        )
         
         # Initialize telegram utils
-        telegram_utils = TelegramUtils(application.bot, config.channel_id, config.channel_username)
+        telegram_utils = TelegramUtils(application.bot, config.channel_id, config.channel_username,
+                                       chat_info_ttl=config.chat_info_ttl)
+        
+        # Pre-created invite links so new users don't wait on create_chat_invite_link
+        invite_link_pool = None
+        if config.invite_link_pool_size > 0:
+            invite_link_pool = InviteLinkPool(
+                telegram_utils,
+                size=config.invite_link_pool_size,
+                low_water=config.invite_link_pool_low_water,
+                create_interval=config.invite_link_pool_interval
+            )
         
         # Initialize bot handlers
-        bot_handlers = BotHandlers(config, database, referral_system, telegram_utils)
+        bot_handlers = BotHandlers(config, async_database, referral_system, telegram_utils, invite_link_pool, task_outbox)
         
         # Add handlers to application
         for handler in bot_handlers.get_handlers():
@@ -0,0 +1,57 @@
+"""Channel membership state kept current from chat_member updates"""
+
+import logging
+from typing import Optional
+
+from .cache import BoundedCache, CacheSettings
+from .utils import TelegramUtils
+
+logger = logging.getLogger(__name__)
+
+# How long a membership looked up through the Bot API is trusted
+MEMBERSHIP_CHECK_TTL = 300
+
+class MembershipCache:
+    """Answer "is this user in the channel?" without a get_chat_member call.
+
+    Every join and leave the bot sees through ``chat_member_updated`` is
+    recorded here and treated as authoritative until the next event for that
+    user (ReferralSystem persists the same events with
+    ``update_channel_membership``). Users with no event since startup fall
+    back to the Bot API once; that answer is cached for ``check_ttl``
+    seconds. Failed API lookups are not cached.
+    """
+
+    def __init__(self, telegram_utils: TelegramUtils, check_ttl: float = MEMBERSHIP_CHECK_TTL,
+                 settings: Optional[CacheSettings] = None):
+        settings = settings or CacheSettings()
+        self.telegram_utils = telegram_utils
+        self._observed = BoundedCache(
+            "channel_membership",
+            CacheSettings(max_entries=settings.max_entries, ttl=None, max_bytes=settings.max_bytes)
+        )
+        self._checked = BoundedCache(
+            "channel_membership_checks",
+            CacheSettings(max_entries=settings.max_entries, ttl=check_ttl, max_bytes=settings.max_bytes)
+        )
+
+    def record(self, user_id: int, is_member: bool) -> None:
+        """Record a join or leave seen in a chat_member update"""
+        self._observed.set(user_id, is_member)
+        self._checked.pop(user_id)
+
+    async def is_member(self, user_id: int) -> bool:
+        """Current membership, asking the Bot API only for users with no recent answer"""
+        is_member = self._observed.get(user_id)
+        if is_member is None:
+            is_member = self._checked.get(user_id)
+        if is_member is not None:
+            return is_member
+        is_member = await self.telegram_utils.get_channel_membership(user_id)
+        if is_member is None:
+            return False
+        self._checked.set(user_id, is_member)
+        return is_member
+
+    def stats(self) -> dict:
+        return {"observed": self._observed.stats(), "checked": self._checked.stats()}
@@ -0,0 +1,234 @@
+"""In-memory reference storage backend for local runs and benchmarks"""
+
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .cache import CacheSettings
+from .database import generate_referral_code
+from .referral_store import _ReferrerEdges
+from .storage import REFERRAL_ALREADY_REFERRED, REFERRAL_INVALID_CODE, REFERRAL_RECORDED, REFERRAL_SELF
+
+logger = logging.getLogger(__name__)
+
+class MemoryDatabase:
+    """Storage backend that keeps everything in indexed dictionaries.
+
+    Nothing is persisted and nothing is evicted, so every lookup is a
+    dictionary access: users by user_id, users by referral code, and
+    referral edges per referrer with running active/total counters. It
+    defines the expected behaviour of the other backends and gives
+    benchmarks a floor with no I/O at all.
+    """
+
+    def __init__(self, cache_settings: Optional[CacheSettings] = None,
+                 settings: Optional[Dict[str, str]] = None,
+                 referral_targets: Optional[List[dict]] = None):
+        self.cache_settings = cache_settings or CacheSettings()
+        self.write_queue = None
+        self._lock = threading.RLock()
+        self._users: Dict[int, dict] = {}
+        self._referral_codes: Dict[str, int] = {}
+        self._referrals: Dict[int, _ReferrerEdges] = {}
+        self._invite_links: Dict[int, str] = {}
+        self._invite_link_owners: Dict[str, int] = {}
+        self._channel_events: Dict[int, List[dict]] = {}
+        self._languages: Dict[int, str] = {}
+        self._settings: Dict[str, str] = dict(settings or {})
+        self._referral_targets: Dict[int, dict] = {}
+        for i, target in enumerate(referral_targets or [], start=1):
+            target = {"is_active": True, **target}
+            self._referral_targets[target.setdefault("id", i)] = target
+
+    def add_user(self, user_id: int, username: str = None, first_name: str = None,
+                 last_name: str = None, referral_code: str = None, referred_by: int = None) -> bool:
+        """Add a new user, or refresh the profile of an existing one"""
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                user = {
+                    "id": user_id,
+                    "user_id": user_id,
+                    "username": username,
+                    "first_name": first_name,
+                    "last_name": last_name,
+                    "referral_code": referral_code or generate_referral_code(user_id),
+                    "referred_by": referred_by,
+                    "is_channel_member": False,
+                    "reward_claimed": False,
+                    "referral_target_id": None,
+                    "target_reached_at": None,
+                }
+                self._users[user_id] = user
+            else:
+                for field, value in (("username", username), ("first_name", first_name), ("last_name", last_name)):
+                    if value is not None:
+                        user[field] = value
+                if user["referred_by"] is None:
+                    user["referred_by"] = referred_by
+                if referral_code and referral_code != user["referral_code"]:
+                    self._referral_codes.pop(user["referral_code"], None)
+                    user["referral_code"] = referral_code
+            self._referral_codes[user["referral_code"]] = user_id
+        return True
+
+    def get_user(self, user_id: int) -> Optional[dict]:
+        with self._lock:
+            user = self._users.get(user_id)
+            return dict(user) if user else None
+
+    def get_user_by_referral_code(self, referral_code: str) -> Optional[dict]:
+        with self._lock:
+            user_id = self._referral_codes.get(referral_code)
+            return dict(self._users[user_id]) if user_id is not None else None
+
+    def _update_user(self, user_id: int, field: str, value) -> bool:
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is not None:
+                user[field] = value
+        return True
+
+    def update_channel_membership(self, user_id: int, is_member: bool) -> bool:
+        return self._update_user(user_id, "is_channel_member", bool(is_member))
+
+    def add_referral(self, referrer_user_id: int, referred_user_id: int) -> bool:
+        with self._lock:
+            entry = self._referrals.setdefault(referrer_user_id, _ReferrerEdges())
+            was_active = entry.edges.get(referred_user_id)
+            if was_active is None:
+                entry.total += 1
+            if not was_active:
+                entry.active += 1
+            entry.edges[referred_user_id] = True
+        return True
+
+    def record_referral(self, referrer_code: str, user_id: int, username: str = None,
+                        first_name: str = None, last_name: str = None,
+                        referral_code: str = None) -> Tuple[str, Optional[dict]]:
+        """Credit the owner of referrer_code for user_id under one lock"""
+        with self._lock:
+            referrer = self.get_user_by_referral_code(referrer_code)
+            if referrer is None:
+                return REFERRAL_INVALID_CODE, None
+            if referrer["user_id"] == user_id:
+                return REFERRAL_SELF, referrer
+            if user_id not in self._users:
+                self.add_user(user_id, username, first_name, last_name, referral_code)
+            user = self._users[user_id]
+            if user["referred_by"] is not None:
+                return REFERRAL_ALREADY_REFERRED, referrer
+            user["referred_by"] = referrer["user_id"]
+            self.add_referral(referrer["user_id"], user_id)
+        return REFERRAL_RECORDED, referrer
+
+    def get_referral_stats(self, user_id: int) -> Tuple[int, int]:
+        with self._lock:
+            entry = self._referrals.get(user_id)
+            return (entry.active, entry.total) if entry else (0, 0)
+
+    def get_referral_stats_many(self, user_ids: Sequence[int],
+                                referral_codes: Sequence[str] = ()) -> Tuple[Dict[int, Tuple[int, int]], Dict[str, int]]:
+        with self._lock:
+            owners = {code: self._referral_codes[code] for code in referral_codes if code in self._referral_codes}
+            stats = {user_id: self.get_referral_stats(user_id) for user_id in (*user_ids, *owners.values())}
+        return stats, owners
+
+    def deactivate_referral(self, referrer_user_id: int, referred_user_id: int) -> bool:
+        with self._lock:
+            entry = self._referrals.get(referrer_user_id)
+            if entry is not None and entry.edges.get(referred_user_id):
+                entry.edges[referred_user_id] = False
+                entry.active -= 1
+        return True
+
+    def mark_reward_claimed(self, user_id: int) -> bool:
+        return self._update_user(user_id, "reward_claimed", True)
+
+    def get_all_users_count(self) -> int:
+        return len(self._users)
+
+    def get_channel_members_count(self) -> int:
+        with self._lock:
+            return sum(1 for user in self._users.values() if user["is_channel_member"])
+
+    def invalidate_settings_cache(self, payload=None) -> None:
+        """Settings are never cached here"""
+
+    def watch_settings_changes(self) -> bool:
+        return True
+
+    def get_active_referral_target(self) -> Optional[int]:
+        with self._lock:
+            target_id = self._settings.get("active_referral_target_id")
+            if target_id is not None:
+                target = self._referral_targets.get(int(target_id))
+                if target and target.get("is_active"):
+                    return target["target_level"]
+            value = self._settings.get("referral_target")
+            return int(value) if value is not None else None
+
+    def get_setting(self, key: str) -> Optional[str]:
+        return self._settings.get(key)
+
+    def set_setting(self, key: str, value: str) -> None:
+        """Change a setting (the other backends are edited through their own tooling)"""
+        with self._lock:
+            self._settings[key] = value
+
+    def get_referral_target_by_id(self, target_id: int) -> Optional[dict]:
+        target = self._referral_targets.get(target_id)
+        return dict(target) if target and target.get("is_active") else None
+
+    def get_all_referral_targets(self) -> list:
+        with self._lock:
+            targets = [dict(t) for t in self._referral_targets.values() if t.get("is_active")]
+        return sorted(targets, key=lambda t: t["target_level"])
+
+    def update_user_referral_target(self, user_id: int, target_id: int) -> bool:
+        return self._update_user(user_id, "referral_target_id", target_id)
+
+    def mark_target_reached(self, user_id: int) -> bool:
+        return self._update_user(user_id, "target_reached_at", datetime.now(timezone.utc).isoformat())
+
+    def get_invite_link(self, user_id: int) -> Optional[str]:
+        return self._invite_links.get(user_id)
+
+    def get_invite_link_owner(self, invite_link: str) -> Optional[int]:
+        return self._invite_link_owners.get(invite_link)
+
+    def preload_invite_links(self) -> int:
+        return 0
+
+    def preload_referral_codes(self) -> int:
+        return 0
+
+    def refresh_referral_codes(self) -> int:
+        return 0
+
+    def store_invite_link(self, user_id: int, referral_code: str, invite_link: str, link_name: str) -> bool:
+        self._invite_links[user_id] = invite_link
+        self._invite_link_owners[invite_link] = user_id
+        return True
+
+    def log_channel_event(self, user_id: int, event_type: str) -> bool:
+        with self._lock:
+            self._channel_events.setdefault(user_id, []).append({
+                "event_type": event_type,
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            })
+        return True
+
+    def get_user_language(self, user_id: int) -> Optional[str]:
+        return self._languages.get(user_id)
+
+    def set_user_language(self, user_id: int, language_code: str) -> bool:
+        self._languages[user_id] = language_code
+        return True
+
+    def cache_stats(self) -> dict:
+        return {}
+
+    def close(self) -> None:
+        """Nothing to release"""
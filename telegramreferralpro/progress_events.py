@@ -0,0 +1,164 @@
+"""In-process fan-out of referral progress changes to live subscribers"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from .referral_system import ReferralProgress
+
+logger = logging.getLogger(__name__)
+
+# Seconds between storage checks of every subscribed user
+PROGRESS_POLL_INTERVAL = 5.0
+
+class ProgressSubscription:
+    """One subscriber's view of a user's progress: only the newest unread snapshot is kept"""
+
+    __slots__ = ("user_id", "_latest", "_ready")
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self._latest: Optional[ReferralProgress] = None
+        self._ready = asyncio.Event()
+
+    def push(self, progress: ReferralProgress) -> None:
+        self._latest = progress
+        self._ready.set()
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[ReferralProgress]:
+        """Wait for a snapshot newer than the last one read; None on timeout"""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._ready.clear()
+        progress, self._latest = self._latest, None
+        return progress
+
+class ProgressEventBus:
+    """Push a user's referral progress to everyone subscribed to that user.
+
+    ``publish(user_id)`` marks a user as changed; ReferralSystem calls it
+    from worker threads whenever a referral is recorded or deactivated.
+    A single background task reloads changed users right away and every
+    subscribed user each ``poll_interval`` seconds, however often publish
+    wakes it, so changes made by another process (the bot) are picked up
+    too. ``load`` fetches many
+    users at once, so one storage call covers all connections. A snapshot
+    equal to the last one sent is not delivered again, and a slow
+    subscriber only ever holds the newest snapshot.
+    """
+
+    def __init__(self, load: Callable[[List[int]], Awaitable[Dict[int, ReferralProgress]]],
+                 poll_interval: float = PROGRESS_POLL_INTERVAL):
+        self._load = load
+        self.poll_interval = poll_interval
+        self._subscribers: Dict[int, Set[ProgressSubscription]] = {}
+        # Last snapshot delivered per subscribed user
+        self._last: Dict[int, ReferralProgress] = {}
+        self._dirty: Set[int] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start the refresh task (call inside the event loop)"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Progress event bus started (poll_interval={self.poll_interval}s)")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def publish(self, user_id: int) -> None:
+        """Mark a user's progress as changed; safe to call from any thread"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._mark_dirty(user_id)
+        else:
+            loop.call_soon_threadsafe(self._mark_dirty, user_id)
+
+    def _mark_dirty(self, user_id: int) -> None:
+        if user_id in self._subscribers:
+            self._dirty.add(user_id)
+            self._wakeup.set()
+
+    async def subscribe(self, user_id: int) -> ProgressSubscription:
+        """Subscribe to a user; the current snapshot is the first one delivered"""
+        subscription = ProgressSubscription(user_id)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        progress = self._last.get(user_id)
+        if progress is None:
+            try:
+                progress = (await self._load([user_id])).get(user_id)
+            except Exception:
+                self.unsubscribe(subscription)
+                raise
+            if progress is not None and user_id in self._subscribers:
+                self._last.setdefault(user_id, progress)
+        if progress is not None:
+            subscription.push(progress)
+        return subscription
+
+    def unsubscribe(self, subscription: ProgressSubscription) -> None:
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.user_id]
+            self._last.pop(subscription.user_id, None)
+            self._dirty.discard(subscription.user_id)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_poll = loop.time() + self.poll_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, next_poll - loop.time()))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if loop.time() >= next_poll:
+                user_ids = set(self._subscribers)
+                next_poll = loop.time() + self.poll_interval
+            else:
+                user_ids = self._dirty
+            self._dirty = set()
+            user_ids = [user_id for user_id in user_ids if user_id in self._subscribers]
+            if not user_ids:
+                continue
+            try:
+                snapshots = await self._load(user_ids)
+            except Exception as e:
+                logger.warning(f"Could not refresh progress for {len(user_ids)} subscribed users: {e}")
+                continue
+            for user_id, progress in snapshots.items():
+                self._deliver(user_id, progress)
+
+    def _deliver(self, user_id: int, progress: ReferralProgress) -> None:
+        subscribers = self._subscribers.get(user_id)
+        if not subscribers or self._last.get(user_id) == progress:
+            return
+        self._last[user_id] = progress
+        for subscription in subscribers:
+            subscription.push(progress)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._subscribers),
+            "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+        }
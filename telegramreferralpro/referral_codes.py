@@ -0,0 +1,83 @@
+"""Signed referral codes that carry the referrer's user ID"""
+
+import hashlib
+import hmac
+import re
+import secrets
+from typing import Optional
+
+_BASE62 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+_BASE62_INDEX = {char: i for i, char in enumerate(_BASE62)}
+
+# Characters of the HMAC kept in a code (about 47 bits)
+TAG_LENGTH = 8
+
+# {base62 user_id}-{tag}; legacy ref_/user_ codes never contain "-"
+_SIGNED_CODE = re.compile(r"^([0-9A-Za-z]{1,11})-([0-9A-Za-z]{%d})$" % TAG_LENGTH)
+
+# Random codes from generate_legacy_referral_code
+_LEGACY_CODE = re.compile(r"^ref_[0-9a-f]{12}$")
+
+def b62encode(number: int) -> str:
+    if number < 0:
+        raise ValueError("base62 encodes non-negative integers only")
+    digits = []
+    while True:
+        number, remainder = divmod(number, 62)
+        digits.append(_BASE62[remainder])
+        if number == 0:
+            return "".join(reversed(digits))
+
+def b62decode(text: str) -> int:
+    number = 0
+    for char in text:
+        number = number * 62 + _BASE62_INDEX[char]
+    return number
+
+def generate_legacy_referral_code(user_id: int) -> str:
+    """Random ref_ code, used when no signing secret is configured"""
+    # Create a unique code based on user ID and random salt
+    salt = secrets.token_hex(8)
+    raw_code = f"{user_id}_{salt}"
+    hash_code = hashlib.sha256(raw_code.encode()).hexdigest()[:12]
+    return f"ref_{hash_code}"
+
+def is_signed_code(code: Optional[str]) -> bool:
+    """Whether a code has the signed format (not whether its tag is valid)"""
+    return bool(code) and _SIGNED_CODE.match(code) is not None
+
+def is_issued_format(code: Optional[str]) -> bool:
+    """Whether new codes are still issued in this code's format (signed or ref_)"""
+    return bool(code) and (_LEGACY_CODE.match(code) is not None or is_signed_code(code))
+
+class ReferralCodec:
+    """Issue and verify ``{base62 user_id}-{HMAC tag}`` referral codes.
+
+    A code decodes to its owner's user ID with no storage lookup, and a
+    code whose tag does not match is rejected outright. Codes stay short
+    enough for ``/start`` payloads and invite link names. The secret must
+    not change once codes are handed out; codes in the older ``ref_`` and
+    ``user_`` formats are still resolved through storage.
+    """
+
+    def __init__(self, secret: bytes):
+        if not secret:
+            raise ValueError("A referral code secret is required")
+        self._secret = secret
+
+    def _tag(self, user_id: int) -> str:
+        digest = hmac.new(self._secret, f"referral:{user_id}".encode(), hashlib.sha256).digest()
+        return b62encode(int.from_bytes(digest, "big"))[:TAG_LENGTH]
+
+    def encode(self, user_id: int) -> str:
+        return f"{b62encode(user_id)}-{self._tag(user_id)}"
+
+    def decode(self, code: str) -> Optional[int]:
+        """The user ID a signed code belongs to, or None if it is not a valid signed code"""
+        match = _SIGNED_CODE.match(code or "")
+        if not match:
+            return None
+        user_id = b62decode(match.group(1))
+        if not hmac.compare_digest(match.group(2), self._tag(user_id)):
+            return None
+        return user_id
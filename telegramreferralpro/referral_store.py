@@ -0,0 +1,128 @@
+"""In-memory referral graph indexed by referrer"""
+
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .cache import BoundedCache, CacheSettings
+
+class _ReferrerEdges:
+    """Referred users of one referrer with running counters"""
+    __slots__ = ("edges", "active", "total")
+
+    def __init__(self):
+        self.edges: Dict[int, bool] = {}
+        self.active = 0
+        self.total = 0
+
+class ReferralStore:
+    """Referral counters per referrer, kept in step with every add/deactivate.
+
+    A referrer's entry is created only from the complete counts read from
+    the backing store, then adjusted in place, so stats lookups never walk
+    an edge list or hit the network. ``edges`` holds only the referrals
+    seen since the load. ``add`` and ``deactivate`` ignore referrers that are
+    not loaded: starting from an empty entry would report partial counts.
+    A referrer whose entry expired or was evicted must be loaded again
+    from storage before its counts are trusted.
+
+    Reads are bracketed by ``begin_load``/``finish_load``. Every mutation
+    bumps the referrer's generation, and counts whose read overlapped a
+    mutation are not cached, since they may predate it. Callers mutate
+    only after the storage write, so a read either sees the write or is
+    discarded. With ``enabled`` False nothing is cached and every stats
+    lookup goes to storage.
+    """
+
+    def __init__(self, settings: Optional[CacheSettings] = None, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._referrers = BoundedCache("referrals", settings)
+        # referrer -> [generation, reads in flight]; only referrers being read are tracked
+        self._loading: Dict[int, List[int]] = {}
+
+    def begin_load(self, referrer_user_id: int) -> int:
+        """Start reading a referrer's counts from storage; pass the result to finish_load"""
+        with self._lock:
+            state = self._loading.setdefault(referrer_user_id, [0, 0])
+            state[1] += 1
+            return state[0]
+
+    def finish_load(self, referrer_user_id: int, generation: int, counts: Optional[Tuple[int, int]]) -> bool:
+        """Cache (active, total) read since begin_load unless a mutation raced the read.
+
+        ``counts`` None ends a read that failed. Returns whether the counts were cached.
+        """
+        with self._lock:
+            state = self._loading[referrer_user_id]
+            state[1] -= 1
+            if not state[1]:
+                del self._loading[referrer_user_id]
+            if counts is None or state[0] != generation or not self.enabled:
+                return False
+            entry = _ReferrerEdges()
+            entry.active, entry.total = counts
+            self._referrers.set(referrer_user_id, entry)
+            return True
+
+    def invalidate(self, referrer_user_id: int) -> None:
+        """Forget a referrer's counts, e.g. once queued referrals reached storage"""
+        with self._lock:
+            self._bump(referrer_user_id)
+            self._referrers.pop(referrer_user_id)
+
+    def _bump(self, referrer_user_id: int) -> None:
+        state = self._loading.get(referrer_user_id)
+        if state is not None:
+            state[0] += 1
+
+    def is_loaded(self, referrer_user_id: int) -> bool:
+        return referrer_user_id in self._referrers
+
+    def add(self, referrer_user_id: int, referred_user_id: int) -> None:
+        """Count a new active referral (re-activates an existing edge); no-op for referrers not loaded.
+
+        A user is credited to at most one referrer once, so an edge missing
+        from ``edges`` is not already part of the loaded counts.
+        """
+        with self._lock:
+            self._bump(referrer_user_id)
+            entry = self._referrers.peek(referrer_user_id)
+            if entry is None:
+                return
+            was_active = entry.edges.get(referred_user_id)
+            if was_active is None:
+                entry.total += 1
+            if not was_active:
+                entry.active += 1
+            entry.edges[referred_user_id] = True
+            self._referrers.touch(referrer_user_id)
+
+    def deactivate(self, referrer_user_id: int, referred_user_id: int) -> bool:
+        """Mark an edge inactive. Returns False if the edge is unknown."""
+        with self._lock:
+            self._bump(referrer_user_id)
+            entry = self._referrers.peek(referrer_user_id)
+            if entry is None:
+                return False
+            if referred_user_id not in entry.edges:
+                # Loaded counts do not say whether this edge is still active
+                self._referrers.pop(referrer_user_id)
+                return False
+            if entry.edges[referred_user_id]:
+                entry.edges[referred_user_id] = False
+                entry.active -= 1
+            return True
+
+    def stats(self, referrer_user_id: int) -> Optional[Tuple[int, int]]:
+        """Return (active, total) for a loaded referrer, or None if it must be read from storage"""
+        with self._lock:
+            entry = self._referrers.get(referrer_user_id)
+            if entry is None:
+                return None
+            return entry.active, entry.total
+
+    def cache_stats(self) -> dict:
+        return self._referrers.stats()
+
+    def __len__(self) -> int:
+        return len(self._referrers)
@@ -1,22 +1,75 @@
-import hashlib
-import secrets
 import logging
-from typing import Optional, Tuple, List
-from .database import Database
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional, Sequence, Tuple, List
+from .cache import BoundedCache, CacheSettings
+from .referral_codes import ReferralCodec, generate_legacy_referral_code, is_signed_code
+from .storage import REFERRAL_ALREADY_REFERRED, REFERRAL_INVALID_CODE, REFERRAL_RECORDED, REFERRAL_SELF, Storage
 
 logger = logging.getLogger(__name__)
 
+# Name given to each user's invite link: Referral-{referral_code}
+INVITE_LINK_NAME_PREFIX = "Referral-"
+
+# Referral events invalidate snapshots; the TTL bounds how long a changed target goes unnoticed
+PROGRESS_SNAPSHOT_TTL = 60
+
+@dataclass(frozen=True)
+class ReferralProgress:
+    """A user's referral counts against the active target at one point in time"""
+    active_referrals: int
+    total_referrals: int
+    target: int
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.target - self.active_referrals)
+
+    @property
+    def target_reached(self) -> bool:
+        return self.active_referrals >= self.target
+
+    @property
+    def progress_percentage(self) -> float:
+        return min(100, (self.active_referrals / self.target) * 100) if self.target > 0 else 0
+
+    def as_dict(self) -> dict:
+        """The dict returned by get_referral_progress"""
+        return {
+            **asdict(self),
+            'remaining': self.remaining,
+            'target_reached': self.target_reached,
+            'progress_percentage': self.progress_percentage
+        }
+
 class ReferralSystem:
-    def __init__(self, database: Database):
+    def __init__(self, database: Storage, progress_ttl: float = PROGRESS_SNAPSHOT_TTL,
+                 codec: Optional[ReferralCodec] = None, events=None):
         self.db = database
+        # Issues signed codes when a secret is configured; otherwise random ref_ codes
+        self.codec = codec
+        # Optional ProgressEventBus told about every referral change
+        self.events = events
+        # user_id -> ReferralProgress; dropped on every referral event for that user
+        self._progress = None
+        if progress_ttl > 0:
+            self._progress = BoundedCache(
+                "referral_progress",
+                CacheSettings(max_entries=database.cache_settings.max_entries, ttl=progress_ttl),
+                loader=self._load_progress
+            )
     
     def generate_referral_code(self, user_id: int) -> str:
         """Generate a unique referral code for a user"""
-        # Create a unique code based on user ID and random salt
-        salt = secrets.token_hex(8)
-        raw_code = f"{user_id}_{salt}"
-        hash_code = hashlib.sha256(raw_code.encode()).hexdigest()[:12]
-        return f"ref_{hash_code}"
+        if self.codec is not None:
+            return self.codec.encode(user_id)
+        return generate_legacy_referral_code(user_id)
+    
+    def resolve_referral_code(self, referral_code: str) -> Optional[int]:
+        """User ID owning a referral code; signed codes are decoded without a storage lookup"""
+        if self.codec is not None and is_signed_code(referral_code):
+            return self.codec.decode(referral_code)
+        user = self.db.get_user_by_referral_code(referral_code)
+        return user['user_id'] if user else None
     
     def get_active_referral_target(self) -> int:
         """Get the current active referral target from database"""
@@ -33,70 +86,124 @@ class ReferralSystem:
             logger.error(f"Error getting referral target: {e}")
             return 5
 
-    def process_referral(self, referrer_code: str, new_user_id: int) -> Tuple[bool, str]:
-        """Process a new referral"""
+    def process_referral(self, referrer_code: str, new_user_id: int, username: str = None,
+                         first_name: str = None, last_name: str = None) -> Tuple[bool, str]:
+        """Process a new referral; the profile fills the user row if this call creates it"""
         try:
-            # Find the referrer
-            referrer = self.db.get_user_by_referral_code(referrer_code)
-            if not referrer:
-                return False, "Invalid referral code"
-            
-            referrer_id = referrer['user_id']
+            # Forged and self-referring signed codes are rejected before storage is touched
+            if self.codec is not None and is_signed_code(referrer_code):
+                referrer_id = self.codec.decode(referrer_code)
+                if referrer_id is None:
+                    return False, "Invalid referral code"
+                if referrer_id == new_user_id:
+                    return False, "You cannot refer yourself"
             
-            # Check if user is trying to refer themselves
-            if referrer_id == new_user_id:
+            # Validation, the user row and the referral are written in one atomic step
+            status, referrer = self.db.record_referral(
+                referrer_code, new_user_id, username=username, first_name=first_name, last_name=last_name,
+                referral_code=self.generate_referral_code(new_user_id)
+            )
+            if status == REFERRAL_RECORDED:
+                self.invalidate_progress(referrer['user_id'])
+                return True, f"Successfully referred by {referrer['first_name'] or referrer['username'] or 'User'}"
+            if status == REFERRAL_INVALID_CODE:
+                return False, "Invalid referral code"
+            if status == REFERRAL_SELF:
                 return False, "You cannot refer yourself"
-            
-            # Check if this referral already exists
-            existing_user = self.db.get_user(new_user_id)
-            if existing_user and existing_user['referred_by']:
+            if status == REFERRAL_ALREADY_REFERRED:
                 return False, "You were already referred by someone else"
-            
-            # Add the referral
-            success = self.db.add_referral(referrer_id, new_user_id)
-            if success:
-                # Update the new user's referrer
-                self.db.add_user(
-                    new_user_id, 
-                    referred_by=referrer_id
-                )
-                return True, f"Successfully referred by {referrer['first_name'] or referrer['username'] or 'User'}"
-            else:
-                return False, "Failed to process referral"
+            return False, "Failed to process referral"
                 
         except Exception as e:
             logger.error(f"Error processing referral: {e}")
             return False, "An error occurred while processing the referral"
     
-    def extract_referral_code_from_invite_link(self, invite_link: str) -> Optional[str]:
+    def extract_referral_code_from_invite_link(self, invite_link_name: str) -> Optional[str]:
         """Extract referral code from invite link name"""
+        # The invite link name format is "Referral-{referral_code}"
+        if invite_link_name and invite_link_name.startswith(INVITE_LINK_NAME_PREFIX):
+            return invite_link_name[len(INVITE_LINK_NAME_PREFIX):] or None
+        return None
+    
+    def get_referrer_for_invite_link(self, invite_link: Optional[str], invite_link_name: Optional[str] = None) -> Optional[int]:
+        """Find the user whose invite link was used, by URL first and then by link name"""
         try:
-            # The invite link name format is "Referral-{referral_code}"
-            # We need to track this mapping in the database
-            return None  # This will be handled by tracking invite link usage
+            if invite_link:
+                owner = self.db.get_invite_link_owner(invite_link)
+                if owner is not None:
+                    return owner
+            referral_code = self.extract_referral_code_from_invite_link(invite_link_name)
+            if referral_code:
+                return self.resolve_referral_code(referral_code)
+            return None
         except Exception as e:
-            logger.error(f"Error extracting referral code from invite link: {e}")
+            logger.error(f"Error resolving invite link referrer: {e}")
             return None
     
     def check_referral_target_reached(self, user_id: int) -> bool:
         """Check if user has reached their referral target"""
-        target = self.get_active_referral_target()
-        active_referrals, _ = self.db.get_referral_stats(user_id)
-        return active_referrals >= target
+        return self.get_progress(user_id).target_reached
     
     def get_referral_progress(self, user_id: int) -> dict:
         """Get detailed referral progress for a user"""
+        return self.get_progress(user_id).as_dict()
+    
+    def get_progress(self, user_id: int) -> ReferralProgress:
+        """Progress snapshot for a user, reused until a referral event changes it"""
+        if self._progress is None:
+            return self._load_progress(user_id)
+        return self._progress.get(user_id)
+    
+    def get_progress_many(self, user_ids: Sequence[int], referral_codes: Sequence[str] = ()
+                          ) -> Tuple[Dict[int, ReferralProgress], Dict[str, Optional[int]]]:
+        """Progress for many users and referral code owners, with one storage call for everything not cached.
+
+        Returns the snapshots by user ID and the owner of each referral code
+        (None for unknown or forged codes).
+        """
+        owners: Dict[str, Optional[int]] = {}
+        lookup_codes = []
+        for referral_code in dict.fromkeys(referral_codes):
+            if self.codec is not None and is_signed_code(referral_code):
+                owners[referral_code] = self.codec.decode(referral_code)
+            else:
+                lookup_codes.append(referral_code)
+        
+        progress: Dict[int, ReferralProgress] = {}
+        missing = []
+        for user_id in dict.fromkeys((*user_ids, *(owner for owner in owners.values() if owner is not None))):
+            snapshot = self._progress.peek(user_id) if self._progress is not None else None
+            if snapshot is not None:
+                progress[user_id] = snapshot
+            else:
+                missing.append(user_id)
+        if not missing and not lookup_codes:
+            return progress, owners
+        
+        target = self.get_active_referral_target()
+        stats, code_owners = self.db.get_referral_stats_many(missing, lookup_codes)
+        for referral_code in lookup_codes:
+            owners[referral_code] = code_owners.get(referral_code)
+        for user_id, (active_referrals, total_referrals) in stats.items():
+            if user_id in progress:
+                continue
+            snapshot = ReferralProgress(active_referrals, total_referrals, target)
+            progress[user_id] = snapshot
+            if self._progress is not None:
+                self._progress.set(user_id, snapshot)
+        return progress, owners
+    
+    def _load_progress(self, user_id: int) -> ReferralProgress:
         target = self.get_active_referral_target()
         active_referrals, total_referrals = self.db.get_referral_stats(user_id)
-        
-        return {
-            'active_referrals': active_referrals,
-            'total_referrals': total_referrals,
-            'target': target,
-            'remaining': max(0, target - active_referrals),
-            'target_reached': active_referrals >= target,
-            'progress_percentage': min(100, (active_referrals / target) * 100) if target > 0 else 0
-        }
+        return ReferralProgress(active_referrals, total_referrals, target)
+    
+    def invalidate_progress(self, user_id: int) -> None:
+        """Drop a user's snapshot after their referrals changed"""
+        if self._progress is not None:
+            self._progress.pop(user_id)
+        if self.events is not None:
+            self.events.publish(user_id)
     
     def handle_user_left_channel(self, user_id: int) -> List[int]:
         """Handle when a user leaves the channel - notify their referrer"""
@@ -112,6 +219,7 @@ class ReferralSystem:
             if user and user['referred_by']:
                 referrer_id = user['referred_by']
                 self.db.deactivate_referral(referrer_id, user_id)
+                self.invalidate_progress(referrer_id)
                 affected_referrers.append(referrer_id)
             
             # Also deactivate any referrals this user made
@@ -123,15 +231,38 @@ class ReferralSystem:
             logger.error(f"Error handling user left channel: {e}")
             return []
     
-    def handle_user_joined_channel(self, user_id: int) -> Optional[int]:
-        """Handle when a user joins the channel"""
+    def handle_user_joined_channel(self, user_id: int, invite_link: Optional[str] = None,
+                                   invite_link_name: Optional[str] = None, username: str = None,
+                                   first_name: str = None, last_name: str = None) -> Optional[int]:
+        """Handle when a user joins the channel, crediting the owner of the invite link they used"""
         try:
             # Update user's channel membership
             self.db.update_channel_membership(user_id, True)
 
+            user = self.db.get_user(user_id)
+            
+            # Attribute joins through a referral invite link to its owner
+            if invite_link or invite_link_name:
+                referrer_id = self.get_referrer_for_invite_link(invite_link, invite_link_name)
+                referrer = self.db.get_user(referrer_id) if referrer_id and referrer_id != user_id \
+                    and not (user and user['referred_by']) else None
+                if referrer:
+                    status, _ = self.db.record_referral(
+                        referrer['referral_code'], user_id,
+                        username=username, first_name=first_name, last_name=last_name,
+                        referral_code=self.generate_referral_code(user_id)
+                    )
+                    if status == REFERRAL_RECORDED:
+                        self.invalidate_progress(referrer_id)
+                        if user is None:
+                            # The users row was only just created
+                            self.db.update_channel_membership(user_id, True)
+                        logger.info(f"User {user_id} joined through the invite link of user {referrer_id}")
+                        return referrer_id
+                    # Already referred, e.g. by a /start that raced this join
+                    user = self.db.get_user(user_id)
             
             # If this user was referred, activate the referral
-            user = self.db.get_user(user_id)
             if user and user['referred_by']:
                 referrer_id = user['referred_by']
                 # Referral is automatically active when user is channel member
@@ -0,0 +1,96 @@
+"""Referrer join/leave notifications coalesced into periodic digests"""
+
+import asyncio
+import logging
+from typing import Dict, List, Set
+
+from .async_database import AsyncDatabase
+from .messages import Messages
+from .referral_system import ReferralProgress, ReferralSystem
+from .send_scheduler import PRIORITY_NOTIFICATION
+from .utils import TelegramUtils
+
+logger = logging.getLogger(__name__)
+
+# Seconds a referrer's events are collected before one digest is sent
+REFERRER_DIGEST_WINDOW = 30
+
+class ReferrerNotifier:
+    """Buffer join/leave events per referrer and send one digest per window.
+
+    The first event for a referrer starts a ``window``-second timer; every
+    join or leave until it fires is added to the same digest. Progress is
+    read once per digest, just before sending; the join or leave already
+    invalidated the referrer's snapshot, so it is current. ``close()`` sends
+    whatever is still buffered.
+    """
+
+    def __init__(self, database: AsyncDatabase, referral_system: ReferralSystem,
+                 telegram_utils: TelegramUtils, window: float = REFERRER_DIGEST_WINDOW):
+        self.db = database
+        self.referral_system = referral_system
+        self.telegram_utils = telegram_utils
+        self.window = window
+        self.messages = Messages()
+        # referrer_id -> [joined, left]
+        self._pending: Dict[int, List[int]] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._flushing: Set[asyncio.Task] = set()
+
+    def joined(self, referrer_id: int) -> None:
+        """Someone joined through this referrer"""
+        self._record(referrer_id, 0)
+
+    def left(self, referrer_id: int) -> None:
+        """One of this referrer's referrals left the channel"""
+        self._record(referrer_id, 1)
+
+    def _record(self, referrer_id: int, slot: int) -> None:
+        counts = self._pending.setdefault(referrer_id, [0, 0])
+        counts[slot] += 1
+        if referrer_id not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[referrer_id] = loop.call_later(self.window, self._start_flush, referrer_id)
+
+    def _start_flush(self, referrer_id: int) -> None:
+        self._timers.pop(referrer_id, None)
+        task = asyncio.create_task(self._flush(referrer_id))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def close(self) -> None:
+        """Send all buffered digests now"""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        await asyncio.gather(*self._flushing, *(self._flush(r) for r in list(self._pending)), return_exceptions=True)
+
+    async def _flush(self, referrer_id: int) -> None:
+        counts = self._pending.pop(referrer_id, None)
+        if not counts:
+            return
+        joined, left = counts
+        try:
+            referrer = await self.db.get_user(referrer_id)
+            if not referrer:
+                return
+            progress = await self.db.run(self.referral_system.get_progress, referrer_id)
+            message = self.format_digest(joined, left, progress, referrer['reward_claimed'])
+            await self.telegram_utils.send_message_safe(referrer_id, message, priority=PRIORITY_NOTIFICATION)
+        except Exception as e:
+            logger.error(f"Error notifying referrer {referrer_id}: {e}")
+
+    def format_digest(self, joined: int, left: int, progress: ReferralProgress, reward_claimed: bool) -> str:
+        if joined and progress.target_reached and not reward_claimed:
+            return self.messages.REWARD_AVAILABLE
+        lines = []
+        if joined == 1:
+            lines.append("🎉 Great news! Someone joined using your referral link!")
+        elif joined:
+            lines.append(f"🎉 Great news! {joined} people joined using your referral link!")
+        if left == 1:
+            lines.append("📉 One of your referrals left the channel.")
+        elif left:
+            lines.append(f"📉 {left} of your referrals left the channel.")
+        lines.append(f"\nYour progress: {progress.active_referrals}/{progress.target}")
+        return "\n".join(lines)
@@ -0,0 +1,197 @@
+"""Central scheduler for outgoing Bot API messages within Telegram's rate limits"""
+
+import asyncio
+import itertools
+import logging
+from collections import deque
+from typing import Any, Callable, Coroutine, Deque, Dict, List, Optional, Set, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes, passed as rate_limit_args; lower values are sent first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NOTIFICATION = 1
+
+# Requests that post or change a message in a chat and count against the limits
+SEND_ENDPOINTS = frozenset({
+    "sendMessage", "editMessageText", "editMessageReplyMarkup", "editMessageCaption",
+    "sendPhoto", "sendDocument", "sendAnimation", "sendVideo", "sendSticker",
+    "sendMediaGroup", "forwardMessage", "copyMessage",
+})
+
+# Per-chat windows are dropped once this many are tracked and they have gone quiet
+CHAT_WINDOW_PRUNE_THRESHOLD = 10000
+
+class _SlidingWindow:
+    """At most ``limit`` sends in any ``period`` seconds"""
+    __slots__ = ("limit", "period", "sent")
+
+    def __init__(self, limit: int, period: float):
+        self.limit = limit
+        self.period = period
+        self.sent: Deque[float] = deque()
+
+    def delay(self, now: float) -> float:
+        """Seconds until another send is allowed"""
+        while self.sent and now - self.sent[0] >= self.period:
+            self.sent.popleft()
+        if len(self.sent) < self.limit:
+            return 0.0
+        return self.sent[0] + self.period - now
+
+    def record(self, now: float) -> None:
+        self.sent.append(now)
+
+class _SendJob:
+    __slots__ = ("callback", "args", "kwargs", "chat_id", "future", "attempt")
+
+    def __init__(self, callback, args, kwargs, chat_id, future: asyncio.Future):
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.chat_id = chat_id
+        self.future = future
+        self.attempt = 0
+
+class SendScheduler(BaseRateLimiter[int]):
+    """Rate limiter installed on the Application, so every outgoing message is scheduled.
+
+    Message requests (``SEND_ENDPOINTS``) wait in a priority queue and are
+    released by one dispatcher when the global window (about 30 msg/s) and
+    the target chat's window (1 msg/s in private chats, 20/min in groups and
+    channels) both allow it. A chat that is still cooling down is deferred
+    without holding up other chats. Interactive replies go before referrer
+    notifications; ``TelegramUtils.send_message_safe(priority=...)`` passes
+    the lane through ``rate_limit_args``. A ``RetryAfter`` pauses all
+    sending for the requested time and re-queues the message, up to
+    ``max_retries`` times. Other requests are passed straight through.
+    """
+
+    def __init__(self, messages_per_second: int = 30, private_chat_interval: float = 1.0,
+                 group_messages_per_minute: int = 20, max_retries: int = 3):
+        self.messages_per_second = messages_per_second
+        self.private_chat_interval = private_chat_interval
+        self.group_messages_per_minute = group_messages_per_minute
+        self.max_retries = max_retries
+        self._global = _SlidingWindow(messages_per_second, 1.0)
+        self._chats: Dict[Any, _SlidingWindow] = {}
+        self._paused_until = 0.0
+        self._sequence = itertools.count()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Future] = set()
+        self._sending: Set[asyncio.Task] = set()
+
+    async def initialize(self) -> None:
+        self._queue = asyncio.PriorityQueue()
+        self._task = asyncio.create_task(self._dispatch())
+        logger.info(f"Send scheduler started ({self.messages_per_second} msg/s)")
+
+    async def shutdown(self, timeout: float = 10.0) -> None:
+        """Give queued messages a chance to go out, then stop"""
+        if self._task is None:
+            return
+        if self._pending:
+            await asyncio.wait(list(self._pending), timeout=timeout)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for future in self._pending:
+            future.cancel()
+        if self._pending:
+            logger.warning(f"Send scheduler stopped with {len(self._pending)} unsent messages")
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        if endpoint not in SEND_ENDPOINTS or self._task is None:
+            return await callback(*args, **kwargs)
+        priority = rate_limit_args if isinstance(rate_limit_args, int) else PRIORITY_INTERACTIVE
+        future = asyncio.get_running_loop().create_future()
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        self._queue.put_nowait((priority, next(self._sequence), _SendJob(callback, args, kwargs, data.get("chat_id"), future)))
+        return await future
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            priority, sequence, job = await self._queue.get()
+            if job.future.done():
+                continue
+            now = loop.time()
+            wait = max(self._paused_until - now, self._global.delay(now))
+            if wait > 0:
+                # Put it back so a higher-priority message that arrives meanwhile goes first
+                self._queue.put_nowait((priority, sequence, job))
+                await asyncio.sleep(wait)
+                continue
+            window = self._chat_window(job.chat_id, now)
+            chat_wait = window.delay(now) if window else 0.0
+            if chat_wait > 0:
+                loop.call_later(chat_wait, self._queue.put_nowait, (priority, sequence, job))
+                continue
+            self._global.record(now)
+            if window:
+                window.record(now)
+            task = asyncio.create_task(self._send(priority, sequence, job))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, priority: int, sequence: int, job: _SendJob) -> None:
+        try:
+            result = await job.callback(*job.args, **job.kwargs)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            seconds = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+            self._paused_until = max(self._paused_until, asyncio.get_running_loop().time() + seconds)
+            job.attempt += 1
+            logger.warning(f"Flood control: pausing sends for {seconds:g}s (chat {job.chat_id}, attempt {job.attempt})")
+            if job.attempt > self.max_retries:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                # Same sequence number, so it keeps its place in line
+                self._queue.put_nowait((priority, sequence, job))
+            return
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+        if not job.future.done():
+            job.future.set_result(result)
+
+    def _chat_window(self, chat_id: Any, now: float) -> Optional[_SlidingWindow]:
+        if chat_id is None:
+            return None
+        window = self._chats.get(chat_id)
+        if window is None:
+            if len(self._chats) >= CHAT_WINDOW_PRUNE_THRESHOLD:
+                self._prune(now)
+            try:
+                private = int(chat_id) > 0
+            except (TypeError, ValueError):
+                private = False  # @username of a group or channel
+            if private:
+                window = _SlidingWindow(1, self.private_chat_interval)
+            else:
+                window = _SlidingWindow(self.group_messages_per_minute, 60.0)
+            self._chats[chat_id] = window
+        return window
+
+    def _prune(self, now: float) -> None:
+        idle = [chat_id for chat_id, window in self._chats.items() if window.delay(now) == 0 and not window.sent]
+        for chat_id in idle:
+            del self._chats[chat_id]
@@ -0,0 +1,611 @@
+"""Embedded SQLite storage backend for single-node deployments"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from .cache import CacheSettings
+from .database import generate_referral_code
+from .storage import REFERRAL_ALREADY_REFERRED, REFERRAL_INVALID_CODE, REFERRAL_RECORDED, REFERRAL_SELF
+
+logger = logging.getLogger(__name__)
+
+# Writes queued while a transaction commits are folded into the next one
+WRITE_BATCH_LIMIT = 256
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT_SECONDS = 30.0
+
+# Same tables as bot_database.db plus the settings/targets the Supabase schema has
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    first_name TEXT,
+    last_name TEXT,
+    referral_code TEXT UNIQUE,
+    referred_by INTEGER,
+    join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_channel_member BOOLEAN DEFAULT FALSE,
+    reward_claimed BOOLEAN DEFAULT FALSE,
+    referral_target_id INTEGER,
+    target_reached_at TIMESTAMP,
+    FOREIGN KEY (referred_by) REFERENCES users (user_id)
+);
+CREATE TABLE IF NOT EXISTS referrals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    referrer_id INTEGER,
+    referred_user_id INTEGER,
+    join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_active BOOLEAN DEFAULT TRUE,
+    FOREIGN KEY (referrer_id) REFERENCES users (user_id),
+    FOREIGN KEY (referred_user_id) REFERENCES users (user_id),
+    UNIQUE(referrer_id, referred_user_id)
+);
+CREATE TABLE IF NOT EXISTS channel_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    event_type TEXT,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (user_id)
+);
+CREATE TABLE IF NOT EXISTS user_languages (
+    user_id INTEGER PRIMARY KEY,
+    language_code TEXT DEFAULT 'en',
+    detected_language TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (user_id)
+);
+CREATE TABLE IF NOT EXISTS invite_links (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    referral_code TEXT,
+    invite_link TEXT UNIQUE,
+    invite_link_name TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_active BOOLEAN DEFAULT TRUE,
+    FOREIGN KEY (user_id) REFERENCES users (user_id)
+);
+CREATE TABLE IF NOT EXISTS settings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT UNIQUE NOT NULL,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS referral_targets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    target_level INTEGER NOT NULL DEFAULT 5,
+    reward_description TEXT,
+    reward_amount DECIMAL(10,2),
+    is_active BOOLEAN DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Created after the column upgrades so older bot_database.db files can be opened
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_users_referred_by ON users(referred_by);
+CREATE INDEX IF NOT EXISTS idx_users_channel_member ON users(is_channel_member);
+CREATE INDEX IF NOT EXISTS idx_referrals_referrer_active ON referrals(referrer_id, is_active);
+CREATE INDEX IF NOT EXISTS idx_referrals_referred_user ON referrals(referred_user_id);
+CREATE INDEX IF NOT EXISTS idx_channel_events_user ON channel_events(user_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_invite_links_user ON invite_links(user_id, is_active);
+CREATE INDEX IF NOT EXISTS idx_referral_targets_active ON referral_targets(is_active, target_level);
+"""
+
+# Columns added to users after bot_database.db was first shipped
+_USER_COLUMN_UPGRADES = {
+    "referral_target_id": "INTEGER",
+    "target_reached_at": "TIMESTAMP",
+}
+
+_UPSERT_USER = """
+INSERT INTO users (user_id, username, first_name, last_name, referral_code, referred_by)
+VALUES (:user_id, :username, :first_name, :last_name, :referral_code, :referred_by)
+ON CONFLICT(user_id) DO UPDATE SET
+    username = COALESCE(excluded.username, users.username),
+    first_name = COALESCE(excluded.first_name, users.first_name),
+    last_name = COALESCE(excluded.last_name, users.last_name),
+    referral_code = COALESCE(:explicit_referral_code, users.referral_code, excluded.referral_code),
+    referred_by = COALESCE(users.referred_by, excluded.referred_by)
+"""
+_SELECT_USER = "SELECT * FROM users WHERE user_id = ?"
+_SELECT_USER_BY_CODE = "SELECT * FROM users WHERE referral_code = ?"
+_UPDATE_CHANNEL_MEMBERSHIP = "UPDATE users SET is_channel_member = ? WHERE user_id = ?"
+_UPDATE_REWARD_CLAIMED = "UPDATE users SET reward_claimed = 1 WHERE user_id = ?"
+_UPDATE_REFERRAL_TARGET = "UPDATE users SET referral_target_id = ? WHERE user_id = ?"
+_UPDATE_TARGET_REACHED = "UPDATE users SET target_reached_at = ? WHERE user_id = ?"
+_COUNT_USERS = "SELECT COUNT(*) FROM users"
+_COUNT_CHANNEL_MEMBERS = "SELECT COUNT(*) FROM users WHERE is_channel_member = 1"
+
+_UPSERT_REFERRAL = """
+INSERT INTO referrals (referrer_id, referred_user_id, is_active) VALUES (?, ?, 1)
+ON CONFLICT(referrer_id, referred_user_id) DO UPDATE SET is_active = 1
+"""
+_SELECT_REFERRED_BY = """
+SELECT referred_by, EXISTS(SELECT 1 FROM referrals WHERE referred_user_id = :user_id)
+FROM users WHERE user_id = :user_id
+"""
+_SET_REFERRED_BY = "UPDATE users SET referred_by = ? WHERE user_id = ?"
+_DEACTIVATE_REFERRAL = "UPDATE referrals SET is_active = 0 WHERE referrer_id = ? AND referred_user_id = ?"
+_REFERRAL_COUNTS = "SELECT COALESCE(SUM(is_active), 0), COUNT(*) FROM referrals WHERE referrer_id = ?"
+# Lists are bound as JSON arrays so a batch of any size is one statement
+_SELECT_CODE_OWNERS = "SELECT referral_code, user_id FROM users WHERE referral_code IN (SELECT value FROM json_each(?))"
+_REFERRAL_COUNTS_MANY = """
+SELECT referrer_id, COALESCE(SUM(is_active), 0), COUNT(*) FROM referrals
+WHERE referrer_id IN (SELECT value FROM json_each(?)) GROUP BY referrer_id
+"""
+
+_SELECT_SETTING = "SELECT value FROM settings WHERE key = ?"
+_SELECT_TARGET_LEVEL = "SELECT target_level FROM referral_targets WHERE id = ? AND is_active = 1"
+_SELECT_TARGET = "SELECT * FROM referral_targets WHERE id = ? AND is_active = 1"
+_SELECT_ACTIVE_TARGETS = "SELECT * FROM referral_targets WHERE is_active = 1 ORDER BY target_level"
+
+_SELECT_INVITE_LINK = """
+SELECT invite_link FROM invite_links WHERE user_id = ? AND is_active = 1
+ORDER BY id DESC LIMIT 1
+"""
+_SELECT_INVITE_LINK_OWNER = "SELECT user_id FROM invite_links WHERE invite_link = ?"
+_UPSERT_INVITE_LINK = """
+INSERT INTO invite_links (user_id, referral_code, invite_link, invite_link_name, is_active)
+VALUES (?, ?, ?, ?, 1)
+ON CONFLICT(invite_link) DO UPDATE SET
+    user_id = excluded.user_id,
+    referral_code = excluded.referral_code,
+    invite_link_name = excluded.invite_link_name,
+    is_active = 1
+"""
+_INSERT_CHANNEL_EVENT = "INSERT INTO channel_events (user_id, event_type, timestamp) VALUES (?, ?, ?)"
+
+_SELECT_LANGUAGE = "SELECT language_code FROM user_languages WHERE user_id = ?"
+_UPSERT_LANGUAGE = """
+INSERT INTO user_languages (user_id, language_code, updated_at) VALUES (?, ?, ?)
+ON CONFLICT(user_id) DO UPDATE SET language_code = excluded.language_code, updated_at = excluded.updated_at
+"""
+
+class SQLiteDatabase:
+    """Drop-in replacement for Database backed by a local SQLite file.
+
+    The file runs in WAL mode so readers never block the writer. Every
+    thread that reads gets its own connection; all writes go through one
+    dedicated writer thread, which folds whatever is queued into a single
+    transaction (one fsync per batch instead of per statement). Callers
+    still block until their write has committed, so the synchronous
+    Database contract is unchanged. Statements are fixed, parameterized
+    strings, so sqlite3's per-connection statement cache reuses the
+    prepared statements.
+    """
+
+    def __init__(self, database_path: str = "bot_database.db", cache_settings: Optional[CacheSettings] = None):
+        self.database_path = database_path
+        self.cache_settings = cache_settings or CacheSettings()
+        # No remote round trips to batch; kept for interface compatibility
+        self.write_queue = None
+        directory = os.path.dirname(os.path.abspath(database_path))
+        os.makedirs(directory, exist_ok=True)
+        self._initialize_schema()
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self._writes: "queue.Queue" = queue.Queue()
+        self._writer = threading.Thread(target=self._writer_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+        logger.info(f"SQLite database ready at {database_path} (WAL mode)")
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.database_path,
+            timeout=BUSY_TIMEOUT_SECONDS,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous = NORMAL")
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def _initialize_schema(self) -> None:
+        conn = self._connect()
+        try:
+            mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+            if mode.lower() != "wal":
+                logger.warning(f"SQLite WAL mode unavailable, using {mode} journal")
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(users)")}
+            for column, column_type in _USER_COLUMN_UPGRADES.items():
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE users ADD COLUMN {column} {column_type}")
+            conn.executescript(_INDEXES)
+        finally:
+            conn.close()
+
+    def _reader(self) -> sqlite3.Connection:
+        """Connection owned by the calling thread"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect(read_only=True)
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def _read_one(self, sql: str, params: tuple = ()) -> Optional[sqlite3.Row]:
+        return self._reader().execute(sql, params).fetchone()
+
+    def _write(self, sql: str, params=()) -> int:
+        """Run a statement on the writer thread and wait for its commit. Returns the row count."""
+        future: Future = Future()
+        self._writes.put((sql, params, future))
+        return future.result()
+
+    def _write_transaction(self, work: Callable[[sqlite3.Connection], object]):
+        """Run work(conn) on the writer thread as one atomic unit and wait for its commit"""
+        future: Future = Future()
+        self._writes.put((work, None, future))
+        return future.result()
+
+    def _writer_loop(self) -> None:
+        conn = self._connect()
+        running = True
+        while running:
+            item = self._writes.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < WRITE_BATCH_LIMIT:
+                try:
+                    item = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            self._commit_batch(conn, batch)
+        conn.close()
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch: list) -> None:
+        # A savepoint per statement keeps one failing write from rolling back the rest
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for sql, params, future in batch:
+                conn.execute("SAVEPOINT write")
+                try:
+                    if callable(sql):
+                        result = sql(conn)
+                    else:
+                        result = conn.execute(sql, params).rowcount
+                    conn.execute("RELEASE write")
+                    results.append((future, result, None))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write")
+                    conn.execute("RELEASE write")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            logger.error(f"SQLite write batch of {len(batch)} statements failed: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def close(self) -> None:
+        """Commit queued writes, stop the writer thread and close every connection"""
+        if self._writer.is_alive():
+            self._writes.put(None)
+            self._writer.join()
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        logger.info("SQLite database closed")
+
+    def _user_from_row(self, row: sqlite3.Row) -> dict:
+        """Convert a users row into the same shape Database returns"""
+        return {
+            "id": row["user_id"],
+            "user_id": row["user_id"],
+            "username": row["username"],
+            "first_name": row["first_name"],
+            "last_name": row["last_name"],
+            "referral_code": row["referral_code"],
+            "referred_by": row["referred_by"],
+            "is_channel_member": bool(row["is_channel_member"]),
+            "reward_claimed": bool(row["reward_claimed"]),
+            "referral_target_id": row["referral_target_id"],
+            "target_reached_at": row["target_reached_at"],
+        }
+
+    def add_user(self, user_id: int, username: str = None, first_name: str = None,
+                 last_name: str = None, referral_code: str = None, referred_by: int = None) -> bool:
+        """Add a new user, or refresh the profile of an existing one.
+
+        An existing user keeps their referral code and referrer unless a new
+        code is passed explicitly.
+        """
+        try:
+            self._write(_UPSERT_USER, {
+                "user_id": user_id,
+                "username": username,
+                "first_name": first_name,
+                "last_name": last_name,
+                "referral_code": referral_code or generate_referral_code(user_id),
+                "explicit_referral_code": referral_code,
+                "referred_by": referred_by,
+            })
+            return True
+        except Exception as e:
+            logger.error(f"Error adding user {user_id}: {e}")
+            return False
+
+    def get_user(self, user_id: int) -> Optional[dict]:
+        """Get user by user_id"""
+        try:
+            row = self._read_one(_SELECT_USER, (user_id,))
+            return self._user_from_row(row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting user {user_id}: {e}")
+            return None
+
+    def get_user_by_referral_code(self, referral_code: str) -> Optional[dict]:
+        """Get user by referral code"""
+        try:
+            row = self._read_one(_SELECT_USER_BY_CODE, (referral_code,))
+            return self._user_from_row(row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting user by referral code {referral_code}: {e}")
+            return None
+
+    def update_channel_membership(self, user_id: int, is_member: bool) -> bool:
+        """Update user's channel membership status"""
+        try:
+            self._write(_UPDATE_CHANNEL_MEMBERSHIP, (1 if is_member else 0, user_id))
+            return True
+        except Exception as e:
+            logger.error(f"Error updating channel membership for user {user_id}: {e}")
+            return False
+
+    def add_referral(self, referrer_user_id: int, referred_user_id: int) -> bool:
+        """Add a referral relationship (re-activates an existing one)"""
+        try:
+            self._write(_UPSERT_REFERRAL, (referrer_user_id, referred_user_id))
+            return True
+        except Exception as e:
+            logger.error(f"Error adding referral: {e}")
+            return False
+
+    def record_referral(self, referrer_code: str, user_id: int, username: str = None,
+                        first_name: str = None, last_name: str = None,
+                        referral_code: str = None) -> Tuple[str, Optional[dict]]:
+        """Credit the owner of referrer_code for user_id in one writer transaction"""
+        def work(conn: sqlite3.Connection) -> Tuple[str, Optional[dict]]:
+            row = conn.execute(_SELECT_USER_BY_CODE, (referrer_code,)).fetchone()
+            if row is None:
+                return REFERRAL_INVALID_CODE, None
+            referrer = self._user_from_row(row)
+            if referrer["user_id"] == user_id:
+                return REFERRAL_SELF, referrer
+            conn.execute(_UPSERT_USER, {
+                "user_id": user_id,
+                "username": username,
+                "first_name": first_name,
+                "last_name": last_name,
+                "referral_code": referral_code or generate_referral_code(user_id),
+                "explicit_referral_code": None,
+                "referred_by": None,
+            })
+            referred_by, has_referral = conn.execute(_SELECT_REFERRED_BY, {"user_id": user_id}).fetchone()
+            if referred_by is not None or has_referral:
+                return REFERRAL_ALREADY_REFERRED, referrer
+            conn.execute(_SET_REFERRED_BY, (referrer["user_id"], user_id))
+            conn.execute(_UPSERT_REFERRAL, (referrer["user_id"], user_id))
+            return REFERRAL_RECORDED, referrer
+
+        return self._write_transaction(work)
+
+    def get_referral_stats(self, user_id: int) -> Tuple[int, int]:
+        """Get referral statistics for a user (active referrals, total referrals)"""
+        try:
+            active, total = self._read_one(_REFERRAL_COUNTS, (user_id,))
+            return int(active), int(total)
+        except Exception as e:
+            logger.error(f"Error getting referral stats for user {user_id}: {e}")
+            return 0, 0
+
+    def get_referral_stats_many(self, user_ids: Sequence[int],
+                                referral_codes: Sequence[str] = ()) -> Tuple[Dict[int, Tuple[int, int]], Dict[str, int]]:
+        """Referral statistics for many users in one query per table"""
+        try:
+            conn = self._reader()
+            owners = {}
+            if referral_codes:
+                owners = dict(conn.execute(_SELECT_CODE_OWNERS, (json.dumps(list(referral_codes)),)).fetchall())
+            wanted = list(dict.fromkeys((*user_ids, *owners.values())))
+            stats = {user_id: (0, 0) for user_id in wanted}
+            for referrer_id, active, total in conn.execute(_REFERRAL_COUNTS_MANY, (json.dumps(wanted),)):
+                stats[referrer_id] = (int(active), int(total))
+            return stats, owners
+        except Exception as e:
+            logger.error(f"Error getting referral stats for {len(user_ids)} users: {e}")
+            return {user_id: (0, 0) for user_id in user_ids}, {}
+
+    def deactivate_referral(self, referrer_user_id: int, referred_user_id: int) -> bool:
+        """Deactivate a referral when user leaves channel"""
+        try:
+            self._write(_DEACTIVATE_REFERRAL, (referrer_user_id, referred_user_id))
+            return True
+        except Exception as e:
+            logger.error(f"Error deactivating referral: {e}")
+            return False
+
+    def mark_reward_claimed(self, user_id: int) -> bool:
+        """Mark reward as claimed for a user"""
+        try:
+            self._write(_UPDATE_REWARD_CLAIMED, (user_id,))
+            return True
+        except Exception as e:
+            logger.error(f"Error marking reward claimed for user {user_id}: {e}")
+            return False
+
+    def get_all_users_count(self) -> int:
+        """Get total number of users"""
+        try:
+            return self._read_one(_COUNT_USERS)[0]
+        except Exception as e:
+            logger.error(f"Error getting user count: {e}")
+            return 0
+
+    def get_channel_members_count(self) -> int:
+        """Get number of active channel members"""
+        try:
+            return self._read_one(_COUNT_CHANNEL_MEMBERS)[0]
+        except Exception as e:
+            logger.error(f"Error getting channel members count: {e}")
+            return 0
+
+    def invalidate_settings_cache(self, payload=None) -> None:
+        """Settings are read straight from the file, so there is nothing to invalidate"""
+
+    def watch_settings_changes(self) -> bool:
+        """Settings changes are visible on the next read; no subscription needed"""
+        return True
+
+    def get_active_referral_target(self) -> Optional[int]:
+        """Get the current active referral target from referral_targets table"""
+        try:
+            row = self._read_one(_SELECT_SETTING, ("active_referral_target_id",))
+            if row:
+                target = self._read_one(_SELECT_TARGET_LEVEL, (int(row["value"]),))
+                if target:
+                    return target["target_level"]
+
+            # Fallback to old method
+            row = self._read_one(_SELECT_SETTING, ("referral_target",))
+            return int(row["value"]) if row else None
+        except Exception as e:
+            logger.error(f"Error getting active referral target: {e}")
+            return None
+
+    def get_setting(self, key: str) -> Optional[str]:
+        """Get a setting value by key"""
+        try:
+            row = self._read_one(_SELECT_SETTING, (key,))
+            return row["value"] if row else None
+        except Exception as e:
+            logger.error(f"Error getting setting {key}: {e}")
+            return None
+
+    def get_referral_target_by_id(self, target_id: int) -> Optional[dict]:
+        """Get referral target by ID"""
+        try:
+            row = self._read_one(_SELECT_TARGET, (target_id,))
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting referral target {target_id}: {e}")
+            return None
+
+    def get_all_referral_targets(self) -> list:
+        """Get all active referral targets"""
+        try:
+            return [dict(row) for row in self._reader().execute(_SELECT_ACTIVE_TARGETS)]
+        except Exception as e:
+            logger.error(f"Error getting referral targets: {e}")
+            return []
+
+    def update_user_referral_target(self, user_id: int, target_id: int) -> bool:
+        """Update user's referral target"""
+        try:
+            self._write(_UPDATE_REFERRAL_TARGET, (target_id, user_id))
+            return True
+        except Exception as e:
+            logger.error(f"Error updating user {user_id} referral target: {e}")
+            return False
+
+    def mark_target_reached(self, user_id: int) -> bool:
+        """Mark that user has reached their referral target"""
+        try:
+            self._write(_UPDATE_TARGET_REACHED, (datetime.now(timezone.utc).isoformat(), user_id))
+            return True
+        except Exception as e:
+            logger.error(f"Error marking target reached for user {user_id}: {e}")
+            return False
+
+    def get_invite_link(self, user_id: int) -> Optional[str]:
+        """Get stored invite link for a user"""
+        try:
+            row = self._read_one(_SELECT_INVITE_LINK, (user_id,))
+            return row["invite_link"] if row else None
+        except Exception as e:
+            logger.error(f"Error getting invite link for user {user_id}: {e}")
+            return None
+
+    def get_invite_link_owner(self, invite_link: str) -> Optional[int]:
+        """Get the user an invite link was created for"""
+        try:
+            row = self._read_one(_SELECT_INVITE_LINK_OWNER, (invite_link,))
+            return row["user_id"] if row else None
+        except Exception as e:
+            logger.error(f"Error looking up invite link owner: {e}")
+            return None
+
+    def preload_invite_links(self) -> int:
+        """Invite links are already a local indexed lookup; nothing to preload"""
+        return 0
+
+    def preload_referral_codes(self) -> int:
+        """Unknown codes already miss on the local referral_code index"""
+        return 0
+
+    def refresh_referral_codes(self) -> int:
+        """New codes are in the local referral_code index as soon as they commit"""
+        return 0
+
+    def store_invite_link(self, user_id: int, referral_code: str, invite_link: str, link_name: str) -> bool:
+        """Store invite link for a user"""
+        try:
+            self._write(_UPSERT_INVITE_LINK, (user_id, referral_code, invite_link, link_name))
+            return True
+        except Exception as e:
+            logger.error(f"Error storing invite link for user {user_id}: {e}")
+            return False
+
+    def log_channel_event(self, user_id: int, event_type: str) -> bool:
+        """Log channel event for a user"""
+        try:
+            self._write(_INSERT_CHANNEL_EVENT, (user_id, event_type, datetime.now(timezone.utc).isoformat()))
+            return True
+        except Exception as e:
+            logger.error(f"Error logging channel event for user {user_id}: {e}")
+            return False
+
+    def get_user_language(self, user_id: int) -> Optional[str]:
+        """Get a user's stored language preference"""
+        row = self._read_one(_SELECT_LANGUAGE, (user_id,))
+        return row["language_code"] if row else None
+
+    def set_user_language(self, user_id: int, language_code: str) -> bool:
+        """Persist a user's language preference"""
+        self._write(_UPSERT_LANGUAGE, (user_id, language_code, datetime.now(timezone.utc).isoformat()))
+        return True
+
+    def cache_stats(self) -> dict:
+        """No in-memory caches; every read is a local indexed lookup"""
+        return {}
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Read-only connection owned by the calling thread"""
+        return self._reader()
@@ -0,0 +1,136 @@
+"""Storage interface shared by the Supabase, SQLite and in-memory backends"""
+
+from typing import Dict, Optional, Protocol, Sequence, Tuple, runtime_checkable
+
+from .cache import CacheSettings
+from .referral_codes import ReferralCodec
+
+STORAGE_BACKENDS = ("supabase", "sqlite", "memory")
+
+# Outcomes of Storage.record_referral
+REFERRAL_RECORDED = "recorded"
+REFERRAL_INVALID_CODE = "invalid_code"
+REFERRAL_SELF = "self_referral"
+REFERRAL_ALREADY_REFERRED = "already_referred"
+
+@runtime_checkable
+class Storage(Protocol):
+    """Synchronous storage operations the referral system, handlers and API rely on.
+
+    Implementations may block (network or disk I/O); async callers go
+    through AsyncDatabase, which runs every call on a worker thread.
+    """
+
+    cache_settings: CacheSettings
+    # Optional WriteBehindQueue started and drained by AsyncDatabase
+    write_queue: Optional[object]
+
+    def add_user(self, user_id: int, username: str = None, first_name: str = None,
+                 last_name: str = None, referral_code: str = None, referred_by: int = None) -> bool: ...
+
+    def get_user(self, user_id: int) -> Optional[dict]: ...
+
+    def get_user_by_referral_code(self, referral_code: str) -> Optional[dict]: ...
+
+    def update_channel_membership(self, user_id: int, is_member: bool) -> bool: ...
+
+    def add_referral(self, referrer_user_id: int, referred_user_id: int) -> bool: ...
+
+    def record_referral(self, referrer_code: str, user_id: int, username: str = None,
+                        first_name: str = None, last_name: str = None,
+                        referral_code: str = None) -> Tuple[str, Optional[dict]]:
+        """Credit the owner of ``referrer_code`` for ``user_id`` as one atomic step.
+
+        Creates the user if needed, with ``referral_code`` or a generated
+        one (an existing user keeps their code), and
+        returns one of the REFERRAL_* outcomes with the referrer, or None for
+        an unknown code. A user is credited at most once, even when two
+        calls race.
+        """
+        ...
+
+    def get_referral_stats(self, user_id: int) -> Tuple[int, int]: ...
+
+    def get_referral_stats_many(self, user_ids: Sequence[int],
+                                referral_codes: Sequence[str] = ()) -> Tuple[Dict[int, Tuple[int, int]], Dict[str, int]]:
+        """Referral counts for many users, resolving referral codes in the same storage call.
+
+        Returns ``(stats, owners)``: (active, total) counts for every
+        requested user ID and every resolved code's owner, and the owning
+        user ID of each referral code that exists.
+        """
+        ...
+
+    def deactivate_referral(self, referrer_user_id: int, referred_user_id: int) -> bool: ...
+
+    def mark_reward_claimed(self, user_id: int) -> bool: ...
+
+    def get_all_users_count(self) -> int: ...
+
+    def get_channel_members_count(self) -> int: ...
+
+    def invalidate_settings_cache(self, payload=None) -> None: ...
+
+    def watch_settings_changes(self) -> bool: ...
+
+    def get_active_referral_target(self) -> Optional[int]: ...
+
+    def get_setting(self, key: str) -> Optional[str]: ...
+
+    def get_referral_target_by_id(self, target_id: int) -> Optional[dict]: ...
+
+    def get_all_referral_targets(self) -> list: ...
+
+    def update_user_referral_target(self, user_id: int, target_id: int) -> bool: ...
+
+    def mark_target_reached(self, user_id: int) -> bool: ...
+
+    def get_invite_link(self, user_id: int) -> Optional[str]: ...
+
+    def get_invite_link_owner(self, invite_link: str) -> Optional[int]: ...
+
+    def preload_invite_links(self) -> int: ...
+
+    def preload_referral_codes(self) -> int: ...
+
+    def refresh_referral_codes(self) -> int: ...
+
+    def store_invite_link(self, user_id: int, referral_code: str, invite_link: str, link_name: str) -> bool: ...
+
+    def log_channel_event(self, user_id: int, event_type: str) -> bool: ...
+
+    def get_user_language(self, user_id: int) -> Optional[str]: ...
+
+    def set_user_language(self, user_id: int, language_code: str) -> bool: ...
+
+    def cache_stats(self) -> dict: ...
+
+    def close(self) -> None: ...
+
+def create_storage(backend: str = "supabase", database_path: str = "bot_database.db",
+                   cache_settings: Optional[CacheSettings] = None,
+                   settings_ttl: Optional[float] = None,
+                   referral_code_filter_capacity: Optional[int] = None,
+                   referral_codec: Optional[ReferralCodec] = None,
+                   referral_count_ttl: Optional[float] = None) -> Storage:
+    """Build the configured storage backend"""
+    if backend == "sqlite":
+        from .sqlite_database import SQLiteDatabase
+        return SQLiteDatabase(database_path, cache_settings)
+    if backend == "memory":
+        from .memory_database import MemoryDatabase
+        return MemoryDatabase(cache_settings)
+    if backend != "supabase":
+        raise ValueError(f"Unknown storage backend {backend!r}; expected one of {', '.join(STORAGE_BACKENDS)}")
+
+    from .database import Database, REFERRAL_CODE_FILTER_CAPACITY, SETTINGS_CACHE_TTL
+    database = Database(
+        cache_settings,
+        settings_ttl=settings_ttl if settings_ttl is not None else SETTINGS_CACHE_TTL,
+        referral_code_filter_capacity=referral_code_filter_capacity
+        if referral_code_filter_capacity is not None else REFERRAL_CODE_FILTER_CAPACITY,
+        referral_codec=referral_codec,
+        referral_count_ttl=referral_count_ttl
+    )
+    database.watch_settings_changes()
+    return database
@@ -1,42 +1,80 @@
+import asyncio
 import logging
 import aiohttp
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Union
 
 from .config import BotConfig
 
 logger = logging.getLogger(__name__)
 
+# Connections kept open to the Supabase edge function host
+HTTP_POOL_SIZE = 20
+HTTP_TIMEOUT_SECONDS = 15
+
+# Most updates the edge function accepts in one request (MAX_BATCH_SIZE there)
+MAX_TASK_UPDATE_BATCH = 500
+
+def create_http_session() -> aiohttp.ClientSession:
+    """Create the pooled session shared for the lifetime of the application (call inside the event loop)"""
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, ttl_dns_cache=300),
+        timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
+    )
+
+def task_update_body(telegram_id: int, task_key: str, status: str,
+                     meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """JSON body the telegram-task-update edge function expects for one update"""
+    return {"telegramId": telegram_id, "taskKey": task_key, "status": status, "meta": meta or {}}
+
+async def post_task_updates(
+    session: aiohttp.ClientSession,
+    config: BotConfig,
+    payload: Union[Dict[str, Any], List[Dict[str, Any]]]
+) -> int:
+    """POST one update (a dict) or a batch (a list) and return the HTTP status"""
+    headers = {
+        "Content-Type": "application/json",
+        "x-bot-secret": config.supabase_webhook_secret,
+    }
+    async with session.post(config.supabase_webhook_url, json=payload, headers=headers) as response:
+        return response.status
+
 async def send_task_update_to_supabase(
     config: BotConfig,
     telegram_id: int,
     task_key: str,
     status: str,
-    meta: Optional[Dict[str, Any]] = None
+    meta: Optional[Dict[str, Any]] = None,
+    session: Optional[aiohttp.ClientSession] = None
 ) -> None:
     """
     Sends a task update to the configured Supabase Edge Function.
 
+    The bot queues updates in TaskUpdateOutbox instead; this sends one
+    immediately and does not retry.
+
     Args:
         config: The bot's configuration object.
         telegram_id: The user's Telegram ID.
         task_key: A unique key for the task (e.g., "tg_referral_5").
         status: The status of the task (e.g., "completed").
         meta: Optional dictionary with additional metadata.
+        session: Pooled session to reuse; a temporary one is opened if omitted.
     """
     if not config.supabase_webhook_url or not config.supabase_webhook_secret:
         logger.info("Supabase webhook URL or secret not configured. Skipping update.")
         return
 
-    headers = {
-        "Content-Type": "application/json",
-        "x-bot-secret": config.supabase_webhook_secret,
-    }
-    body = {"telegramId": telegram_id, "taskKey": task_key, "status": status, "meta": meta or {}}
-
+    body = task_update_body(telegram_id, task_key, status, meta)
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(config.supabase_webhook_url, json=body, headers=headers) as response:
-                response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-                logger.info(f"Successfully sent task update to Supabase for user {telegram_id}. Status: {response.status}")
-    except aiohttp.ClientError as e:
-        logger.error(f"Error sending task update to Supabase for user {telegram_id}: {e}")
\ No newline at end of file
+        if session is not None:
+            response_status = await post_task_updates(session, config, body)
+        else:
+            async with create_http_session() as temporary_session:
+                response_status = await post_task_updates(temporary_session, config, body)
+        if response_status >= 400:
+            logger.error(f"Error sending task update to Supabase for user {telegram_id}: HTTP {response_status}")
+        else:
+            logger.info(f"Successfully sent task update to Supabase for user {telegram_id}. Status: {response_status}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Error sending task update to Supabase for user {telegram_id}: {e}")
@@ -0,0 +1,207 @@
+"""Durable outbox for task updates sent to the Supabase edge function"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from .config import BotConfig
+from .supabase_utils import MAX_TASK_UPDATE_BATCH, post_task_updates, task_update_body
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between delivery attempts while the edge function keeps failing
+MAX_RETRY_DELAY = 300.0
+
+# Statuses worth retrying; any other 4xx means the update itself is rejected
+RETRYABLE_STATUSES = {408, 425, 429}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS task_updates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    telegram_id INTEGER NOT NULL,
+    task_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    meta TEXT NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE(telegram_id, task_key)
+);
+CREATE INDEX IF NOT EXISTS idx_task_updates_due ON task_updates(next_attempt_at);
+"""
+
+_UPSERT_UPDATE = """
+INSERT INTO task_updates (telegram_id, task_key, status, meta, next_attempt_at, created_at)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(telegram_id, task_key) DO UPDATE SET
+    status = excluded.status,
+    meta = excluded.meta,
+    revision = task_updates.revision + 1,
+    attempts = 0,
+    next_attempt_at = excluded.next_attempt_at
+"""
+_SELECT_DUE = """
+SELECT id, telegram_id, task_key, status, meta, revision, attempts FROM task_updates
+WHERE next_attempt_at <= ? ORDER BY next_attempt_at, id LIMIT ?
+"""
+_SELECT_NEXT_DUE = "SELECT MIN(next_attempt_at) FROM task_updates"
+_DELETE_DELIVERED = "DELETE FROM task_updates WHERE id = ? AND revision = ?"
+_RESCHEDULE = "UPDATE task_updates SET attempts = ?, next_attempt_at = ? WHERE id = ? AND revision = ?"
+_COUNT_PENDING = "SELECT COUNT(*) FROM task_updates"
+
+class TaskUpdateOutbox:
+    """Queue task updates on disk and deliver them in the background.
+
+    ``enqueue`` writes the update to a small SQLite file and returns; a
+    background task POSTs due updates over the application's pooled HTTP
+    session. With ``batch_size`` > 1 up to that many updates go in one
+    request as a JSON array (at most ``MAX_TASK_UPDATE_BATCH``);
+    otherwise each update is sent as a single object, as before. Network
+    errors, timeouts, 5xx and 429 responses are retried with exponential
+    backoff up to ``MAX_RETRY_DELAY``; other 4xx responses drop the update
+    with an error log. Updates still pending at shutdown are sent after
+    the next start. A newer update for the same user and task replaces a
+    pending one.
+    """
+
+    def __init__(self, config: BotConfig, path: str = "task_outbox.db", batch_size: int = 1,
+                 retry_backoff: float = 1.0):
+        self.config = config
+        self.path = path
+        self.batch_size = max(1, min(batch_size, MAX_TASK_UPDATE_BATCH))
+        self.retry_backoff = retry_backoff
+        self.enabled = bool(config.supabase_webhook_url and config.supabase_webhook_secret)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.delivered = 0
+        self.dropped = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def _execute(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def _run_sql(self, sql: str, params=()) -> list:
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    async def start(self, session: aiohttp.ClientSession) -> None:
+        """Open the outbox file and start delivering over ``session``"""
+        if not self.enabled:
+            logger.info("Supabase webhook URL or secret not configured. Task updates will be skipped.")
+            return
+        self._conn = await asyncio.to_thread(self._connect)
+        self._session = session
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        pending = (await self._run_sql(_COUNT_PENDING))[0][0]
+        logger.info(f"Task update outbox started at {self.path} ({pending} pending)")
+
+    async def close(self) -> None:
+        """Stop delivering; undelivered updates stay on disk"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            pending = (await self._run_sql(_COUNT_PENDING))[0][0]
+            with self._lock:
+                self._conn.close()
+            self._conn = None
+            logger.info(f"Task update outbox closed ({pending} pending)")
+
+    async def enqueue(self, telegram_id: int, task_key: str, status: str,
+                      meta: Optional[Dict[str, Any]] = None) -> None:
+        """Persist an update for background delivery"""
+        if self._conn is None:
+            logger.info("Supabase webhook URL or secret not configured. Skipping update.")
+            return
+        now = time.time()
+        await self._run_sql(_UPSERT_UPDATE, (telegram_id, task_key, status, json.dumps(meta or {}), now, now))
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                delay = await self._deliver_due()
+            except Exception as e:
+                logger.error(f"Task update outbox delivery failed: {e}")
+                delay = self.retry_backoff
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _deliver_due(self) -> Optional[float]:
+        """Send every due update; returns seconds until the next one is due (None if none are pending)"""
+        while True:
+            rows = await self._run_sql(_SELECT_DUE, (time.time(), self.batch_size))
+            if not rows:
+                break
+            if not await self._deliver(rows):
+                break
+        next_due = (await self._run_sql(_SELECT_NEXT_DUE))[0][0]
+        if next_due is None:
+            return None
+        return max(0.0, next_due - time.time())
+
+    async def _deliver(self, rows: List[tuple]) -> bool:
+        """POST one batch and record the outcome. Returns False if it should be retried later."""
+        bodies = [task_update_body(row[1], row[2], row[3], json.loads(row[4])) for row in rows]
+        payload = bodies if self.batch_size > 1 else bodies[0]
+        try:
+            status = await post_task_updates(self._session, self.config, payload)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            await self._reschedule(rows, f"{type(e).__name__}: {e}")
+            return False
+
+        if status < 400:
+            for row in rows:
+                await self._run_sql(_DELETE_DELIVERED, (row[0], row[5]))
+            self.delivered += len(rows)
+            logger.info(f"Sent {len(rows)} task update(s) to Supabase. Status: {status}")
+            return True
+        if status >= 500 or status in RETRYABLE_STATUSES:
+            await self._reschedule(rows, f"HTTP {status}")
+            return False
+        for row in rows:
+            await self._run_sql(_DELETE_DELIVERED, (row[0], row[5]))
+        self.dropped += len(rows)
+        logger.error(f"Supabase rejected {len(rows)} task update(s) with HTTP {status}; dropped "
+                     f"(users {', '.join(str(row[1]) for row in rows)})")
+        return True
+
+    async def _reschedule(self, rows: List[tuple], reason: str) -> None:
+        now = time.time()
+        for row in rows:
+            attempts = row[6] + 1
+            delay = min(self.retry_backoff * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+            await self._run_sql(_RESCHEDULE, (attempts, now + delay, row[0], row[5]))
+        delay = min(self.retry_backoff * 2 ** rows[0][6], MAX_RETRY_DELAY)
+        logger.warning(f"Could not send {len(rows)} task update(s) to Supabase ({reason}); retrying in {delay:g}s")
+
+    def stats(self) -> dict:
+        pending = self._execute(_COUNT_PENDING)[0][0] if self._conn is not None else 0
+        return {"pending": pending, "delivered": self.delivered, "dropped": self.dropped}
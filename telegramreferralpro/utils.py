@@ -1,11 +1,18 @@
+import asyncio
 import logging
 import re
+import time
 from typing import Optional
 from telegram import Bot, ChatMember
 from telegram.error import TelegramError
+from .send_scheduler import PRIORITY_INTERACTIVE
 
 logger = logging.getLogger(__name__)
 
+# Channel title and member count change rarely
+CHAT_INFO_TTL = 600
+CHAT_INFO_RETRY_DELAY = 30
+
 def setup_logging():
     """Setup logging configuration"""
     logging.basicConfig(
@@ -21,10 +28,14 @@ def setup_logging():
     logging.getLogger('httpx').setLevel(logging.WARNING)
 
 class TelegramUtils:
-    def __init__(self, bot: Bot, channel_id: str, channel_username: str):
+    def __init__(self, bot: Bot, channel_id: str, channel_username: str, chat_info_ttl: float = CHAT_INFO_TTL):
         self.bot = bot
         self.channel_id = channel_id
         self.channel_username = channel_username
+        self.chat_info_ttl = chat_info_ttl
+        self._chat_info: Optional[dict] = None
+        self._chat_info_expires_at = 0.0
+        self._chat_info_refresh: Optional[asyncio.Task] = None
 
     async def create_unique_invite_link(self, expire_date=None, member_limit=None, name=None) -> str:
         """Create a unique invite link for the channel using Telegram API"""
@@ -42,14 +53,36 @@ class TelegramUtils:
             logger.error(f"Error creating invite link: {e}")
             return self.get_channel_link()
 
+    async def rename_invite_link(self, invite_link: str, name: str) -> bool:
+        """Change the name of an existing invite link"""
+        try:
+            await self.bot.edit_chat_invite_link(self.channel_id, invite_link, name=name)
+            return True
+        except TelegramError as e:
+            logger.warning(f"Error renaming invite link {invite_link}: {e}")
+            return False
+
+    async def revoke_invite_link(self, invite_link: str) -> bool:
+        """Revoke an invite link so it can no longer be used to join"""
+        try:
+            await self.bot.revoke_chat_invite_link(self.channel_id, invite_link)
+            return True
+        except TelegramError as e:
+            logger.warning(f"Error revoking invite link {invite_link}: {e}")
+            return False
+
     async def check_channel_membership(self, user_id: int) -> bool:
         """Check if a user is a member of the channel"""
+        return bool(await self.get_channel_membership(user_id))
+
+    async def get_channel_membership(self, user_id: int) -> Optional[bool]:
+        """Ask the Bot API whether a user is in the channel (None if the call failed)"""
         try:
             member = await self.bot.get_chat_member(self.channel_id, user_id)
             return member.status in [ChatMember.MEMBER, ChatMember.ADMINISTRATOR, ChatMember.OWNER]
         except TelegramError as e:
             logger.warning(f"Error checking membership for user {user_id}: {e}")
-            return False
+            return None
 
     def get_channel_link(self) -> str:
         """Get the channel invite link"""
@@ -59,23 +92,48 @@ class TelegramUtils:
             return f"https://t.me/{self.channel_username}"
 
     async def get_chat_info(self) -> Optional[dict]:
-        """Get information about the channel"""
+        """Get cached information about the channel without waiting on the Bot API.
+
+        Expired or missing info is refreshed in the background; until then the
+        previous value (or None before the first successful fetch) is returned.
+        """
+        if time.monotonic() >= self._chat_info_expires_at:
+            self._schedule_chat_info_refresh()
+        return self._chat_info
+
+    async def refresh_chat_info(self) -> Optional[dict]:
+        """Fetch channel info now and cache it"""
+        chat_info = await self._fetch_chat_info()
+        if chat_info is not None:
+            self._chat_info = chat_info
+            self._chat_info_expires_at = time.monotonic() + self.chat_info_ttl
+        else:
+            # Keep serving the last known info and try again shortly
+            self._chat_info_expires_at = time.monotonic() + min(CHAT_INFO_RETRY_DELAY, self.chat_info_ttl)
+        return self._chat_info
+
+    def _schedule_chat_info_refresh(self) -> None:
+        # One refresh at a time, however many welcomes ask for it
+        if self._chat_info_refresh is None or self._chat_info_refresh.done():
+            self._chat_info_refresh = asyncio.create_task(self.refresh_chat_info())
+
+    async def _fetch_chat_info(self) -> Optional[dict]:
         try:
             chat = await self.bot.get_chat(self.channel_id)
             return {
                 'title': chat.title,
                 'username': chat.username,
-
-
                 'member_count': await self.bot.get_chat_member_count(self.channel_id) if hasattr(chat, 'member_count') else None
             }
         except TelegramError as e:
             logger.error(f"Error getting chat info: {e}")
             return None
 
-    async def send_message_safe(self, user_id: int, text: str, **kwargs) -> bool:
-        """Send a message with error handling"""
+    async def send_message_safe(self, user_id: int, text: str, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> bool:
+        """Send a message with error handling, in the given send scheduler lane"""
         try:
+            if getattr(self.bot, 'rate_limiter', None) is not None:
+                kwargs['rate_limit_args'] = priority
             await self.bot.send_message(user_id, text, **kwargs)
             return True
         except TelegramError as e:
@@ -0,0 +1,224 @@
+"""Write-behind queue that batches Supabase inserts"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# prepare(rows) -> (rows ready to insert, rows to retry on a later flush)
+PrepareHook = Callable[[List[dict]], Tuple[List[dict], List[dict]]]
+# on_written(rows) is called with the queued rows once they are stored
+WrittenHook = Callable[[List[dict]], None]
+
+# Longest wait between attempts for a batch that keeps failing or waiting
+MAX_RETRY_DELAY = 300.0
+
+# Postgres error for ON CONFLICT on columns without a unique index
+MISSING_CONFLICT_TARGET = "42P10"
+
+class WriteBehindQueue:
+    """Buffer inserts per table and flush them as bulk requests.
+
+    Rows are enqueued from any thread and written by a background task
+    whenever a table reaches ``batch_size`` rows or ``flush_interval``
+    seconds pass. Tables flush in registration order so parent rows (users)
+    land before rows that reference them (referrals). Rows are never
+    dropped: failed batches are retried with exponential backoff up to
+    ``MAX_RETRY_DELAY``, and one still failing after ``max_retries``
+    attempts is split in half so a single bad row cannot hold back the
+    rest. Rows a ``prepare`` hook defers (their parent row is not written
+    yet) keep a separate count, so waiting never uses up failure attempts.
+    ``close()`` drains everything that is left and writes whatever still
+    fails to ``spill_path``, which the next ``start()`` loads back.
+    """
+
+    def __init__(self, client, batch_size: int = 200, flush_interval: float = 1.0,
+                 max_retries: int = 5, retry_backoff: float = 1.0, spill_path: Optional[str] = None):
+        self.client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.spill_path = spill_path
+        self._lock = threading.Lock()
+        self._tables: Dict[str, dict] = {}
+        self._pending: Dict[str, List[dict]] = {}
+        # (ready_at, table, rows, failures, deferrals)
+        self._retries: List[tuple] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._executor: Optional[Executor] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+    def register(self, table: str, on_conflict: Optional[str] = None, prepare: Optional[PrepareHook] = None,
+                 on_written: Optional[WrittenHook] = None) -> None:
+        """Declare a table; on_conflict makes its inserts idempotent upserts"""
+        self._tables[table] = {"on_conflict": on_conflict, "prepare": prepare, "on_written": on_written}
+        self._pending.setdefault(table, [])
+
+    def enqueue(self, table: str, row: dict) -> None:
+        """Buffer a row for insertion (thread-safe)"""
+        with self._lock:
+            rows = self._pending.setdefault(table, [])
+            rows.append(row)
+            full = len(rows) >= self.batch_size
+        if full and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return sum(len(rows) for rows in self._pending.values()) + sum(len(r[2]) for r in self._retries)
+
+    async def start(self, executor: Optional[Executor] = None) -> None:
+        """Start the background flush task on the running loop"""
+        self._loop = asyncio.get_running_loop()
+        self._executor = executor
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._load_spill()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Write-behind queue started (batch_size={self.batch_size}, interval={self.flush_interval}s)")
+
+    async def close(self) -> None:
+        """Stop the background task, flush everything still buffered and spill what fails"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush(include_delayed=True)
+        remaining = self.pending_count()
+        if not remaining:
+            return
+        if self.spill_path:
+            try:
+                self._spill()
+                logger.warning(f"Write-behind queue closed with {remaining} unwritten rows; kept in {self.spill_path}")
+                return
+            except OSError as e:
+                logger.error(f"Could not write {self.spill_path}: {e}")
+        logger.error(f"Write-behind queue closed with {remaining} rows that could not be written")
+
+    def _spill(self) -> None:
+        """Append every buffered and retrying row to the spill file"""
+        with self._lock:
+            batches = [(table, rows) for table, rows in self._pending.items()]
+            batches.extend((table, rows) for _, table, rows, _, _ in self._retries)
+            with open(self.spill_path, "a", encoding="utf-8") as spill:
+                for table, rows in batches:
+                    for row in rows:
+                        spill.write(json.dumps({"table": table, "row": row}) + "\n")
+            for table in self._pending:
+                self._pending[table] = []
+            self._retries = []
+
+    def _load_spill(self) -> None:
+        """Queue rows a previous run spilled at shutdown"""
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        loaded = 0
+        with open(self.spill_path, encoding="utf-8") as spill:
+            for line in spill:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.enqueue(entry["table"], entry["row"])
+                    loaded += 1
+        os.remove(self.spill_path)
+        logger.info(f"Write-behind queue loaded {loaded} rows from {self.spill_path}")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {e}")
+
+    async def flush(self, include_delayed: bool = False) -> None:
+        """Write all buffered rows and any retries that are due"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            now = time.monotonic()
+            with self._lock:
+                batches = []
+                for table in self._pending:
+                    rows = self._pending[table]
+                    self._pending[table] = []
+                    for i in range(0, len(rows), self.batch_size):
+                        batches.append((table, rows[i:i + self.batch_size], 0, 0))
+                due, waiting = [], []
+                for retry in self._retries:
+                    (due if include_delayed or retry[0] <= now else waiting).append(retry)
+                self._retries = waiting
+            batches.extend(retry[1:] for retry in due)
+            order = list(self._tables)
+            batches.sort(key=lambda b: order.index(b[0]) if b[0] in order else len(order))
+
+            loop = asyncio.get_running_loop()
+            for table, rows, failures, deferrals in batches:
+                try:
+                    deferred = await loop.run_in_executor(self._executor, self._write_batch, table, rows)
+                except Exception as e:
+                    logger.warning(f"Write-behind batch of {len(rows)} {table} rows failed (attempt {failures + 1}): {e}")
+                    self._retry_failed(table, rows, failures + 1, deferrals)
+                    continue
+                if deferred:
+                    # Waiting for parent rows is not a failure of these rows
+                    self._schedule_retry(table, deferred, 0, deferrals + 1, deferrals + 1)
+
+    def _write_batch(self, table: str, rows: List[dict]) -> List[dict]:
+        options = self._tables.get(table, {})
+        queued = rows
+        deferred: List[dict] = []
+        if options.get("prepare"):
+            rows, deferred = options["prepare"](rows)
+        if rows:
+            if options.get("on_conflict"):
+                try:
+                    self.client.table(table).upsert(rows, on_conflict=options["on_conflict"], ignore_duplicates=True).execute()
+                except Exception as e:
+                    if getattr(e, "code", None) != MISSING_CONFLICT_TARGET:
+                        raise
+                    # The unique index is not migrated yet; duplicates now fail their batch instead
+                    logger.warning(f"No unique index on {table}({options['on_conflict']}), using plain inserts: {e}")
+                    options["on_conflict"] = None
+                    self.client.table(table).insert(rows).execute()
+            else:
+                self.client.table(table).insert(rows).execute()
+            logger.info(f"Write-behind flushed {len(rows)} rows into {table}")
+            if options.get("on_written"):
+                waiting = {id(row) for row in deferred}
+                options["on_written"]([row for row in queued if id(row) not in waiting])
+        return deferred
+
+    def _retry_failed(self, table: str, rows: List[dict], failures: int, deferrals: int) -> None:
+        if failures >= self.max_retries and len(rows) > 1:
+            # Retry the halves separately so the rows that can be written are
+            middle = len(rows) // 2
+            logger.error(f"{len(rows)} {table} rows still failing after {failures} attempts; splitting the batch")
+            self._schedule_retry(table, rows[:middle], 0, deferrals, failures)
+            self._schedule_retry(table, rows[middle:], 0, deferrals, failures)
+            return
+        if failures == self.max_retries:
+            logger.error(f"{table} row still failing after {failures} attempts; retrying every {MAX_RETRY_DELAY:.0f}s at most")
+        self._schedule_retry(table, rows, failures, deferrals, failures)
+
+    def _schedule_retry(self, table: str, rows: List[dict], failures: int, deferrals: int, attempt: int) -> None:
+        """Queue rows again after backoff for their attempt-th retry"""
+        ready_at = time.monotonic() + min(MAX_RETRY_DELAY, self.retry_backoff * (2 ** (attempt - 1)))
+        with self._lock:
+            self._retries.append((ready_at, table, rows, failures, deferrals))
@@ -0,0 +1,53 @@
+import pytest
+
+from telegramreferralpro import cache as cache_module
+from telegramreferralpro.cache import CacheSettings
+from telegramreferralpro.database import Database
+from telegramreferralpro.fake_postgrest import FakePostgrestClient
+
+
+class FakeClock:
+    """Stands in for the time module in cache.py so TTLs expire on demand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def client() -> FakePostgrestClient:
+    return FakePostgrestClient()
+
+
+@pytest.fixture
+def make_database(client):
+    """Database on the fake PostgREST client, with the Bloom filter off unless asked for"""
+    def make(max_entries: int = 1000, ttl: float = 3600.0, **kwargs) -> Database:
+        kwargs.setdefault("referral_code_filter_capacity", 0)
+        return Database(CacheSettings(max_entries=max_entries, ttl=ttl), client=client, **kwargs)
+    return make
+
+
+def seed_referrer(client: FakePostgrestClient, user_id: int, referred_user_ids, active: bool = True) -> None:
+    """A referrer and the users it referred, written straight into the fake tables"""
+    client.seed("users", [{"id": user_id, "user_id": user_id, "referral_code": f"ref_{user_id:012x}"}])
+    client.seed("users", [
+        {"id": referred, "user_id": referred, "referral_code": f"ref_{referred:012x}", "referred_by_user_id": user_id}
+        for referred in referred_user_ids
+    ])
+    client.seed("referrals", [
+        {"referrer_id": user_id, "referred_id": referred, "is_active": active}
+        for referred in referred_user_ids
+    ])
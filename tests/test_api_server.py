@@ -0,0 +1,109 @@
+import asyncio
+import importlib
+import sys
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import seed_referrer
+
+
+@pytest.fixture
+def api(monkeypatch, client, clock):
+    """api_server imported fresh on the fake client, as the API process would run against Supabase"""
+    monkeypatch.setitem(sys.modules, "telegramreferralpro.supabase_client", SimpleNamespace(supabase=client))
+    monkeypatch.setenv("STORAGE_BACKEND", "supabase")
+    monkeypatch.setenv("PROGRESS_CACHE_TTL", "5")
+    monkeypatch.delenv("REFERRAL_CODE_SECRET", raising=False)
+    client.seed("settings", [{"key": "referral_target", "value": "5"}])
+    sys.modules.pop("api_server", None)
+    module = importlib.import_module("api_server")
+    yield module
+    sys.modules.pop("api_server", None)
+
+
+def progress(http, **params):
+    response = http.get("/api/referral/progress", params=params)
+    assert response.status_code == 200
+    return response.json()["progress"]
+
+
+def test_progress_shows_referrals_the_bot_records(api, client, clock, make_database):
+    seed_referrer(client, 100, [101, 102])
+    client.seed("users", [{"id": 103, "user_id": 103, "referral_code": "ref_000000000067"}])
+    with TestClient(api.app) as http:
+        assert progress(http, user_id=100)["active_referrals"] == 2
+
+        bot = make_database()  # the bot process, sharing only the database
+        assert bot.add_referral(100, 103)
+        clock.advance(api.progress_cache_ttl + 1)
+        assert progress(http, user_id=100)["active_referrals"] == 3
+
+
+def test_unchanged_progress_is_answered_with_304(api, client):
+    seed_referrer(client, 100, [101])
+    with TestClient(api.app) as http:
+        first = http.get("/api/referral/progress", params={"referral_code": f"ref_{100:012x}"})
+        etag = first.headers["ETag"]
+        second = http.get("/api/referral/progress", params={"user_id": 100}, headers={"If-None-Match": etag})
+        assert second.status_code == 304
+        assert http.get("/api/referral/progress", params={"referral_code": "ref_ffffffffffff"}).status_code == 404
+
+
+def test_batch_answers_users_and_codes(api, client):
+    seed_referrer(client, 100, [101])
+    seed_referrer(client, 200, [])
+    with TestClient(api.app) as http:
+        response = http.post("/api/referral/progress:batch", json={
+            "user_ids": [200], "referral_codes": [f"ref_{100:012x}", "ref_ffffffffffff"]
+        })
+    body = response.json()
+    assert body["referral_codes"] == {f"ref_{100:012x}": 100, "ref_ffffffffffff": None}
+    assert [(r["user_id"], r["progress"]["active_referrals"]) for r in body["results"]] == [(200, 0), (100, 1)]
+
+
+def test_waiters_take_over_when_the_lookup_is_cancelled(api, client, monkeypatch):
+    seed_referrer(client, 100, [101])
+    calls = []
+
+    async def run(func, *args):
+        calls.append(args)
+        if len(calls) == 1:
+            await asyncio.Event().wait()  # the first request's client goes away mid-lookup
+        return func(*args)
+
+    monkeypatch.setattr(api.async_database, "run", run)
+
+    async def requests():
+        first = asyncio.create_task(api._progress_response(100))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(api._progress_response(100))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await asyncio.wait_for(waiting, timeout=1)
+
+    payload, _, _ = asyncio.run(requests())
+    assert payload["progress"]["active_referrals"] == 1
+    assert len(calls) == 2
+
+
+def test_streams_pick_up_referrals_the_bot_records(api, client, make_database, monkeypatch):
+    seed_referrer(client, 100, [101])
+    client.seed("users", [{"id": 103, "user_id": 103, "referral_code": "ref_000000000067"}])
+    monkeypatch.setattr(api.progress_events, "poll_interval", 0.05)
+
+    async def stream():
+        api.progress_events.start()
+        subscription = await api.progress_events.subscribe(100)
+        try:
+            first = await subscription.next(timeout=1)
+            make_database().add_referral(100, 103)  # the bot process
+            return first, await subscription.next(timeout=2)
+        finally:
+            api.progress_events.unsubscribe(subscription)
+            await api.progress_events.close()
+            await api.async_database.close()
+
+    first, second = asyncio.run(stream())
+    assert (first.active_referrals, second.active_referrals) == (1, 2)
@@ -0,0 +1,47 @@
+from telegramreferralpro.cache import BoundedCache, CacheSettings
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = BoundedCache("test", CacheSettings(max_entries=10, ttl=5))
+    cache.set("a", 1)
+    clock.advance(4.9)
+    assert cache.get("a") == 1
+    clock.advance(0.2)
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_touch_keeps_the_original_expiry(clock):
+    cache = BoundedCache("test", CacheSettings(max_entries=10, ttl=5))
+    cache.set("a", [1])
+    clock.advance(4)
+    cache.touch("a")
+    clock.advance(2)
+    assert "a" not in cache
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = BoundedCache("test", CacheSettings(max_entries=2, ttl=None))
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_budget_evicts_oldest_but_keeps_newest():
+    cache = BoundedCache("test", CacheSettings(max_entries=100, ttl=None, max_bytes=10), sizeof=lambda value: 4)
+    for key in "abcd":
+        cache.set(key, key)
+    assert len(cache) == 2
+    assert "c" in cache and "d" in cache
+
+
+def test_loader_reads_through_on_a_miss():
+    loads = []
+    cache = BoundedCache("test", CacheSettings(max_entries=10), loader=lambda key: loads.append(key) or key * 2)
+    assert cache.get(3) == 6
+    assert cache.get(3) == 6
+    assert loads == [3]
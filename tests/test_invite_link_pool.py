@@ -0,0 +1,103 @@
+import asyncio
+
+from telegramreferralpro.invite_link_pool import InviteLinkPool
+
+CHANNEL_LINK = "https://t.me/channel"
+
+
+class FakeTelegramUtils:
+    """Hands out numbered invite links and records renames and revocations"""
+
+    def __init__(self, failing=False):
+        self.failing = failing
+        self.created = 0
+        self.renamed = {}
+        self.revoked = []
+
+    async def create_unique_invite_link(self, expire_date=None, member_limit=None, name=None) -> str:
+        if self.failing:
+            return CHANNEL_LINK
+        self.created += 1
+        return f"https://t.me/+link{self.created}"
+
+    async def rename_invite_link(self, invite_link: str, name: str) -> bool:
+        self.renamed[invite_link] = name
+        return True
+
+    async def revoke_invite_link(self, invite_link: str) -> bool:
+        self.revoked.append(invite_link)
+        return True
+
+    def get_channel_link(self) -> str:
+        return CHANNEL_LINK
+
+
+async def settle(until, steps=100):
+    for _ in range(steps):
+        if until():
+            return
+        await asyncio.sleep(0)
+    raise AssertionError("condition not reached")
+
+
+def test_pooled_link_is_handed_out_and_renamed():
+    utils = FakeTelegramUtils()
+
+    async def run():
+        pool = InviteLinkPool(utils, size=3, low_water=1, create_interval=0)
+        await pool.start()
+        await settle(lambda: len(pool) == 3)
+        link = await pool.acquire("Ref-1")
+        await settle(lambda: link in utils.renamed)
+        await pool.close()
+        return pool, link
+
+    pool, link = asyncio.run(run())
+    assert link == "https://t.me/+link1"
+    assert utils.renamed == {link: "Ref-1"}
+    assert (pool.hits, pool.misses) == (1, 0)
+
+
+def test_empty_pool_creates_the_link_inline():
+    utils = FakeTelegramUtils()
+
+    async def run():
+        pool = InviteLinkPool(utils, size=2, create_interval=0)
+        link = await pool.acquire("Ref-1")  # not started, so nothing is pooled
+        return pool, link
+
+    pool, link = asyncio.run(run())
+    assert link == "https://t.me/+link1"
+    assert (pool.hits, pool.misses) == (0, 1)
+
+
+def test_close_revokes_unused_links():
+    utils = FakeTelegramUtils()
+
+    async def run():
+        pool = InviteLinkPool(utils, size=3, create_interval=0)
+        await pool.start()
+        await settle(lambda: len(pool) == 3)
+        handed_out = await pool.acquire("Ref-1")
+        await pool.close()
+        return pool, handed_out
+
+    pool, handed_out = asyncio.run(run())
+    assert len(pool) == 0
+    assert handed_out not in utils.revoked
+    assert len(utils.revoked) == utils.created - 1
+
+
+def test_channel_link_fallback_is_not_pooled():
+    utils = FakeTelegramUtils(failing=True)
+
+    async def run():
+        pool = InviteLinkPool(utils, size=2, create_interval=0)
+        await pool.start()
+        for _ in range(20):
+            await asyncio.sleep(0)
+        size = len(pool)
+        await pool.close()
+        return size
+
+    assert asyncio.run(run()) == 0
@@ -0,0 +1,45 @@
+import asyncio
+
+from telegramreferralpro.membership import MembershipCache
+
+
+class FakeTelegramUtils:
+    """Answers get_channel_membership from a dict and counts the calls"""
+
+    def __init__(self, members):
+        self.members = members
+        self.calls = 0
+
+    async def get_channel_membership(self, user_id):
+        self.calls += 1
+        return self.members.get(user_id)
+
+
+def test_api_answer_is_cached_until_the_ttl(clock):
+    utils = FakeTelegramUtils({1: True})
+    cache = MembershipCache(utils, check_ttl=60)
+    assert asyncio.run(cache.is_member(1))
+    assert asyncio.run(cache.is_member(1))
+    assert utils.calls == 1
+    clock.advance(61)
+    assert asyncio.run(cache.is_member(1))
+    assert utils.calls == 2
+
+
+def test_recorded_events_override_the_api(clock):
+    utils = FakeTelegramUtils({1: True})
+    cache = MembershipCache(utils, check_ttl=60)
+    assert asyncio.run(cache.is_member(1))
+    cache.record(1, False)
+    clock.advance(3600)  # observed events do not expire
+    assert not asyncio.run(cache.is_member(1))
+    assert utils.calls == 1
+
+
+def test_failed_lookups_are_not_cached():
+    utils = FakeTelegramUtils({})  # None: the API call failed
+    cache = MembershipCache(utils)
+    assert not asyncio.run(cache.is_member(1))
+    utils.members[1] = True
+    assert asyncio.run(cache.is_member(1))
+    assert utils.calls == 2
@@ -0,0 +1,61 @@
+import asyncio
+
+from telegramreferralpro.progress_events import ProgressEventBus
+from telegramreferralpro.referral_system import ReferralProgress
+
+
+class Counts:
+    """load() for the bus, answering from a dict of active referral counts"""
+
+    def __init__(self, counts):
+        self.counts = counts
+        self.loads = []
+
+    async def load(self, user_ids):
+        self.loads.append(sorted(user_ids))
+        return {user_id: ReferralProgress(self.counts[user_id], self.counts[user_id], 5) for user_id in user_ids}
+
+
+def test_published_changes_are_delivered_once():
+    counts = Counts({1: 0})
+
+    async def run():
+        bus = ProgressEventBus(counts.load, poll_interval=60)
+        bus.start()
+        subscription = await bus.subscribe(1)
+        assert (await subscription.next(timeout=1)).active_referrals == 0
+        counts.counts[1] = 1
+        bus.publish(1)
+        bus.publish(1)
+        assert (await subscription.next(timeout=1)).active_referrals == 1
+        assert await subscription.next(timeout=0.05) is None
+        await bus.close()
+
+    asyncio.run(run())
+
+
+def test_polling_continues_while_publish_keeps_waking_the_bus():
+    counts = Counts({1: 0, 2: 0})
+
+    async def run():
+        bus = ProgressEventBus(counts.load, poll_interval=0.05)
+        bus.start()
+        busy = await bus.subscribe(1)
+        quiet = await bus.subscribe(2)
+        await quiet.next(timeout=1)
+        counts.counts[2] = 1  # changed by another process, so never published here
+
+        async def keep_publishing():
+            while True:
+                bus.publish(1)
+                await asyncio.sleep(0.01)
+
+        publisher = asyncio.create_task(keep_publishing())
+        try:
+            progress = await quiet.next(timeout=1)
+        finally:
+            publisher.cancel()
+            await bus.close()
+        return progress
+
+    assert asyncio.run(run()).active_referrals == 1
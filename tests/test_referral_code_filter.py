@@ -0,0 +1,57 @@
+from telegramreferralpro.bloom import BloomFilter
+from telegramreferralpro.referral_codes import ReferralCodec
+
+from conftest import seed_referrer
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f"ref_{i:012x}")
+    assert all(f"ref_{i:012x}" in bloom for i in range(1000))
+    false_positives = sum(f"other_{i}" in bloom for i in range(10000))
+    assert false_positives < 10000 * 0.01 * 3
+
+
+def test_unknown_codes_are_rejected_without_a_query(make_database, client):
+    seed_referrer(client, 1, [])
+    database = make_database(referral_code_filter_capacity=100)
+    assert database.preload_referral_codes() == 1
+    requests = client.requests
+    assert database.get_user_by_referral_code("ref_ffffffffffff") is None
+    assert client.requests == requests
+    assert database.get_user_by_referral_code(f"ref_{1:012x}")["user_id"] == 1
+
+
+def test_codes_issued_elsewhere_are_found_after_a_refresh(make_database, client):
+    seed_referrer(client, 1, [2, 3])
+    database = make_database(referral_code_filter_capacity=100)
+    database.preload_referral_codes()
+
+    seed_referrer(client, 5, [])  # issued by another process
+    assert database.get_user_by_referral_code(f"ref_{5:012x}") is None
+    assert database.refresh_referral_codes() == 1
+    assert database.get_user_by_referral_code(f"ref_{5:012x}")["user_id"] == 5
+
+    # A row whose id was assigned before that refresh but committed after it
+    seed_referrer(client, 4, [])
+    database.refresh_referral_codes()
+    assert database.get_user_by_referral_code(f"ref_{4:012x}")["user_id"] == 4
+
+
+def test_refresh_preloads_when_the_preload_failed(make_database, client):
+    seed_referrer(client, 1, [])
+    database = make_database(referral_code_filter_capacity=100)
+    assert database.refresh_referral_codes() == 1
+    assert database.get_user_by_referral_code("ref_ffffffffffff") is None
+    assert database.rejected_referral_codes == 1
+
+
+def test_signed_codes_are_checked_against_their_hmac(make_database, client):
+    codec = ReferralCodec(b"secret")
+    client.seed("users", [{"id": 1, "user_id": 7, "referral_code": codec.encode(7)}])
+    database = make_database(referral_codec=codec)  # no filter loaded
+    requests = client.requests
+    assert database.get_user_by_referral_code(codec.encode(8)[:-1] + "x") is None
+    assert client.requests == requests
+    assert database.get_user_by_referral_code(codec.encode(7))["user_id"] == 7
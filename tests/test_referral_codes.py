@@ -0,0 +1,47 @@
+from telegramreferralpro.memory_database import MemoryDatabase
+from telegramreferralpro.referral_codes import ReferralCodec, is_issued_format, is_signed_code
+from telegramreferralpro.referral_system import ReferralSystem
+
+SECRET = b"test-secret"
+
+
+def test_signed_code_decodes_to_its_owner():
+    codec = ReferralCodec(SECRET)
+    code = codec.encode(123456789)
+    assert is_signed_code(code)
+    assert codec.decode(code) == 123456789
+
+
+def test_forged_codes_are_rejected():
+    codec = ReferralCodec(SECRET)
+    code = codec.encode(42)
+    owner, tag = code.split("-")
+    other_owner = codec.encode(43).split("-")[0]
+    assert codec.decode(f"{other_owner}-{tag}") is None
+    assert codec.decode(f"{owner}-{'A' * len(tag)}") is None
+    assert ReferralCodec(b"another-secret").decode(code) is None
+    assert codec.decode("ref_0123456789ab") is None
+    assert codec.decode("") is None
+
+
+def test_issued_formats():
+    assert is_issued_format(ReferralCodec(SECRET).encode(1))
+    assert is_issued_format("ref_0123456789ab")
+    assert not is_issued_format("user_1_abcdef")
+    assert not is_issued_format("ref_nothex")
+    assert not is_issued_format(None)
+
+
+def test_process_referral_rejects_forged_code_without_a_lookup():
+    database = MemoryDatabase()
+    codec = ReferralCodec(SECRET)
+    referral_system = ReferralSystem(database, codec=codec)
+    database.add_user(1, referral_code=codec.encode(1))
+    lookups = []
+    database.get_user_by_referral_code = lambda code: lookups.append(code)
+    database.record_referral = lambda *args, **kwargs: lookups.append(args)
+
+    owner = codec.encode(1).split("-")[0]
+    assert referral_system.process_referral(f"{owner}-AAAAAAAA", 2) == (False, "Invalid referral code")
+    assert referral_system.process_referral(codec.encode(2), 2) == (False, "You cannot refer yourself")
+    assert lookups == []
@@ -0,0 +1,104 @@
+import asyncio
+
+from telegramreferralpro.cache import CacheSettings
+from telegramreferralpro.referral_store import ReferralStore
+from telegramreferralpro.write_behind import WriteBehindQueue
+
+from conftest import seed_referrer
+
+
+def load(store, referrer_user_id, active, total):
+    assert store.finish_load(referrer_user_id, store.begin_load(referrer_user_id), (active, total))
+
+
+def test_add_and_deactivate_adjust_loaded_counts():
+    store = ReferralStore(CacheSettings(max_entries=10))
+    load(store, 1, active=3, total=4)
+    store.add(1, 50)
+    assert store.stats(1) == (4, 5)
+    assert store.deactivate(1, 50)
+    assert store.stats(1) == (3, 5)
+    store.add(1, 50)  # re-activation is not a new referral
+    assert store.stats(1) == (4, 5)
+
+
+def test_add_ignores_referrers_that_are_not_loaded():
+    store = ReferralStore(CacheSettings(max_entries=10))
+    store.add(1, 50)
+    assert store.stats(1) is None
+    assert not store.is_loaded(1)
+
+
+def test_deactivating_an_edge_from_before_the_load_forces_a_reload():
+    store = ReferralStore(CacheSettings(max_entries=10))
+    load(store, 1, active=3, total=3)
+    assert not store.deactivate(1, 50)
+    assert store.stats(1) is None
+
+
+def test_counts_after_eviction_come_from_storage(make_database, client):
+    seed_referrer(client, 100, range(101, 106))
+    database = make_database(max_entries=2)
+    assert database.get_referral_stats(100) == (5, 5)
+    database.get_referral_stats(200)
+    database.get_referral_stats(300)  # evicts referrer 100
+    assert not database._referrals.is_loaded(100)
+
+    client.seed("users", [{"id": 106, "user_id": 106, "referral_code": "ref_00000000006a"}])
+    database.add_referral(100, 106)
+    assert database.get_referral_stats(100) == (6, 6)
+
+
+def test_counts_after_ttl_expiry_with_write_behind(make_database, client, clock):
+    seed_referrer(client, 100, range(101, 106))
+    client.seed("users", [{"id": 106, "user_id": 106, "referral_code": "ref_00000000006a"}])
+    database = make_database(ttl=60)
+    queue = WriteBehindQueue(client)
+    database.enable_write_behind(queue)
+
+    # Expired before the referral: counts are reloaded, then the queued row is added to them
+    assert database.get_referral_stats(100) == (5, 5)
+    clock.advance(61)
+    database.add_referral(100, 106)
+    assert database.get_referral_stats(100) == (6, 6)
+
+    asyncio.run(queue.flush())
+    clock.advance(61)
+    assert database.get_referral_stats(100) == (6, 6)
+
+
+def test_counts_read_before_a_concurrent_referral_are_not_cached():
+    store = ReferralStore(CacheSettings(max_entries=10))
+    generation = store.begin_load(1)
+    store.add(1, 50)  # recorded while the read was in flight
+    assert not store.finish_load(1, generation, (5, 5))
+    assert store.stats(1) is None
+
+
+def test_referral_recorded_during_a_stats_read_is_counted(make_database, client):
+    seed_referrer(client, 100, range(101, 106))
+    client.seed("users", [{"id": 106, "user_id": 106, "referral_code": "ref_00000000006a"}])
+    database = make_database()
+    count_referrals = database._count_referrals
+
+    def racing_count(user_id):
+        counts = count_referrals(user_id)
+        database._count_referrals = count_referrals
+        database.add_referral(100, 106)  # another handler, between the read and the cache fill
+        return counts
+
+    database._count_referrals = racing_count
+    assert database.get_referral_stats(100) == (5, 5)
+    assert database.get_referral_stats(100) == (6, 6)
+
+
+def test_flushed_referrals_reload_counts(make_database, client):
+    seed_referrer(client, 100, range(101, 106))
+    client.seed("users", [{"id": 106, "user_id": 106, "referral_code": "ref_00000000006a"}])
+    database = make_database()
+    queue = WriteBehindQueue(client)
+    database.enable_write_behind(queue)
+    database.add_referral(100, 106)
+    asyncio.run(queue.flush())
+    assert not database._referrals.is_loaded(100)
+    assert database.get_referral_stats(100) == (6, 6)
@@ -0,0 +1,38 @@
+import asyncio
+
+from telegramreferralpro.memory_database import MemoryDatabase
+from telegramreferralpro.referral_system import ReferralSystem
+from telegramreferralpro.write_behind import WriteBehindQueue
+
+from conftest import seed_referrer
+
+
+def test_referral_keeps_the_profile_when_write_behind_is_on(make_database, client):
+    seed_referrer(client, 100, [])
+    database = make_database()
+    queue = WriteBehindQueue(client)
+    database.enable_write_behind(queue)
+    referral_system = ReferralSystem(database)
+
+    # /start: the users row is still queued when the referral RPC creates it
+    database.add_user(7, username="bob", first_name="Bob", last_name="B",
+                      referral_code=referral_system.generate_referral_code(7))
+    success, _ = referral_system.process_referral(f"ref_{100:012x}", 7, "bob", "Bob", "B")
+    asyncio.run(queue.flush())
+
+    assert success
+    [row] = [row for row in client.rows("users") if row["user_id"] == 7]
+    assert (row["username"], row["first_name"], row["last_name"]) == ("bob", "Bob", "B")
+    assert row["referred_by_user_id"] == 100
+
+
+def test_referral_counts_towards_progress():
+    database = MemoryDatabase(settings={"referral_target": "2"})
+    referral_system = ReferralSystem(database)
+    database.add_user(1, referral_code="ref_000000000001")
+    assert referral_system.process_referral("ref_000000000001", 2)[0]
+    assert not referral_system.process_referral("ref_000000000001", 2)[0]
+
+    progress = referral_system.get_referral_progress(1)
+    assert progress["active_referrals"] == 1
+    assert progress["remaining"] == 1
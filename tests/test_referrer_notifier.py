@@ -0,0 +1,58 @@
+import asyncio
+
+from telegramreferralpro.async_database import AsyncDatabase
+from telegramreferralpro.memory_database import MemoryDatabase
+from telegramreferralpro.messages import Messages
+from telegramreferralpro.referral_system import ReferralSystem
+from telegramreferralpro.referrer_notifier import ReferrerNotifier
+from telegramreferralpro.send_scheduler import PRIORITY_NOTIFICATION
+
+
+class FakeTelegramUtils:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message_safe(self, user_id, text, priority=None, **kwargs):
+        self.sent.append((user_id, text, priority))
+        return True
+
+
+def notify(events, referrals, target=5, window=0.01, close_early=False):
+    """Record events for referrer 1, who has the given number of referrals, and return what was sent"""
+    database = MemoryDatabase(settings={"referral_target": str(target)})
+    database.add_user(1, referral_code="ref_000000000001")
+    referral_system = ReferralSystem(database)
+    for referred in range(2, 2 + referrals):
+        referral_system.process_referral("ref_000000000001", referred)
+    utils = FakeTelegramUtils()
+
+    async def run():
+        async_database = AsyncDatabase(database)
+        notifier = ReferrerNotifier(async_database, referral_system, utils, window=window)
+        for event in events:
+            getattr(notifier, event)(1)
+        if not close_early:
+            await asyncio.sleep(window * 5)
+        await notifier.close()
+        await async_database.close()
+
+    asyncio.run(run())
+    return utils.sent
+
+
+def test_events_in_one_window_make_one_digest():
+    [(user_id, text, priority)] = notify(["joined", "joined", "left"], referrals=3)
+    assert (user_id, priority) == (1, PRIORITY_NOTIFICATION)
+    assert "2 people joined" in text
+    assert "One of your referrals left" in text
+    assert "3/5" in text
+
+
+def test_reaching_the_target_sends_the_reward_message():
+    [(_, text, _)] = notify(["joined"], referrals=2, target=2)
+    assert text == Messages().REWARD_AVAILABLE
+
+
+def test_close_sends_buffered_digests():
+    sent = notify(["joined"], referrals=1, window=60, close_early=True)
+    assert len(sent) == 1
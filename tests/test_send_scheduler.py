@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+from telegram.error import RetryAfter
+
+from telegramreferralpro.send_scheduler import PRIORITY_INTERACTIVE, PRIORITY_NOTIFICATION, SendScheduler
+
+
+def send(scheduler, callback, chat_id, priority=PRIORITY_INTERACTIVE, endpoint="sendMessage"):
+    return scheduler.process_request(callback, (), {}, endpoint, {"chat_id": chat_id}, priority)
+
+
+def test_interactive_replies_go_before_queued_notifications():
+    async def run():
+        scheduler = SendScheduler(private_chat_interval=0.01)
+        await scheduler.initialize()
+        order = []
+        flood = [RetryAfter(0.05)]
+
+        async def first():
+            order.append("first")
+            if flood:
+                raise flood.pop()
+            return True
+
+        def message(name):
+            async def callback():
+                order.append(name)
+                return True
+            return callback
+
+        first_sent = asyncio.ensure_future(send(scheduler, first, 1))
+        await asyncio.sleep(0.01)  # sending is now paused by the flood wait
+        notification = asyncio.ensure_future(send(scheduler, message("notification"), 2, PRIORITY_NOTIFICATION))
+        await asyncio.sleep(0)
+        reply = asyncio.ensure_future(send(scheduler, message("reply"), 3))
+        await asyncio.gather(first_sent, notification, reply)
+        await scheduler.shutdown()
+        return order
+
+    order = asyncio.run(run())
+    assert order.index("reply") < order.index("notification")
+
+
+def test_retry_after_pauses_and_requeues_the_message():
+    async def run():
+        scheduler = SendScheduler()
+        await scheduler.initialize()
+        calls = []
+
+        async def callback():
+            calls.append(asyncio.get_running_loop().time())
+            if len(calls) == 1:
+                raise RetryAfter(0.05)
+            return "sent"
+
+        result = await send(scheduler, callback, 1)
+        await scheduler.shutdown()
+        return result, calls
+
+    result, calls = asyncio.run(run())
+    assert result == "sent"
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.05
+
+
+def test_retry_after_is_raised_once_retries_run_out():
+    async def run():
+        scheduler = SendScheduler(max_retries=1)
+        await scheduler.initialize()
+        calls = []
+
+        async def callback():
+            calls.append(1)
+            raise RetryAfter(0.01)
+
+        try:
+            with pytest.raises(RetryAfter):
+                await send(scheduler, callback, 1)
+        finally:
+            await scheduler.shutdown()
+        return calls
+
+    assert len(asyncio.run(run())) == 2
+
+
+def test_other_requests_are_not_queued():
+    async def run():
+        scheduler = SendScheduler()
+        await scheduler.initialize()
+
+        async def callback():
+            return "chat"
+
+        result = await send(scheduler, callback, 1, endpoint="getChat")
+        await scheduler.shutdown()
+        return result, scheduler._queue.qsize()
+
+    assert asyncio.run(run()) == ("chat", 0)
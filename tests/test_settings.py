@@ -0,0 +1,23 @@
+from telegramreferralpro import database as database_module
+from telegramreferralpro.database import SETTINGS_VERSION_CHECK_INTERVAL, SETTINGS_VERSION_KEY
+
+
+def set_setting(client, key, value):
+    # What the settings trigger leaves behind: the changed row plus a new version
+    client.table("settings").upsert({"key": key, "value": value}, on_conflict="key").execute()
+    client.table("settings").upsert({"key": SETTINGS_VERSION_KEY, "value": str(client.requests)},
+                                    on_conflict="key").execute()
+
+
+def test_settings_version_change_drops_cached_target(make_database, client, clock, monkeypatch):
+    monkeypatch.setattr(database_module, "time", clock)
+    client.seed("settings", [{"key": "active_referral_target_id", "value": "1"},
+                             {"key": SETTINGS_VERSION_KEY, "value": "1"}])
+    database = make_database()
+    assert database.watch_settings_changes()
+    assert database.get_setting("active_referral_target_id") == "1"
+
+    set_setting(client, "active_referral_target_id", "2")
+    assert database.get_setting("active_referral_target_id") == "1"  # not checked again yet
+    clock.advance(SETTINGS_VERSION_CHECK_INTERVAL)
+    assert database.get_setting("active_referral_target_id") == "2"
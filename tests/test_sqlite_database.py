@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from telegramreferralpro.sqlite_database import SQLiteDatabase
+from telegramreferralpro.storage import (REFERRAL_ALREADY_REFERRED, REFERRAL_INVALID_CODE, REFERRAL_RECORDED,
+                                         REFERRAL_SELF)
+
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    return str(tmp_path / "data" / "bot.db")
+
+
+@pytest.fixture
+def database(sqlite_path):
+    database = SQLiteDatabase(sqlite_path)
+    yield database
+    database.close()
+
+
+def test_readding_a_user_keeps_code_and_state(database):
+    database.add_user(1, username="one")
+    code = database.get_user(1)["referral_code"]
+    database.mark_reward_claimed(1)
+    database.add_user(1, username="renamed")
+    user = database.get_user(1)
+    assert (user["username"], user["referral_code"], user["reward_claimed"]) == ("renamed", code, True)
+
+
+def test_record_referral_outcomes(database):
+    database.add_user(1)
+    code = database.get_user(1)["referral_code"]
+    assert database.record_referral("missing", 2)[0] == REFERRAL_INVALID_CODE
+    assert database.record_referral(code, 1)[0] == REFERRAL_SELF
+    status, referrer = database.record_referral(code, 2, username="two")
+    assert (status, referrer["user_id"]) == (REFERRAL_RECORDED, 1)
+    assert database.record_referral(code, 2)[0] == REFERRAL_ALREADY_REFERRED
+    assert database.get_user(2)["referred_by"] == 1
+    assert database.get_referral_stats(1) == (1, 1)
+
+
+def test_stats_for_many_users_and_codes(database):
+    for user_id in (1, 2, 3):
+        database.add_user(user_id)
+    database.add_referral(1, 2)
+    database.add_referral(1, 3)
+    database.deactivate_referral(1, 3)
+    code = database.get_user(1)["referral_code"]
+    stats, owners = database.get_referral_stats_many([2], [code, "unknown"])
+    assert owners == {code: 1}
+    assert stats == {2: (0, 0), 1: (1, 2)}
+
+
+def test_concurrent_writes_all_commit(database):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert all(pool.map(lambda user_id: database.add_user(user_id), range(1, 101)))
+    assert database.get_all_users_count() == 100
+
+
+def test_a_failing_write_does_not_roll_back_its_batch(database):
+    database.add_user(1, referral_code="taken")
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda user_id: database.add_user(user_id, referral_code="taken" if user_id == 3 else None),
+                                range(2, 6)))
+    assert results == [True, False, True, True]
+    assert database.get_all_users_count() == 4
+
+
+def test_data_survives_a_reopen(sqlite_path):
+    database = SQLiteDatabase(sqlite_path)
+    database.add_user(1)
+    database.set_user_language(1, "de")
+    database.close()
+
+    reopened = SQLiteDatabase(sqlite_path)
+    try:
+        assert reopened.get_user(1)["user_id"] == 1
+        assert reopened.get_user_language(1) == "de"
+    finally:
+        reopened.close()
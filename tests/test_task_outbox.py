@@ -0,0 +1,92 @@
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+
+from telegramreferralpro import task_outbox
+from telegramreferralpro.task_outbox import TaskUpdateOutbox
+
+CONFIG = SimpleNamespace(supabase_webhook_url="http://localhost/task-update", supabase_webhook_secret="secret")
+
+
+@pytest.fixture
+def responses(monkeypatch):
+    """Answers for successive POSTs (HTTP statuses or exceptions); the payloads sent are recorded"""
+    answers = []
+    sent = []
+
+    async def post_task_updates(session, config, payload):
+        sent.append(payload)
+        answer = answers.pop(0) if answers else 200
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    monkeypatch.setattr(task_outbox, "post_task_updates", post_task_updates)
+    return SimpleNamespace(answers=answers, sent=sent)
+
+
+def deliver(tmp_path, *updates, batch_size=1, polls=200):
+    """Enqueue updates, wait until none are pending and return the outbox stats"""
+    async def run():
+        outbox = TaskUpdateOutbox(CONFIG, path=str(tmp_path / "outbox.db"), batch_size=batch_size, retry_backoff=0.01)
+        await outbox.start(session=None)
+        for update in updates:
+            await outbox.enqueue(*update)
+        for _ in range(polls):
+            if not outbox.stats()["pending"]:
+                break
+            await asyncio.sleep(0.01)
+        stats = outbox.stats()
+        await outbox.close()
+        return stats
+    return asyncio.run(run())
+
+
+def make_due(tmp_path):
+    """Make every stored update due now, however far failed attempts pushed it out"""
+    conn = sqlite3.connect(tmp_path / "outbox.db")
+    with conn:
+        conn.execute("UPDATE task_updates SET next_attempt_at = 0")
+    conn.close()
+
+
+@pytest.mark.parametrize("failure", [503, 429, 408, aiohttp.ClientConnectionError("refused"), asyncio.TimeoutError()])
+def test_transient_failures_are_retried(tmp_path, responses, failure):
+    responses.answers.extend([failure, failure])
+    stats = deliver(tmp_path, (1, "tg_referral_5", "completed", {"referrals": 5}))
+    assert stats == {"pending": 0, "delivered": 1, "dropped": 0}
+    assert len(responses.sent) == 3
+
+
+@pytest.mark.parametrize("status", [400, 401, 422])
+def test_rejected_updates_are_dropped(tmp_path, responses, status):
+    responses.answers.append(status)
+    stats = deliver(tmp_path, (1, "tg_referral_5", "completed", {}))
+    assert stats == {"pending": 0, "delivered": 0, "dropped": 1}
+    assert len(responses.sent) == 1
+
+
+def test_updates_are_sent_as_one_batch(tmp_path, responses):
+    # Stored while delivery fails, so they are all due together on the next start
+    responses.answers.extend([503] * 1000)
+    deliver(tmp_path, *((user_id, "tg_referral_5", "completed", {}) for user_id in (1, 2, 3)), polls=0)
+    make_due(tmp_path)
+    responses.answers.clear()
+    responses.sent.clear()
+    stats = deliver(tmp_path, batch_size=10)
+    assert stats["delivered"] == 3
+    assert [[body["telegramId"] for body in payload] for payload in responses.sent] == [[1, 2, 3]]
+
+
+def test_pending_updates_survive_a_restart(tmp_path, responses):
+    responses.answers.extend([503] * 1000)
+    stats = deliver(tmp_path, (1, "tg_referral_5", "completed", {}), polls=10)
+    assert stats["pending"] == 1
+
+    make_due(tmp_path)
+    responses.answers.clear()
+    stats = deliver(tmp_path)
+    assert stats == {"pending": 0, "delivered": 1, "dropped": 0}
@@ -0,0 +1,186 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from telegramreferralpro.fake_postgrest import FakeAPIError
+from telegramreferralpro.write_behind import WriteBehindQueue
+
+
+class FlakyClient:
+    """Delegates to the fake client, failing while down or for rows that match ``poison``"""
+
+    def __init__(self, client, poison=None):
+        self.client = client
+        self.down = False
+        self.poison = poison
+
+    def table(self, name):
+        if self.down:
+            raise ConnectionError("Supabase unavailable")
+        return _FlakyQuery(self, self.client.table(name), name)
+
+
+class _FlakyQuery:
+    def __init__(self, flaky, query, name):
+        self._flaky = flaky
+        self._query = query
+        self._name = name
+
+    def __getattr__(self, attr):
+        method = getattr(self._query, attr)
+
+        def call(*args, **kwargs):
+            if attr in ("insert", "upsert"):
+                rows = args[0] if isinstance(args[0], list) else [args[0]]
+                if self._flaky.poison and any(self._flaky.poison(row) for row in rows):
+                    raise ValueError("row rejected")
+            result = method(*args, **kwargs)
+            return _FlakyQuery(self._flaky, result, self._name) if attr != "execute" else result
+        return call
+
+
+def flush(queue, times=1):
+    async def run():
+        for _ in range(times):
+            await queue.flush(include_delayed=True)
+    asyncio.run(run())
+
+
+def user_row(user_id):
+    return {"user_id": user_id, "referral_code": f"ref_{user_id:012x}"}
+
+
+@pytest.fixture
+def queue(make_database, client):
+    database = make_database()
+    queue = WriteBehindQueue(client, max_retries=2, retry_backoff=0)
+    database.enable_write_behind(queue)
+    return queue
+
+
+def test_users_are_written_before_referrals_that_need_them(queue, client):
+    queue.enqueue("referrals", {"referrer_user_id": 1, "referred_user_id": 2, "is_active": True})
+    queue.enqueue("users", user_row(1))
+    queue.enqueue("users", user_row(2))
+    flush(queue)
+    assert queue.pending_count() == 0
+    assert len(client.rows("referrals")) == 1
+
+
+def test_failed_batches_are_retried_and_never_dropped(make_database, client):
+    flaky = FlakyClient(client)
+    queue = WriteBehindQueue(flaky, max_retries=2, retry_backoff=0)
+    make_database().enable_write_behind(queue)
+    flaky.down = True
+    queue.enqueue("users", user_row(1))
+    flush(queue, times=6)
+    assert queue.pending_count() == 1
+
+    flaky.down = False
+    flush(queue)
+    assert queue.pending_count() == 0
+    assert [row["user_id"] for row in client.rows("users")] == [1]
+
+
+def test_retry_backoff_is_capped(client, monkeypatch):
+    from telegramreferralpro import write_behind
+    queue = WriteBehindQueue(client, retry_backoff=1.0)
+    monkeypatch.setattr(write_behind, "time", SimpleNamespace(monotonic=lambda: 0.0))
+    queue._schedule_retry("users", [user_row(1)], 40, 0, 40)
+    assert queue._retries[0][0] == write_behind.MAX_RETRY_DELAY
+
+
+def test_one_bad_row_does_not_hold_back_its_batch(make_database, client):
+    flaky = FlakyClient(client, poison=lambda row: row.get("user_id") == 3)
+    queue = WriteBehindQueue(flaky, max_retries=2, retry_backoff=0)
+    make_database().enable_write_behind(queue)
+    for user_id in range(1, 9):
+        queue.enqueue("users", user_row(user_id))
+    flush(queue, times=12)
+    assert sorted(row["user_id"] for row in client.rows("users")) == [1, 2, 4, 5, 6, 7, 8]
+    assert queue.pending_count() == 1
+
+
+def test_rows_waiting_for_their_users_are_not_dropped(queue, client):
+    queue.enqueue("users", user_row(1))
+    queue.enqueue("referrals", {"referrer_user_id": 1, "referred_user_id": 2, "is_active": True})
+    flush(queue, times=queue.max_retries * 3)
+    assert queue.pending_count() == 1
+    assert client.rows("referrals") == []
+
+    queue.enqueue("users", user_row(2))
+    flush(queue)
+    assert queue.pending_count() == 0
+    assert len(client.rows("referrals")) == 1
+
+
+def test_duplicate_referral_does_not_fail_the_batch(queue, client):
+    client.seed("users", [{"id": i, **user_row(i)} for i in (1, 2, 3)])
+    client.seed("referrals", [{"referrer_id": 1, "referred_id": 2, "is_active": True}])
+    queue.enqueue("referrals", {"referrer_user_id": 1, "referred_user_id": 2, "is_active": True})
+    queue.enqueue("referrals", {"referrer_user_id": 1, "referred_user_id": 3, "is_active": True})
+    flush(queue)
+    assert queue.pending_count() == 0
+    assert sorted(row["referred_id"] for row in client.rows("referrals")) == [2, 3]
+
+
+def test_rows_unwritten_at_close_are_spilled_and_reloaded(client, tmp_path):
+    spill_path = str(tmp_path / "spill.jsonl")
+    flaky = FlakyClient(client)
+    queue = WriteBehindQueue(flaky, retry_backoff=0, spill_path=spill_path)
+    queue.register("users", on_conflict="user_id")
+    flaky.down = True
+    queue.enqueue("users", user_row(1))
+    asyncio.run(queue.close())
+    assert queue.pending_count() == 0
+
+    restarted = WriteBehindQueue(client, spill_path=spill_path)
+    restarted.register("users", on_conflict="user_id")
+
+    async def run():
+        await restarted.start()
+        await restarted.close()
+    asyncio.run(run())
+    assert [row["user_id"] for row in client.rows("users")] == [1]
+    assert not (tmp_path / "spill.jsonl").exists()
+
+
+def test_updates_before_the_user_is_flushed_are_not_lost(make_database, client):
+    database = make_database()
+    queue = WriteBehindQueue(client)
+    database.enable_write_behind(queue)
+    database.add_user(5, username="five")
+    database.update_channel_membership(5, True)
+    database.mark_reward_claimed(5)
+    flush(queue)
+    [row] = client.rows("users")
+    assert (row["is_channel_member"], row["reward_claimed"]) == (True, True)
+
+    database.mark_reward_claimed(5)  # the row exists now, so this is a plain update
+    assert database._user_updates_after_insert == {}
+
+
+class NoUniqueIndexClient(FlakyClient):
+    """Rejects upserts on referred_id like Postgres does before the unique index exists"""
+
+    def table(self, name):
+        query = super().table(name)
+        if name == "referrals":
+            def upsert(rows, on_conflict=None, ignore_duplicates=False):
+                raise FakeAPIError("there is no unique or exclusion constraint matching the ON CONFLICT specification",
+                                   code="42P10")
+            query.upsert = upsert
+        return query
+
+
+def test_referrals_fall_back_to_inserts_without_the_unique_index(make_database, client):
+    queue = WriteBehindQueue(NoUniqueIndexClient(client), retry_backoff=0)
+    make_database().enable_write_behind(queue)
+    client.seed("users", [{"id": i, **user_row(i)} for i in (1, 2, 3)])
+    queue.enqueue("referrals", {"referrer_user_id": 1, "referred_user_id": 2, "is_active": True})
+    flush(queue)
+    queue.enqueue("referrals", {"referrer_user_id": 1, "referred_user_id": 3, "is_active": True})
+    flush(queue)
+    assert queue.pending_count() == 0
+    assert sorted(row["referred_id"] for row in client.rows("referrals")) == [2, 3]